@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+Adaptive polling interval learned from check history
+
+Polls often right after messages arrive and backs off gradually while a
+site is quiet. Hours of the day that usually bring messages (learned from
+the last few weeks of checks in the state store) stay close to the
+shortest interval, so quiet nights cost few Chrome launches without
+slowing detection when messages are likely.
+"""
+
+import logging
+import time
+
+from state_store import get_store
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+CONFIG = {
+    'MIN_INTERVAL': 120,     # seconds, right after a message or in busy hours
+    'MAX_INTERVAL': 3600,    # seconds, after a long quiet spell in a quiet hour
+    # Added to the interval per second since the last new message, so an
+    # hour without messages stretches the interval by 15 minutes
+    'QUIET_FACTOR': 0.25,
+    'RETRY_INTERVAL': 300,   # first retry after a failed check, doubled per failure
+    'LOOKBACK_DAYS': 28,     # history used for the hour-of-day activity pattern
+}
+
+def hourly_activity(rows, days):
+    """Return the share of days with new messages for each local hour (24 floats)
+
+    rows are (checked_at, success, new_count, latency_ms) tuples from
+    StateStore.recent_checks.
+    """
+    active = [set() for _ in range(24)]
+    for checked_at, _, new_count, _ in rows:
+        if new_count:
+            local = time.localtime(checked_at)
+            active[local.tm_hour].add((local.tm_year, local.tm_yday))
+    return [len(day_set) / days for day_set in active]
+
+def next_interval(endpoint, now=None, store=None):
+    """Seconds to wait before the next check of an endpoint
+
+    After failures: RETRY_INTERVAL doubled per consecutive failure. Otherwise
+    MIN_INTERVAL plus QUIET_FACTOR times the time since the last new
+    message, pulled back towards MIN_INTERVAL by how often this hour of the
+    day has had messages, and kept between MIN_INTERVAL and MAX_INTERVAL.
+    """
+    now = now or time.time()
+    days = CONFIG['LOOKBACK_DAYS']
+    try:
+        rows = (store or get_store()).recent_checks(endpoint, now - days * 86400)
+    except Exception as e:
+        logger.warning(f"Could not read check history, using the longest interval: {e}")
+        return CONFIG['MAX_INTERVAL']
+
+    failures = 0
+    for _, success, _, _ in reversed(rows):
+        if success:
+            break
+        failures += 1
+    if failures:
+        return min(CONFIG['RETRY_INTERVAL'] * 2 ** (failures - 1), CONFIG['MAX_INTERVAL'])
+
+    last_new = next((row[0] for row in reversed(rows) if row[2]), None)
+    quiet_for = now - last_new if last_new is not None else days * 86400
+    interval = CONFIG['MIN_INTERVAL'] + CONFIG['QUIET_FACTOR'] * quiet_for
+    interval = min(max(interval, CONFIG['MIN_INTERVAL']), CONFIG['MAX_INTERVAL'])
+
+    # A young history has fewer days to spread its activity over
+    history_days = min(days, max(1.0, (now - rows[0][0]) / 86400)) if rows else days
+    activity = min(1.0, hourly_activity(rows, history_days)[time.localtime(now).tm_hour])
+    return CONFIG['MIN_INTERVAL'] + (interval - CONFIG['MIN_INTERVAL']) * (1 - activity)
+
+def is_due(endpoint, now=None, store=None):
+    """Check whether an endpoint's adaptive interval has passed since its last check"""
+    now = now or time.time()
+    try:
+        rows = (store or get_store()).recent_checks(endpoint, now - CONFIG['MAX_INTERVAL'])
+    except Exception as e:
+        logger.warning(f"Could not read check history, checking anyway: {e}")
+        return True
+    if not rows:
+        return True
+    return now - rows[-1][0] >= next_interval(endpoint, now, store)
@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+"""
+Incremental parser for the admin panel's message list
+
+Feeds the streamed page through html.parser one chunk at a time and
+yields a record per <div class="message"> as soon as it closes, so the
+page is never held in memory as one string.
+"""
+
+import re
+from collections import deque
+from html.parser import HTMLParser
+
+# Element class -> record field, for markup like <span class="email">
+FIELD_CLASSES = {
+    'name': 'name',
+    'email': 'email',
+    'time': 'timestamp',
+    'timestamp': 'timestamp',
+    'date': 'timestamp',
+    'message-body': 'message',
+    'message-text': 'message',
+    'body': 'message',
+    'content': 'message',
+    'text': 'message',
+}
+
+# "Label: value" lines, for markup like <strong>Email:</strong> a@b.c
+FIELD_LABELS = {
+    'name': 'name',
+    'from': 'name',
+    'email': 'email',
+    'time': 'timestamp',
+    'date': 'timestamp',
+    'received': 'timestamp',
+    'message': 'message',
+}
+
+_LABEL_RE = re.compile(r'^\s*([A-Za-z]+)\s*:\s*(.*)$')
+
+class MessageListParser(HTMLParser):
+    """Collects one dict per message block; completed records wait in .records"""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.records = deque()
+        self._depth = 0          # open <div>s inside the current message block
+        self._record = None
+        self._text = []
+        self._field = None       # (field, tag, nesting) being captured
+        self._field_text = []
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        classes = (attrs.get('class') or '').split()
+
+        if self._record is None:
+            if tag == 'div' and 'message' in classes:
+                self._record = {}
+                if attrs.get('data-id'):
+                    self._record['id'] = attrs['data-id']
+                self._depth = 1
+                self._text = []
+            return
+
+        if tag == 'div':
+            self._depth += 1
+        if tag in ('br', 'p', 'div', 'li', 'tr'):
+            self._text.append('\n')
+            if self._field is not None:
+                self._field_text.append('\n')
+
+        if self._field is None:
+            for cls in classes:
+                if cls in FIELD_CLASSES:
+                    self._field = [FIELD_CLASSES[cls], tag, 1]
+                    self._field_text = []
+                    # Keep captured fields off any "Label: value" line
+                    self._text.append('\n')
+                    break
+        elif tag == self._field[1]:
+            self._field[2] += 1
+
+    def handle_endtag(self, tag):
+        if self._record is None:
+            return
+
+        if self._field is not None and tag == self._field[1]:
+            self._field[2] -= 1
+            if self._field[2] == 0:
+                value = ''.join(self._field_text).strip()
+                self._record.setdefault(self._field[0], value)
+                self._field = None
+                self._text.append('\n')
+
+        if tag in ('p', 'div', 'li', 'tr'):
+            self._text.append('\n')
+        if tag == 'div':
+            self._depth -= 1
+            if self._depth == 0:
+                self._finish()
+
+    def handle_data(self, data):
+        if self._record is None:
+            return
+
+        self._text.append(data)
+        if self._field is not None:
+            self._field_text.append(data)
+
+    def _finish(self):
+        """Fill missing fields from 'Label: value' lines and queue the record"""
+        record = self._record
+        lines = ''.join(self._text).splitlines()
+        for i, line in enumerate(lines):
+            match = _LABEL_RE.match(line)
+            if not match:
+                continue
+            field = FIELD_LABELS.get(match.group(1).lower())
+            if field is None or field in record:
+                continue
+            value = match.group(2).strip()
+            if field == 'message':
+                # The body may run over several lines
+                value = '\n'.join([value] + lines[i + 1:]).strip()
+            record[field] = value
+
+        self.records.append(record)
+        self._record = None
+        self._text = []
+
+def iter_chunks(response, chunk_size=64 * 1024):
+    """Yield the decoded text of a streamed requests response, closing it when done"""
+    if response.encoding is None:
+        response.encoding = 'utf-8'
+    try:
+        yield from response.iter_content(chunk_size, decode_unicode=True)
+    finally:
+        response.close()
+
+def peek(chunks, limit=64 * 1024):
+    """Read up to `limit` characters ahead without losing them
+
+    Returns (prefix, chunks) where chunks still yields the whole page,
+    prefix included.
+    """
+    buffered = []
+    size = 0
+    for chunk in chunks:
+        buffered.append(chunk)
+        size += len(chunk)
+        if size >= limit:
+            break
+    prefix = ''.join(buffered)
+
+    def replay():
+        yield prefix
+        # yield from forwards close() to chunks, which closes the response
+        yield from chunks
+    return prefix, replay()
+
+def iter_messages(chunks):
+    """Yield message records from an iterable of page text chunks, in page order
+
+    Closing the generator early (e.g. on reaching a known message) also
+    closes chunks, which stops the download.
+    """
+    parser = MessageListParser()
+    try:
+        for chunk in chunks:
+            parser.feed(chunk)
+            while parser.records:
+                yield parser.records.popleft()
+        parser.close()
+        while parser.records:
+            yield parser.records.popleft()
+    finally:
+        if hasattr(chunks, 'close'):
+            chunks.close()
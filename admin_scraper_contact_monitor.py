@@ -4,19 +4,33 @@ Simple admin panel scraper - bypasses API WAF issues entirely
 Currently does not work for its original purpose.
 """
 
-import requests
-import re
+import json
+import os
 import time
 from datetime import datetime
 from items import EMAIL, PASSWORD, ADMIN_PASSWORD, ADMIN_URL
+from state_store import get_store
+from admin_parser import iter_chunks, iter_messages, peek
+from metrics import instrument_check, stage
+from archive import archive_messages
 
 # Configuration
 CONFIG = {
     'ADMIN_URL': ADMIN_URL,
     'ADMIN_PASSWORD': ADMIN_PASSWORD,  # Your admin panel password
-    'LAST_COUNT_FILE': 'last_message_count.txt',
+    'STATE_KEY': ADMIN_URL,  # endpoint name in the state store
     'CHECK_INTERVAL': 900,
+    # The admin page lists the newest message first, so parsing can stop
+    # at the first message that has already been seen
+    'NEWEST_FIRST': True,
     
+    # Authenticated cookies are cached here (owner read/write only) and
+    # reused until the server asks for a login again or they get too old
+    'SESSION_FILE': '.admin_session.json',
+    'SESSION_MAX_AGE': 86400,
+    
+    'SMTP_SERVER': 'smtp.gmail.com',
+    'SMTP_PORT': 587,
     'EMAIL_USER': EMAIL,
     'EMAIL_PASS': PASSWORD,
     'NOTIFY_EMAIL': EMAIL
@@ -24,6 +38,7 @@ CONFIG = {
 
 def create_session():
     """Create session with retry adapter"""
+    import requests
     from requests.adapters import HTTPAdapter
     from urllib3.util.retry import Retry
     
@@ -47,97 +62,168 @@ def create_session():
     
     return session
 
-def handle_waf_challenge(session, url):
-    """Handle the WAF JavaScript challenge by waiting and retrying"""
-    max_attempts = 3
-    
-    for attempt in range(max_attempts):
-        print(f"Attempt {attempt + 1} to access {url}")
-        
-        response = session.get(url, timeout=15, allow_redirects=True)
-        
-        if response.status_code == 200:
-            # Check if we got the JavaScript challenge
-            if 'requires Javascript' in response.text or 'aes.js' in response.text:
-                print("Got WAF challenge, waiting and retrying...")
-                time.sleep(5)  # Wait for potential redirect
-                continue
-            else:
-                # Successfully bypassed or no challenge
-                return response
-    
-    print("Could not bypass WAF challenge")
-    return None
-
-def login_to_admin(session):
-    """Login to admin panel"""
+def load_session_cookies(session):
+    """Load cached admin cookies into the session, returning True if any were usable"""
     try:
-        print("Accessing admin panel...")
-        response = handle_waf_challenge(session, CONFIG['ADMIN_URL'])
-        
-        if not response:
+        if time.time() - os.path.getmtime(CONFIG['SESSION_FILE']) > CONFIG['SESSION_MAX_AGE']:
+            print("Cached admin session is too old, logging in again")
             return False
-        
-        # Check if login form is present
-        if 'password' in response.text.lower() and 'login' in response.text.lower():
-            print("Submitting login...")
-            login_data = {'password': CONFIG['ADMIN_PASSWORD']}
-            response = session.post(CONFIG['ADMIN_URL'], data=login_data, timeout=15)
-            
-            if response.status_code == 200 and 'Contact Form Messages' in response.text:
-                print("Successfully logged in")
-                return True
-            else:
-                print("Login failed - check password")
-                return False
-        elif 'Contact Form Messages' in response.text:
-            print("Already logged in")
-            return True
-        else:
-            print("Unexpected admin page content")
-            return False
-            
-    except Exception as e:
-        print(f"Login error: {e}")
+        with open(CONFIG['SESSION_FILE'], 'r') as f:
+            cookies = json.load(f)
+    except (OSError, ValueError):
         return False
+    
+    now = time.time()
+    loaded = 0
+    for cookie in cookies:
+        if cookie.get('expires') and cookie['expires'] < now:
+            continue
+        session.cookies.set(cookie['name'], cookie['value'], domain=cookie['domain'],
+                            path=cookie['path'], secure=cookie['secure'], expires=cookie['expires'])
+        loaded += 1
+    return loaded > 0
 
-def get_message_count_from_admin(session):
-    """Get message count from admin panel"""
+def save_session_cookies(session):
+    """Cache the session's cookies in a file only the current user can read"""
+    cookies = [
+        {'name': c.name, 'value': c.value, 'domain': c.domain, 'path': c.path,
+         'secure': c.secure, 'expires': c.expires}
+        for c in session.cookies
+    ]
+    tmp_path = CONFIG['SESSION_FILE'] + '.tmp'
     try:
-        response = session.get(CONFIG['ADMIN_URL'], timeout=15)
-        
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, 'w') as f:
+            json.dump(cookies, f)
+        os.replace(tmp_path, CONFIG['SESSION_FILE'])
+        os.chmod(CONFIG['SESSION_FILE'], 0o600)
+    except OSError as e:
+        print(f"Could not cache admin session: {e}")
+
+def classify_page(text):
+    """Tell the WAF challenge, login form and message list apart from the start of a page"""
+    if 'requires Javascript' in text or 'aes.js' in text:
+        return 'challenge'
+    if 'Contact Form Messages' in text:
+        return 'admin'
+    if 'password' in text.lower() and 'login' in text.lower():
+        return 'login'
+    return 'unknown'
+
+def open_admin_page(session):
+    """Return the admin message list as streamed text chunks, logging in only if needed
+    
+    With a valid cached session this is one GET. Otherwise the login POST's
+    own response is used as the message list, and the new cookies are cached.
+    """
+    for attempt in range(3):
+        response = session.get(CONFIG['ADMIN_URL'], timeout=15, stream=True)
         if response.status_code != 200:
+            print(f"Admin panel returned HTTP {response.status_code}")
+            response.close()
             return None
         
-        # Look for "Total Messages: X"
-        match = re.search(r'Total Messages:\s*(\d+)', response.text)
-        if match:
-            return int(match.group(1))
+        prefix, chunks = peek(iter_chunks(response))
+        kind = classify_page(prefix)
+        if kind == 'admin':
+            print("Reusing cached admin session")
+            return chunks
+        response.close()
+        
+        if kind == 'challenge':
+            print("Got WAF challenge, waiting and retrying...")
+            time.sleep(5)  # Wait for potential redirect
+            continue
         
-        # Alternative: count message divs
-        message_count = response.text.count('<div class="message">')
-        if message_count >= 0:
-            return message_count
+        if kind == 'login':
+            print("Submitting login...")
+            login_data = {'password': CONFIG['ADMIN_PASSWORD']}
+            response = session.post(CONFIG['ADMIN_URL'], data=login_data, timeout=15, stream=True)
+            if response.status_code == 200:
+                prefix, chunks = peek(iter_chunks(response))
+                if classify_page(prefix) == 'admin':
+                    print("Successfully logged in")
+                    save_session_cookies(session)
+                    return chunks
+            response.close()
+            print("Login failed - check password")
+            return None
         
+        print("Unexpected admin page content")
         return None
+    
+    print("Could not bypass WAF challenge")
+    return None
+
+def get_new_messages_from_admin(session, store):
+    """Stream the admin page and return the messages not seen before
+    
+    Uses the cached admin session when it is still valid, so a normal
+    check is a single GET. Records are parsed as the page downloads, and
+    with NEWEST_FIRST the download stops at the first known message. On
+    the very first run every message is stored as already seen, so old
+    messages are not notified.
+    """
+    try:
+        with stage('admin_open') as span:
+            chunks = open_admin_page(session)
+            if chunks is None:
+                span.outcome = 'failed'
+                return None
+        
+        records = iter_messages(chunks)
+        try:
+            with stage('admin_parse'):
+                if not store.is_seeded(CONFIG['STATE_KEY']):
+                    seeded = 0
+                    batch = []
+                    for record in records:
+                        batch.append(record)
+                        if len(batch) >= 1000:
+                            store.mark_seen(CONFIG['STATE_KEY'], batch, notified=False)
+                            seeded += len(batch)
+                            batch = []
+                    store.mark_seen(CONFIG['STATE_KEY'], batch, notified=False)
+                    # Marked explicitly, an empty inbox on the first run must not
+                    # make the next run seed again and swallow its first message
+                    store.mark_seeded(CONFIG['STATE_KEY'])
+                    print(f"First run: recorded {seeded + len(batch)} existing messages as seen")
+                    return []
+            
+                new_messages = []
+                for record in records:
+                    if store.is_seen(CONFIG['STATE_KEY'], record):
+                        if CONFIG['NEWEST_FIRST']:
+                            break
+                        continue
+                    new_messages.append(record)
+                return new_messages
+        finally:
+            records.close()
     except Exception as e:
-        print(f"Error getting count: {e}")
+        print(f"Error getting messages: {e}")
         return None
 
-def send_email_notification(new_message_count):
+def send_email_notification(new_messages):
     """Send simple email notification"""
     try:
-        import smtplib
         from email.mime.text import MIMEText
+        from smtp_pool import get_manager
         
-        server = smtplib.SMTP('smtp.gmail.com', 587)
-        server.starttls()
-        server.login(CONFIG['EMAIL_USER'], CONFIG['EMAIL_PASS'])
+        server = get_manager(CONFIG['SMTP_SERVER'], CONFIG['SMTP_PORT'],
+                             CONFIG['EMAIL_USER'], CONFIG['EMAIL_PASS'])
         
-        subject = f"New Contact Messages ({new_message_count})"
+        summaries = '\n'.join(
+            f"- {msg.get('name', 'Unknown')} <{msg.get('email', 'Unknown')}> at {msg.get('timestamp', 'Unknown')}:\n"
+            f"  {msg.get('message', '')[:500]}\n"
+            for msg in new_messages
+        )
+        
+        subject = f"New Contact Messages ({len(new_messages)})"
         body = f"""
-You have {new_message_count} new contact form messages.
+You have {len(new_messages)} new contact form messages.
 
+{summaries}
 View them at: {CONFIG['ADMIN_URL']}
 
 Automated notification from your website monitor.
@@ -148,54 +234,50 @@ Automated notification from your website monitor.
         msg['From'] = CONFIG['EMAIL_USER']
         msg['To'] = CONFIG['NOTIFY_EMAIL']
         
-        server.send_message(msg)
-        server.quit()
+        server.send(msg)
         return True
     except Exception as e:
         print(f"Email failed: {e}")
         return False
 
+@instrument_check('admin')
 def check_messages():
     """Main function"""
     print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] Checking messages...")
     
     session = create_session()
+    load_session_cookies(session)
+    store = get_store()
+    fetch_started = time.monotonic()
     
-    # Login to admin
-    if not login_to_admin(session):
-        return False
-    
-    # Get current count
-    current_count = get_message_count_from_admin(session)
-    if current_count is None:
-        print("Could not get message count")
+    # Get the messages we have not seen yet, logging in only if needed
+    new_messages = get_new_messages_from_admin(session, store)
+    latency_ms = (time.monotonic() - fetch_started) * 1000
+    if new_messages is None:
+        print("Could not get messages")
+        store.record_check(CONFIG['STATE_KEY'], False, latency_ms, notification_status='fetch_failed')
         return False
     
-    # Compare with last count
-    try:
-        with open(CONFIG['LAST_COUNT_FILE'], 'r') as f:
-            last_count = int(f.read().strip())
-    except:
-        last_count = 0
-    
-    print(f"Current: {current_count}, Last: {last_count}")
-    
-    if current_count > last_count:
-        new_count = current_count - last_count
-        print(f"Found {new_count} new messages!")
+    if new_messages:
+        print(f"Found {len(new_messages)} new messages!")
+        archive_messages(CONFIG['STATE_KEY'], new_messages)
+        
+        with stage('notify', channel='email') as span:
+            sent = send_email_notification(new_messages)
+            if not sent:
+                span.outcome = 'failed'
         
-        if send_email_notification(new_count):
+        if sent:
             print("Email notification sent")
-            # Save new count
-            with open(CONFIG['LAST_COUNT_FILE'], 'w') as f:
-                f.write(str(current_count))
+            with stage('state_write', op='record_check'), store.transaction():
+                store.record_check(CONFIG['STATE_KEY'], True, latency_ms, None, len(new_messages), 'sent')
+                store.mark_seen(CONFIG['STATE_KEY'], new_messages)
         else:
+            store.record_check(CONFIG['STATE_KEY'], False, latency_ms, None, len(new_messages), 'failed')
             return False
     else:
         print("No new messages")
-        # Update count anyway
-        with open(CONFIG['LAST_COUNT_FILE'], 'w') as f:
-            f.write(str(current_count))
+        store.record_check(CONFIG['STATE_KEY'], True, latency_ms, None, 0)
     
     return True
 
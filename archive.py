@@ -0,0 +1,529 @@
+#!/usr/bin/env python3
+"""
+Local archive of every fetched contact message
+
+Messages are appended to gzip-compressed JSONL segments, one directory
+per endpoint, so old messages can be looked up and exported without
+scraping the site again. Each segment has a sidecar index of fixed-size
+records (timestamp, id digest, offset of the gzip member holding the
+message) that is read through mmap: a date range is two binary searches
+and an id lookup a scan of 24-byte records, and only the gzip members
+they point at are decompressed.
+
+The active segment is closed once it reaches SEGMENT_BYTES: it is
+rewritten sorted by timestamp in members of MEMBER_MESSAGES messages.
+Runs of COMPACT_SEGMENTS closed segments are then merged, up to
+COMPACT_BYTES, dropping exact duplicates.
+
+Usage:
+  python archive.py list
+  python archive.py query --since 2024-03-01 --until 2024-04-01 [--endpoint TEXT] [--id ID]
+  python archive.py export --format csv --out march.csv --since 2024-03-01 --until 2024-04-01
+  python archive.py compact
+"""
+
+import argparse
+import bisect
+import csv
+import gzip
+import hashlib
+import heapq
+import json
+import logging
+import mmap
+import os
+import re
+import struct
+import sys
+import threading
+import time
+import zlib
+from datetime import datetime, timezone
+
+from metrics import stage
+from state_store import content_digest, key_digest
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+CONFIG = {
+    'ENABLED': True,
+    'DIR': os.getenv('MONITOR_ARCHIVE', 'archive'),
+    'SEGMENT_BYTES': 8 * 1024 * 1024,   # compressed size at which the active segment is closed
+    'COMPACT_BYTES': 64 * 1024 * 1024,  # largest segment produced by merging closed ones
+    'COMPACT_SEGMENTS': 4,              # closed segments merged at a time
+    'MEMBER_MESSAGES': 1000,            # messages per gzip member in closed segments
+    'COMPRESSLEVEL': 6,
+}
+
+# Index record: timestamp (epoch seconds), id key digest, gzip member offset
+RECORD = struct.Struct('<q8sQ')
+ACTIVE = 'active'
+READ_CHUNK = 64 * 1024
+
+def timestamp_of(msg, default=0):
+    """Epoch seconds of a message's timestamp (naive times are taken as UTC), or default"""
+    value = msg.get('timestamp')
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        # Millisecond timestamps are common in JSON APIs
+        return int(value / 1000 if value > 1e11 else value)
+    try:
+        parsed = datetime.fromisoformat(str(value).strip())
+    except ValueError:
+        return int(default)
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return int(parsed.timestamp())
+
+def parse_time(text):
+    """Epoch seconds of a command-line date or time"""
+    value = timestamp_of({'timestamp': text}, None)
+    if value is None:
+        raise argparse.ArgumentTypeError(f"not an ISO date or time: {text}")
+    return value
+
+def id_key(msg_id):
+    """Index key of a message id, as stored by the archive"""
+    return key_digest({'id': msg_id})
+
+def endpoint_dir(endpoint, root=None):
+    """Directory of an endpoint's archive: a readable slug plus a hash of the name"""
+    slug = re.sub(r'[^A-Za-z0-9._-]+', '_', re.sub(r'^\w+://', '', endpoint)).strip('_')[:60]
+    digest = hashlib.sha1(endpoint.encode('utf-8')).hexdigest()[:8]
+    return os.path.join(root or CONFIG['DIR'], f"{slug}-{digest}")
+
+class Segment:
+    """One compressed JSONL data file and its sidecar index"""
+
+    def __init__(self, directory, name):
+        self.name = name
+        self.data_path = os.path.join(directory, f"{name}.jsonl.gz")
+        self.index_path = os.path.join(directory, f"{name}.idx")
+        # Closed segments are sorted by timestamp, the active one is in arrival order
+        self.sorted = name != ACTIVE
+
+    @property
+    def number(self):
+        return int(self.name) if self.sorted else None
+
+    def size(self):
+        try:
+            return os.path.getsize(self.data_path)
+        except FileNotFoundError:
+            return 0
+
+    def index(self):
+        """Return the index records as a read-only memoryview (empty if there are none)"""
+        try:
+            with open(self.index_path, 'rb') as f:
+                size = os.fstat(f.fileno()).st_size
+                size -= size % RECORD.size
+                if not size:
+                    return memoryview(b'')
+                mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except FileNotFoundError:
+            return memoryview(b'')
+        return memoryview(mapped)[:size]
+
+    def offsets(self, since=None, until=None, keys=None):
+        """Return the member offsets holding messages in [since, until) or with one of keys"""
+        view = self.index()
+        count = len(view) // RECORD.size
+        if keys is not None and since is None and until is None:
+            return self._find_keys(view, count, keys)
+        lo, hi = 0, count
+        if self.sorted and keys is None:
+            timestamps = _Timestamps(view, count)
+            if since is not None:
+                lo = bisect.bisect_left(timestamps, since)
+            if until is not None:
+                hi = bisect.bisect_left(timestamps, until, lo)
+        offsets = {}
+        for timestamp, key, offset in RECORD.iter_unpack(view[lo * RECORD.size:hi * RECORD.size]):
+            if since is not None and timestamp < since or until is not None and timestamp >= until:
+                continue
+            if keys is None or key in keys:
+                offsets[offset] = None
+        return list(offsets)
+
+    def _find_keys(self, view, count, keys):
+        # A byte search of the mapped index, much faster than unpacking every record
+        data = view.obj
+        offsets = {}
+        for key in keys:
+            pos = data.find(key, 8)
+            while pos != -1 and pos < count * RECORD.size:
+                if pos % RECORD.size == 8:
+                    offsets[struct.unpack_from('<Q', view, pos + 8)[0]] = None
+                pos = data.find(key, pos + 1)
+        return list(offsets)
+
+    def read_member(self, f, offset):
+        """Decompress the gzip member at offset, returning (records, offset of the next member)
+
+        records is None if the member is torn (a crash while it was written).
+        """
+        f.seek(offset)
+        decompressor = zlib.decompressobj(wbits=31)
+        chunks = []
+        while not decompressor.eof:
+            data = f.read(READ_CHUNK)
+            if not data:
+                return None, offset
+            try:
+                chunks.append(decompressor.decompress(data))
+            except zlib.error:
+                return None, offset
+        end = f.tell() - len(decompressor.unused_data)
+        lines = b''.join(chunks).splitlines()
+        return [json.loads(line) for line in lines if line], end
+
+    def read(self, offsets):
+        """Yield the records of the members at offsets"""
+        with open(self.data_path, 'rb') as f:
+            for offset in offsets:
+                records, _ = self.read_member(f, offset)
+                yield from records or ()
+
+    def members(self, start=0):
+        """Yield (offset, records, end offset) of every complete member from start on"""
+        try:
+            f = open(self.data_path, 'rb')
+        except FileNotFoundError:
+            return
+        with f:
+            offset = start
+            while True:
+                records, end = self.read_member(f, offset)
+                if records is None:
+                    return
+                yield offset, records, end
+                offset = end
+
+    def stream(self):
+        """Yield (timestamp, record) of every message, in file order"""
+        for _, records, _ in self.members():
+            for record in records:
+                yield timestamp_of(record['message'], record['at']), record
+
+    def remove(self):
+        # The index goes first: a data file without one is an unfinished write
+        for path in (self.index_path, self.data_path):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+class _Timestamps:
+    """Sequence view of the timestamps in a packed index, for bisect"""
+
+    def __init__(self, view, count):
+        self.view = view
+        self.count = count
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, i):
+        return struct.unpack_from('<q', self.view, i * RECORD.size)[0]
+
+class Archive:
+    """Append-only message archive of one endpoint"""
+
+    def __init__(self, endpoint, root=None):
+        self.endpoint = endpoint
+        self.directory = endpoint_dir(endpoint, root)
+        self.lock = threading.RLock()
+        os.makedirs(self.directory, exist_ok=True)
+        name_file = os.path.join(self.directory, 'ENDPOINT')
+        if not os.path.exists(name_file):
+            with open(name_file, 'w', encoding='utf-8') as f:
+                f.write(endpoint)
+        self.active = Segment(self.directory, ACTIVE)
+        self._recover()
+
+    def closed(self):
+        """Closed segments, oldest first"""
+        segments = []
+        for filename in os.listdir(self.directory):
+            name, _, ext = filename.partition('.')
+            if ext == 'idx' and name.isdigit():
+                segments.append(Segment(self.directory, name))
+        return sorted(segments, key=lambda segment: segment.number)
+
+    def segments(self):
+        return self.closed() + [self.active]
+
+    def _recover(self):
+        """Drop what a crash left half-written and index the active segment's unindexed tail"""
+        for filename in os.listdir(self.directory):
+            path = os.path.join(self.directory, filename)
+            name = filename.partition('.')[0]
+            if filename.endswith('.tmp') or (name.isdigit() and filename.endswith('.jsonl.gz')
+                                             and not os.path.exists(Segment(self.directory, name).index_path)):
+                os.remove(path)
+
+        index_size = os.path.getsize(self.active.index_path) if os.path.exists(self.active.index_path) else 0
+        if index_size % RECORD.size:
+            with open(self.active.index_path, 'r+b') as f:
+                f.truncate(index_size - index_size % RECORD.size)
+        last = max((offset for _, _, offset in RECORD.iter_unpack(self.active.index())), default=None)
+
+        end, missing = 0, []
+        for offset, records, end in self.active.members(last or 0):
+            if offset != last:
+                missing.append((offset, records))
+        if end < self.active.size():
+            logger.warning(f"Dropping a torn archive write at the end of {self.active.data_path}")
+            with open(self.active.data_path, 'r+b') as f:
+                f.truncate(end)
+        if missing:
+            self._append_index(self.active, [(timestamp_of(record['message'], record['at']), record, offset)
+                                             for offset, records in missing for record in records])
+
+    def _append_index(self, segment, entries):
+        """Append (timestamp, record, member offset) entries to a segment's index"""
+        with open(segment.index_path, 'ab') as f:
+            f.write(b''.join(RECORD.pack(timestamp, key_digest(record['message']), offset)
+                             for timestamp, record, offset in entries))
+
+    def append(self, messages, at=None):
+        """Archive messages as one gzip member of the active segment"""
+        if not messages:
+            return
+        at = at or time.time()
+        records = [{'at': at, 'message': msg} for msg in messages]
+        member = gzip.compress(''.join(json.dumps(record, separators=(',', ':')) + '\n'
+                                       for record in records).encode('utf-8'),
+                               compresslevel=CONFIG['COMPRESSLEVEL'])
+        with self.lock, stage('archive_write') as span:
+            span.add_bytes(len(member))
+            offset = self.active.size()
+            # Data before index: an index record never points past the data
+            with open(self.active.data_path, 'ab') as f:
+                f.write(member)
+            self._append_index(self.active, [(timestamp_of(record['message'], at), record, offset)
+                                             for record in records])
+            if offset + len(member) >= CONFIG['SEGMENT_BYTES']:
+                self.rotate()
+
+    def rotate(self):
+        """Close the active segment, rewriting it sorted into large members, then compact"""
+        with self.lock:
+            if not self.active.size():
+                return
+            records = sorted(self.active.stream(), key=lambda item: item[0])
+            self._write_segment(self._next_number(), records)
+            self.active.remove()
+        self.compact()
+
+    def _next_number(self):
+        closed = self.closed()
+        return closed[-1].number + 1 if closed else 1
+
+    def _write_segment(self, number, items):
+        """Write (timestamp, record) items, sorted by timestamp, as a closed segment
+
+        Exact duplicates (same timestamp, id and content) are dropped. The
+        index is renamed into place last, which is what makes the segment
+        exist.
+        """
+        segment = Segment(self.directory, f"{number:06d}")
+        index = []
+        with open(segment.data_path + '.tmp', 'wb') as f:
+            batch, seen, seen_at = [], set(), None
+            for timestamp, record in items:
+                if timestamp != seen_at:
+                    seen, seen_at = set(), timestamp
+                fingerprint = (key_digest(record['message']), content_digest(record['message']))
+                if fingerprint in seen:
+                    continue
+                seen.add(fingerprint)
+                batch.append((timestamp, record))
+                if len(batch) >= CONFIG['MEMBER_MESSAGES']:
+                    self._write_member(f, batch, index)
+                    batch = []
+            if batch:
+                self._write_member(f, batch, index)
+            f.flush()
+            os.fsync(f.fileno())
+        with open(segment.index_path + '.tmp', 'wb') as f:
+            f.write(b''.join(index))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(segment.data_path + '.tmp', segment.data_path)
+        os.replace(segment.index_path + '.tmp', segment.index_path)
+        return segment
+
+    def _write_member(self, f, batch, index):
+        offset = f.tell()
+        f.write(gzip.compress(''.join(json.dumps(record, separators=(',', ':')) + '\n'
+                                      for _, record in batch).encode('utf-8'),
+                              compresslevel=CONFIG['COMPRESSLEVEL']))
+        index.extend(RECORD.pack(timestamp, key_digest(record['message']), offset) for timestamp, record in batch)
+
+    def compact(self):
+        """Merge runs of COMPACT_SEGMENTS small closed segments, returning the number merged"""
+        merged = 0
+        with self.lock:
+            group = []
+            for segment in self.closed():
+                if segment.size() >= CONFIG['COMPACT_BYTES']:
+                    group = []
+                    continue
+                group.append(segment)
+                while sum(s.size() for s in group) > CONFIG['COMPACT_BYTES']:
+                    group.pop(0)
+                if len(group) < CONFIG['COMPACT_SEGMENTS']:
+                    continue
+                with stage('archive_compact') as span:
+                    span.add_bytes(sum(s.size() for s in group))
+                    # Closed segments are sorted, so merging their streams keeps the result sorted
+                    self._write_segment(self._next_number(),
+                                        heapq.merge(*(s.stream() for s in group), key=lambda item: item[0]))
+                for old in group:
+                    old.remove()
+                merged += len(group)
+                group = []
+        return merged
+
+    def query(self, since=None, until=None, ids=None):
+        """Return archived records in [since, until) and with one of ids, sorted by timestamp
+
+        A message archived more than once is returned once.
+        """
+        keys = {id_key(msg_id) for msg_id in ids} if ids else None
+        wanted = {str(msg_id) for msg_id in ids} if ids else None
+        results, seen = [], set()
+        for segment in self.segments():
+            offsets = segment.offsets(since, until, keys)
+            if not offsets:
+                continue
+            for record in segment.read(offsets):
+                msg = record['message']
+                timestamp = timestamp_of(msg, record['at'])
+                if since is not None and timestamp < since or until is not None and timestamp >= until:
+                    continue
+                if wanted is not None and str(msg.get('id')) not in wanted:
+                    continue
+                fingerprint = (key_digest(msg), content_digest(msg))
+                if fingerprint not in seen:
+                    seen.add(fingerprint)
+                    results.append((timestamp, record))
+        results.sort(key=lambda item: item[0])
+        return [record for _, record in results]
+
+    def is_empty(self):
+        return not any(segment.size() for segment in self.segments())
+
+    def stats(self):
+        """Segment count, message count and compressed bytes"""
+        segments = [segment for segment in self.segments() if segment.size()]
+        messages = sum(len(segment.index()) // RECORD.size for segment in segments)
+        return {'endpoint': self.endpoint, 'segments': len(segments), 'messages': messages,
+                'bytes': sum(segment.size() for segment in segments)}
+
+_archives = {}
+_archives_lock = threading.Lock()
+
+def get_archive(endpoint, root=None):
+    """Return the shared archive of an endpoint, opening it on first use"""
+    directory = endpoint_dir(endpoint, root)
+    with _archives_lock:
+        archive = _archives.get(directory)
+        if archive is None:
+            archive = Archive(endpoint, root)
+            _archives[directory] = archive
+        return archive
+
+def archive_messages(endpoint, new_messages, fetched=None):
+    """Archive the new messages of a fetch, or all of fetched the first time an endpoint is archived
+
+    Failures are logged and never fail a check.
+    """
+    if not CONFIG['ENABLED']:
+        return
+    try:
+        archive = get_archive(endpoint)
+        if fetched and archive.is_empty():
+            new_messages = fetched
+        archive.append(list(new_messages))
+    except Exception as e:
+        logger.warning(f"Could not archive messages: {e}")
+
+def open_archives(root=None, match=None):
+    """Archives under root whose endpoint contains match"""
+    root = root or CONFIG['DIR']
+    archives = []
+    if not os.path.isdir(root):
+        return archives
+    for name in sorted(os.listdir(root)):
+        try:
+            with open(os.path.join(root, name, 'ENDPOINT'), encoding='utf-8') as f:
+                endpoint = f.read()
+        except OSError:
+            continue
+        if match is None or match in endpoint:
+            archives.append(get_archive(endpoint, root))
+    return archives
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Query and export the local message archive")
+    parser.add_argument('--dir', default=CONFIG['DIR'], help="archive directory")
+    commands = parser.add_subparsers(dest='command', required=True)
+    commands.add_parser('list', help="archived endpoints with their sizes")
+    commands.add_parser('compact', help="close active segments and merge small ones")
+    for name, help_text in (('query', "print matching messages"), ('export', "write matching messages to a file")):
+        command = commands.add_parser(name, help=help_text)
+        command.add_argument('--endpoint', help="only endpoints containing this text")
+        command.add_argument('--since', type=parse_time, help="first date or time, inclusive (UTC)")
+        command.add_argument('--until', type=parse_time, help="last date or time, exclusive (UTC)")
+        command.add_argument('--id', action='append', dest='ids', help="message id, repeatable")
+        if name == 'export':
+            command.add_argument('--format', choices=('jsonl', 'csv'), default='jsonl')
+            command.add_argument('--out', help="output file (default: standard output)")
+    args = parser.parse_args(argv)
+
+    archives = open_archives(args.dir, getattr(args, 'endpoint', None))
+    if args.command == 'list':
+        for archive in archives:
+            stats = archive.stats()
+            print(f"{stats['messages']:>9} messages {stats['segments']:>4} segments "
+                  f"{stats['bytes'] / 1e6:>9.2f} MB  {stats['endpoint']}")
+        return
+    if args.command == 'compact':
+        for archive in archives:
+            archive.rotate()
+            print(f"{archive.endpoint}: {archive.stats()['segments']} segment(s)")
+        return
+
+    rows = [(archive.endpoint, record) for archive in archives
+            for record in archive.query(args.since, args.until, args.ids)]
+    if args.command == 'query':
+        for endpoint, record in rows:
+            msg = record['message']
+            print(f"[{msg.get('timestamp', 'Unknown')}] {msg.get('name', 'Unknown')} "
+                  f"<{msg.get('email', 'Unknown')}> (id {msg.get('id', '-')}): {msg.get('message', '')}")
+        print(f"{len(rows)} message(s)", file=sys.stderr)
+        return
+
+    out = open(args.out, 'w', encoding='utf-8', newline='') if args.out else sys.stdout
+    try:
+        if args.format == 'csv':
+            writer = csv.writer(out)
+            writer.writerow(['endpoint', 'id', 'timestamp', 'name', 'email', 'message', 'archived_at'])
+            for endpoint, record in rows:
+                msg = record['message']
+                writer.writerow([endpoint, msg.get('id', ''), msg.get('timestamp', ''), msg.get('name', ''),
+                                 msg.get('email', ''), msg.get('message', ''),
+                                 datetime.fromtimestamp(record['at'], timezone.utc).isoformat()])
+        else:
+            for endpoint, record in rows:
+                out.write(json.dumps(dict(record, endpoint=endpoint), ensure_ascii=False) + '\n')
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    print(f"Exported {len(rows)} message(s)", file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Benchmark for the message archive
+
+Archives histories of up to 1M messages in check-sized batches (with the
+default rotation and compaction), then times a one-day and a one-month
+range query, an id lookup and the same range found by decompressing
+every segment, which is what a lookup without the sidecar index costs.
+
+Usage: python benchmarks/bench_archive.py [--sizes 10000,100000,1000000] [--batch N] [--repeat N]
+"""
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_diff import best_of, make_message
+
+SIZES = [10000, 100000, 1000000]
+DAY = 86400
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', default=','.join(str(size) for size in SIZES))
+    parser.add_argument('--batch', type=int, default=50, help="messages archived per check")
+    parser.add_argument('--repeat', type=int, default=3, help="runs per measurement, best is reported")
+    args = parser.parse_args(argv)
+
+    workdir = tempfile.mkdtemp()
+    os.environ['MONITOR_STATE_DB'] = os.path.join(workdir, 'bench_state.db')
+    import archive
+
+    print(f"{'messages':>9} {'archive MB':>11} {'segments':>9} {'append ms':>10} {'rotate s':>9} "
+          f"{'day ms':>8} {'month ms':>9} {'id ms':>7} {'scan ms':>8}")
+    try:
+        for size in (int(size) for size in args.sizes.split(',')):
+            root = os.path.join(workdir, f"archive-{size}")
+            store = archive.Archive(f"bench-{size}", root)
+            history = [make_message(i) for i in range(1, size + 1)]
+
+            # make_message spaces messages a minute apart from this time
+            start = archive.timestamp_of(history[0])
+            appends, rotations = [], 0.0
+            for begin in range(0, size, args.batch):
+                started = time.perf_counter()
+                closed = len(store.closed())
+                store.append(history[begin:begin + args.batch])
+                elapsed = time.perf_counter() - started
+                if len(store.closed()) != closed:
+                    rotations += elapsed
+                else:
+                    appends.append(elapsed)
+            appends.sort()
+            stats = store.stats()
+
+            middle = start + (size // 2) * 60
+            day_time, day = best_of(args.repeat, lambda: store.query(middle, middle + DAY))
+            month_time, month = best_of(args.repeat, lambda: store.query(middle, middle + 30 * DAY))
+            id_time, found = best_of(args.repeat, lambda: store.query(ids=[size // 2]))
+
+            def scan():
+                # Every message decompressed and filtered, as without the index
+                return [record for segment in store.segments() for _, record in segment.stream()
+                        if middle <= archive.timestamp_of(record['message']) < middle + DAY]
+            scan_time, scanned = best_of(1, scan)
+            assert len(scanned) == len(day) and len(found) == 1, "archive lookup disagrees with a full scan"
+
+            print(f"{size:>9} {stats['bytes'] / 1e6:>11.1f} {stats['segments']:>9} "
+                  f"{appends[len(appends) // 2] * 1000:>10.2f} {rotations:>9.1f} {day_time * 1000:>8.1f} "
+                  f"{month_time * 1000:>9.1f} {id_time * 1000:>7.1f} {scan_time * 1000:>8.0f}")
+            print(f"{'':>9} day: {len(day)} messages, month: {len(month)} messages")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+Cross-process check of burst digests
+
+Each check of a cron-driven monitor is a new process, so a burst held
+for a digest by one run has to be recognised by the next one from the
+outbox journal alone. Every scenario queues messages and drains the
+outbox in one process, then drains it again in a fresh process some time
+later, and compares what each run sent with what is expected. Exits
+with status 1 if any scenario sends something else.
+
+Usage: python benchmarks/bench_coalescing.py [--burst N] [--later SECONDS]
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+RUN = '''
+import json, sys, time
+import outbox
+
+journal, queued, later = sys.argv[1], int(sys.argv[2]), float(sys.argv[3])
+sent = {'individual': 0, 'digests': []}
+
+def send(messages):
+    sent['individual'] += len(messages)
+    return True
+
+def send_digest(messages):
+    sent['digests'].append(len(messages))
+    return True
+
+box = outbox.Outbox(journal)
+box.enqueue('bench', ['email'], [{'id': i, 'name': f'Sender {i}', 'message': 'Hello'}
+                                 for i in range(queued)])
+box.drain({'email': send}, digest_senders={'email': send_digest}, now=time.time() + later)
+print(json.dumps(sent))
+'''
+
+def run(journal, queued=0, later=0):
+    """Queue messages and drain the outbox in a fresh interpreter, returning what it sent"""
+    completed = subprocess.run([sys.executable, '-c', RUN, journal, str(queued), str(later)],
+                               cwd=REPO_DIR, capture_output=True, text=True)
+    if completed.returncode != 0:
+        raise RuntimeError(f"outbox run failed:\n{completed.stderr.strip()}")
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--burst', type=int, default=50, help="messages queued at once for the burst scenario")
+    parser.add_argument('--later', type=float, default=3600, help="seconds until the second run, e.g. the cron interval")
+    args = parser.parse_args(argv)
+
+    # name -> (messages queued by the first run, expected sends of the first and second run)
+    scenarios = {
+        'quiet': (3, {'individual': 3, 'digests': []}, {'individual': 0, 'digests': []}),
+        'burst': (args.burst, {'individual': 0, 'digests': []}, {'individual': 0, 'digests': [args.burst]}),
+    }
+
+    failures = 0
+    print(f"{'scenario':>9} {'queued':>7}  {'first run':<32} second run")
+    with tempfile.TemporaryDirectory() as workdir:
+        for name, (queued, first_expected, second_expected) in scenarios.items():
+            journal = os.path.join(workdir, f"{name}.jsonl")
+            first = run(journal, queued)
+            second = run(journal, later=args.later)
+            ok = first == first_expected and second == second_expected
+            failures += not ok
+            print(f"{name:>9} {queued:>7}  {json.dumps(first):<32} {json.dumps(second)}"
+                  f"{'' if ok else '  UNEXPECTED'}")
+    if failures:
+        print(f"{failures} scenario(s) sent something other than expected")
+    return 1 if failures else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
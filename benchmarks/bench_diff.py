@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+Benchmark for message_diff against count-based new-message detection
+
+Builds message histories of up to 1M messages, indexes them in a scratch
+state store and times a full diff after typical changes: nothing new, a
+few new messages, deletions plus new messages, edits and a reversed
+order. For each scenario it also shows what the old count comparison
+would have reported.
+
+Usage: python benchmarks/bench_diff.py [--sizes 1000,100000,1000000] [--changes N] [--repeat N]
+"""
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+SIZES = [1000, 100000, 1000000]
+
+def make_message(i):
+    return {
+        'id': i,
+        'name': f'Visitor {i}',
+        'email': f'visitor{i}@example.com',
+        'timestamp': time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(1700000000 + i * 60)),
+        'message': f'Hello, this is message number {i}. I would like to know more about your services.',
+    }
+
+def scenarios(history, changes):
+    """(name, messages after the change, ids that are really new)"""
+    size = len(history)
+    new = [make_message(size + i + 1) for i in range(changes)]
+    deleted = set(random.sample(range(size), min(changes, size)))
+    edited = [dict(msg, message=msg['message'] + ' (edited)') if i < changes else msg
+              for i, msg in enumerate(history)]
+    return [
+        ('unchanged', history, set()),
+        ('new', history + new, {msg['id'] for msg in new}),
+        ('deleted+new', [msg for i, msg in enumerate(history) if i not in deleted] + new,
+         {msg['id'] for msg in new}),
+        ('edited', edited, set()),
+        ('reversed+new', list(reversed(history + new)), {msg['id'] for msg in new}),
+    ]
+
+def count_based(messages, last_count):
+    """The detection message_diff replaced: the last (count - last_count) messages"""
+    return messages[-(len(messages) - last_count):] if len(messages) > last_count else []
+
+def best_of(repeat, func):
+    best, result = float('inf'), None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - started)
+    return best, result
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', default=','.join(str(size) for size in SIZES))
+    parser.add_argument('--changes', type=int, default=10, help="messages added, deleted or edited per scenario")
+    parser.add_argument('--repeat', type=int, default=3, help="runs per measurement, best is reported")
+    args = parser.parse_args(argv)
+
+    workdir = tempfile.mkdtemp()
+    os.environ['MONITOR_STATE_DB'] = os.path.join(workdir, 'bench_state.db')
+    import message_diff
+    from state_store import get_store
+
+    random.seed(0)
+    print(f"{'messages':>9} {'scenario':>13} {'diff ms':>9} {'new':>6} {'removed':>8} {'changed':>8} "
+          f"{'count-based':>12} {'correct':>8}")
+    for size in (int(size) for size in args.sizes.split(',')):
+        history = [make_message(i) for i in range(1, size + 1)]
+        endpoint = f"bench-{size}"
+
+        digest_time, entries = best_of(args.repeat, lambda: message_diff.digests(history))
+        packed = message_diff.pack(entries)
+        save_time, _ = best_of(args.repeat, lambda: get_store().replace_message_index(endpoint, packed))
+        load_time, index = best_of(args.repeat, lambda: message_diff.load_index(endpoint))
+        print(f"{size:>9} index {len(packed) / 1e6:.1f} MB: digests {digest_time * 1000:.0f} ms, "
+              f"save {save_time * 1000:.0f} ms, load {load_time * 1000:.0f} ms")
+
+        for name, messages, really_new in scenarios(history, args.changes):
+            diff_time, (diff, _) = best_of(args.repeat, lambda: index.diff(messages))
+            found = {msg['id'] for msg in diff.new}
+            legacy = {msg['id'] for msg in count_based(messages, size)}
+            # Count-based: really new messages it found / all it reported
+            legacy_text = f"{len(legacy & really_new)}/{len(legacy)}" + ('' if legacy == really_new else ' wrong')
+            print(f"{size:>9} {name:>13} {diff_time * 1000:>9.1f} {len(diff.new):>6} {len(diff.removed):>8} "
+                  f"{len(diff.changed):>8} {legacy_text:>12} {'yes' if found == really_new else 'NO':>8}")
+
+if __name__ == "__main__":
+    main()
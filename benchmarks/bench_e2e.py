@@ -0,0 +1,265 @@
+#!/usr/bin/env python3
+"""
+End-to-end benchmark of the monitors against local stand-in services
+
+Starts a fake site (contact API + admin panel), an SMTP sink and a fake
+Discord webhook from benchmarks/standins.py, then runs each monitor's
+check in its own process against sites holding 0 to 100k messages. One
+new message arrives before every timed check, so each check fetches,
+diffs and notifies.
+
+Reports p50/p99 check latency, the median time of each check stage (see
+metrics.py), the worker's peak RSS and the requests each stand-in
+received, and saves everything as JSON in benchmarks/results/.
+
+Usage: python benchmarks/bench_e2e.py [--monitors api,admin,selenium]
+           [--sizes 0,10,1000,100000] [--checks N] [--new-per-check N] [--full-history]
+"""
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+
+from standins import FakeDiscordWebhook, FakeSite, SMTPSink
+
+MONITORS = ['api', 'admin', 'selenium']
+SIZES = [0, 10, 1000, 100000]
+
+ITEMS_TEMPLATE = '''\
+EMAIL = 'monitor@example.com'
+PASSWORD = 'bench'
+API_KEY = {api_key!r}
+API_URL = {api_url!r}
+ADMIN_URL = {admin_url!r}
+ADMIN_PASSWORD = {admin_password!r}
+DISCORD_WEBHOOK = {webhook_url!r}
+'''
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a non-empty list"""
+    ordered = sorted(values)
+    rank = max(1, -(-len(ordered) * pct // 100))
+    return ordered[int(rank) - 1]
+
+def selenium_skip_reason():
+    """Why the selenium monitor cannot run here, or None if it can"""
+    try:
+        import selenium  # noqa: F401
+    except ImportError:
+        return 'selenium is not installed'
+    return None
+
+def peak_rss_mb():
+    """Peak resident memory of this process in MB, or None if unknown"""
+    try:
+        # VmHWM starts over at exec, unlike ru_maxrss which keeps the
+        # forking parent's size
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    try:
+        import resource
+    except ImportError:
+        return None
+    # ru_maxrss is KB on Linux, bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024 if sys.platform == 'darwin' else 1024)
+
+def run_worker(monitor, checks, new_per_check, control_url, smtp_port, result_file):
+    """Run inside the child process: time `checks` checks of one monitor"""
+    import contextlib
+    import logging
+    import requests
+
+    sys.path.insert(0, REPO_DIR)
+    logging.disable(logging.INFO)
+
+    # The monitors hardcode Gmail; send everything to the sink instead
+    import smtp_pool
+    real_get_manager = smtp_pool.get_manager
+    def get_manager(host, port, username=None, password=None, use_tls=True):
+        return real_get_manager('127.0.0.1', smtp_port, username, password, use_tls=False)
+    smtp_pool.get_manager = get_manager
+
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        if monitor == 'api':
+            import contact_monitor
+            check = contact_monitor.check_for_new_messages
+        elif monitor == 'admin':
+            import admin_scraper_contact_monitor
+            check = admin_scraper_contact_monitor.check_messages
+        else:
+            import selenium_contact_monitor
+            selenium_contact_monitor.CONFIG['FETCH_BACKENDS'] = ('selenium',)
+            resident = selenium_contact_monitor.ResidentDriver()
+            check = lambda: selenium_contact_monitor.check_for_new_messages(resident)
+
+        # Untimed: logs in, seeds the state and warms the connections
+        started = time.perf_counter()
+        check()
+        warmup_ms = (time.perf_counter() - started) * 1000
+
+        latencies = []
+        failures = 0
+        control = requests.Session()
+        for _ in range(checks):
+            if new_per_check:
+                control.post(control_url, params={'n': new_per_check}, timeout=30)
+            started = time.perf_counter()
+            if check() is False:
+                failures += 1
+            latencies.append((time.perf_counter() - started) * 1000)
+
+        if monitor == 'selenium':
+            resident.quit()
+
+    with open(result_file, 'w') as f:
+        json.dump({'latencies_ms': latencies, 'warmup_ms': warmup_ms,
+                   'failures': failures, 'peak_rss_mb': peak_rss_mb()}, f)
+
+def stage_medians(path):
+    """Median time per stage over the timed checks, from the per-check metrics summaries"""
+    try:
+        with open(path) as f:
+            # The first summary is the untimed warmup check
+            summaries = [json.loads(line) for line in f][1:]
+    except OSError:
+        return {}
+    per_stage = {}
+    for summary in summaries:
+        for name, elapsed in summary['totals_ms'].items():
+            per_stage.setdefault(name, []).append(elapsed)
+    return {name: percentile(values, 50) for name, values in sorted(per_stage.items())}
+
+def run_scenario(monitor, size, checks, new_per_check, cursor_support=True):
+    """Run one monitor against a fresh site holding `size` messages"""
+    with FakeSite(size, cursor_support=cursor_support) as site, SMTPSink() as sink, FakeDiscordWebhook() as hook, \
+            tempfile.TemporaryDirectory() as workdir:
+        with open(os.path.join(workdir, 'items.py'), 'w') as f:
+            f.write(ITEMS_TEMPLATE.format(api_key=site.api_key, api_url=site.api_url,
+                                          admin_url=site.admin_url, admin_password=site.admin_password,
+                                          webhook_url=hook.url))
+        if monitor != 'admin':
+            # Start from "everything already notified" instead of mailing the whole backlog
+            with open(os.path.join(workdir, 'last_message_count.txt'), 'w') as f:
+                f.write(str(size))
+
+        result_file = os.path.join(workdir, 'result.json')
+        env = dict(os.environ,
+                   PYTHONPATH=os.pathsep.join([workdir, REPO_DIR, BENCH_DIR]),
+                   MONITOR_STATE_DB=os.path.join(workdir, 'monitor_state.db'),
+                   MONITOR_OUTBOX=os.path.join(workdir, 'notification_outbox.jsonl'),
+                   MONITOR_ARCHIVE=os.path.join(workdir, 'archive'),
+                   MONITOR_METRICS_JSON=os.path.join(workdir, 'metrics.jsonl'))
+        command = [sys.executable, os.path.abspath(__file__), '--worker', monitor,
+                   '--checks', str(checks), '--new-per-check', str(new_per_check),
+                   '--control-url', site.control_url, '--smtp-port', str(sink.port),
+                   '--result-file', result_file]
+        completed = subprocess.run(command, cwd=workdir, env=env, stderr=subprocess.PIPE, text=True)
+        if completed.returncode != 0 or not os.path.exists(result_file):
+            return {'monitor': monitor, 'messages': size, 'error': completed.stderr.strip()[-2000:]}
+
+        with open(result_file) as f:
+            worker = json.load(f)
+        stages = stage_medians(os.path.join(workdir, 'metrics.jsonl'))
+
+    latencies = worker['latencies_ms']
+    return {
+        'monitor': monitor,
+        'messages': size,
+        'checks': len(latencies),
+        'failures': worker['failures'],
+        'warmup_ms': round(worker['warmup_ms'], 2),
+        'p50_ms': round(percentile(latencies, 50), 2) if latencies else None,
+        'p99_ms': round(percentile(latencies, 99), 2) if latencies else None,
+        'peak_rss_mb': round(worker['peak_rss_mb'], 1) if worker['peak_rss_mb'] else None,
+        'stages_p50_ms': stages,
+        'requests': {
+            'api': site.requests['/api'],
+            'admin': site.requests['/admin'],
+            'smtp_connections': sink.connections,
+            'smtp_logins': sink.logins,
+            'emails': len(sink.messages),
+            'discord': hook.requests,
+            'discord_rate_limited': hook.rate_limited,
+        },
+    }
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_DIR,
+                              capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        return None
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--monitors', default=','.join(MONITORS))
+    parser.add_argument('--sizes', default=','.join(str(size) for size in SIZES))
+    parser.add_argument('--checks', type=int, default=20, help='timed checks per scenario')
+    parser.add_argument('--new-per-check', type=int, default=1,
+                        help='messages added before every check (0 measures the unchanged path)')
+    parser.add_argument('--full-history', action='store_true',
+                        help='site ignores since_id, so every check downloads every message')
+    parser.add_argument('--output', default=os.path.join(BENCH_DIR, 'results'))
+    parser.add_argument('--worker', help=argparse.SUPPRESS)
+    parser.add_argument('--control-url', help=argparse.SUPPRESS)
+    parser.add_argument('--smtp-port', type=int, help=argparse.SUPPRESS)
+    parser.add_argument('--result-file', help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.worker:
+        run_worker(args.worker, args.checks, args.new_per_check, args.control_url,
+                   args.smtp_port, args.result_file)
+        return
+
+    monitors = [name.strip() for name in args.monitors.split(',') if name.strip()]
+    sizes = [int(size) for size in args.sizes.split(',')]
+
+    results = []
+    print(f"{'monitor':>9} {'messages':>9} {'p50 ms':>9} {'p99 ms':>9} {'peak MB':>8} {'requests'}")
+    for monitor in monitors:
+        skip = selenium_skip_reason() if monitor == 'selenium' else None
+        for size in sizes:
+            if skip:
+                result = {'monitor': monitor, 'messages': size, 'skipped': skip}
+                print(f"{monitor:>9} {size:>9} skipped: {skip}")
+            else:
+                result = run_scenario(monitor, size, args.checks, args.new_per_check,
+                                      cursor_support=not args.full_history)
+                if 'error' in result:
+                    print(f"{monitor:>9} {size:>9} failed: {result['error'].splitlines()[-1:]}")
+                else:
+                    requests = ' '.join(f"{key}={value}" for key, value in result['requests'].items() if value)
+                    print(f"{monitor:>9} {size:>9} {result['p50_ms']:>9.1f} {result['p99_ms']:>9.1f} "
+                          f"{result['peak_rss_mb'] or 0:>8.1f} {requests}")
+            results.append(result)
+
+    os.makedirs(args.output, exist_ok=True)
+    path = os.path.join(args.output, f"e2e-{time.strftime('%Y%m%d-%H%M%S')}.json")
+    with open(path, 'w') as f:
+        json.dump({
+            'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'revision': git_revision(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'checks': args.checks,
+            'new_per_check': args.new_per_check,
+            'cursor_support': not args.full_history,
+            'results': results,
+        }, f, indent=2)
+    print(f"\nSaved results to {path}")
+
+if __name__ == '__main__':
+    main()
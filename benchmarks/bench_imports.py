@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+Import-time budget for the entry points
+
+Every monitor run is a cold interpreter start, so each entry module is
+imported in fresh interpreters and the median import time is compared
+with its budget. The heavy dependencies (selenium, requests, smtplib,
+email.mime) must not be imported until a check actually needs them. Exits
+with status 1 if any module is over budget or imports one of them.
+
+Usage: python benchmarks/bench_imports.py [--runs N] [--scale X]
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+HEAVY = ('selenium', 'requests', 'urllib3', 'smtplib', 'email.mime')
+
+# Module -> milliseconds its import may take: two to three times what it
+# takes on a developer machine, to leave room for slow CI runners
+BUDGETS_MS = {
+    'monitor': 40,
+    'contact_monitor': 150,
+    'selenium_contact_monitor': 150,
+    'admin_scraper_contact_monitor': 150,
+    'scheduler': 200,
+}
+
+ITEMS = '''EMAIL = "monitor@example.com"
+PASSWORD = "password"
+API_KEY = "key"
+API_URL = "https://example.com/api/messages"
+ADMIN_URL = "https://example.com/admin"
+ADMIN_PASSWORD = "password"
+DISCORD_WEBHOOK = ""
+'''
+
+PROBE = '''
+import json, sys, time
+started = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - started
+heavy = [name for name in {heavy!r} if name in sys.modules]
+print(json.dumps({{'ms': elapsed * 1000, 'heavy': heavy}}))
+'''
+
+def measure(module, runs, workdir):
+    """Return (median import ms, heavy modules imported) over runs fresh interpreters"""
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join([workdir, REPO_DIR]),
+               MONITOR_STATE_DB=os.path.join(workdir, 'monitor_state.db'))
+    times, heavy = [], set()
+    for _ in range(runs):
+        completed = subprocess.run([sys.executable, '-c', PROBE.format(module=module, heavy=HEAVY)],
+                                   cwd=workdir, env=env, capture_output=True, text=True)
+        if completed.returncode != 0:
+            raise RuntimeError(f"importing {module} failed:\n{completed.stderr.strip()}")
+        result = json.loads(completed.stdout.strip().splitlines()[-1])
+        times.append(result['ms'])
+        heavy.update(result['heavy'])
+    return statistics.median(times), sorted(heavy)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5, help="fresh interpreters per module, median is reported")
+    parser.add_argument('--scale', type=float, default=1.0, help="multiply every budget, e.g. for slow machines")
+    args = parser.parse_args(argv)
+
+    failures = 0
+    print(f"{'module':>30} {'import ms':>10} {'budget ms':>10}  heavy imports")
+    with tempfile.TemporaryDirectory() as workdir:
+        # The monitors read their credentials from items.py at import time
+        with open(os.path.join(workdir, 'items.py'), 'w') as f:
+            f.write(ITEMS)
+        for module, budget in BUDGETS_MS.items():
+            budget *= args.scale
+            elapsed, heavy = measure(module, args.runs, workdir)
+            ok = elapsed <= budget and not heavy
+            failures += not ok
+            print(f"{module:>30} {elapsed:>10.1f} {budget:>10.0f}  {', '.join(heavy) or '-'}"
+                  f"{'' if ok else '  OVER BUDGET'}")
+    if failures:
+        print(f"{failures} module(s) over their import budget")
+    return 1 if failures else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
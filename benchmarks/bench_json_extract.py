@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+Benchmark for extracting the API JSON out of a Chrome-rendered page source
+
+Compares the original character-by-character brace counter against
+json_extract.extract_json on payloads from 1 KB to 50 MB.
+
+Usage: python benchmarks/bench_json_extract.py [--sizes 1K,1M,50M] [--repeat N]
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from json_extract import extract_json
+
+SIZES = ['1K', '10K', '100K', '1M', '10M', '50M']
+
+PAGE_TEMPLATE = (
+    '<html><head><meta name="color-scheme" content="light dark"></head><body>'
+    '<pre style="word-wrap: break-word; white-space: pre-wrap;">{}</pre></body></html>'
+)
+
+def parse_size(size):
+    """Turn '1K' / '10M' into a byte count"""
+    units = {'K': 1024, 'M': 1024 * 1024}
+    if size[-1].upper() in units:
+        return int(float(size[:-1]) * units[size[-1].upper()])
+    return int(size)
+
+def build_page(target_bytes):
+    """Build a page source holding a messages payload of about target_bytes"""
+    message = {
+        'id': 0,
+        'name': 'Jane Doe',
+        'email': 'jane@example.com',
+        'timestamp': '2025-01-01 12:00:00',
+        # Braces inside strings used to confuse the old extractor
+        'message': 'Hello {there}, quoting } and { in a body. ' * 3,
+    }
+    per_message = len(json.dumps(message)) + 2
+    count = max(1, target_bytes // per_message)
+    messages = [dict(message, id=i) for i in range(count)]
+    return PAGE_TEMPLATE.format(json.dumps({'success': True, 'messages': messages}))
+
+def legacy_extract(page_text):
+    """The brace-counting loop formerly in selenium_contact_monitor"""
+    start_idx = page_text.find('{"')
+    json_text = page_text[start_idx:]
+    brace_count = 0
+    end_idx = 0
+    for i, char in enumerate(json_text):
+        if char == '{':
+            brace_count += 1
+        elif char == '}':
+            brace_count -= 1
+            if brace_count == 0:
+                end_idx = i + 1
+                break
+    return json.loads(json_text[:end_idx])
+
+def time_call(func, page, repeat):
+    """Return the best wall time of func(page) over repeat runs"""
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        try:
+            func(page)
+        except (json.JSONDecodeError, ValueError):
+            return None
+        best = min(best, time.perf_counter() - started)
+    return best
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', default=','.join(SIZES), help="comma separated payload sizes")
+    parser.add_argument('--repeat', type=int, default=3, help="runs per size, best is reported")
+    args = parser.parse_args(argv)
+
+    print(f"{'size':>8} {'page bytes':>12} {'legacy':>12} {'extract_json':>14} {'speedup':>9}")
+    for size in args.sizes.split(','):
+        page = build_page(parse_size(size))
+        legacy = time_call(legacy_extract, page, args.repeat)
+        current = time_call(extract_json, page, args.repeat)
+        legacy_text = f"{legacy * 1000:.2f} ms" if legacy is not None else "failed"
+        speedup = f"{legacy / current:.1f}x" if legacy is not None else "-"
+        print(f"{size:>8} {len(page):>12,} {legacy_text:>12} {current * 1000:>11.2f} ms {speedup:>9}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,363 @@
+#!/usr/bin/env python3
+"""
+Local stand-ins for the services the monitors talk to
+
+FakeSite serves the contact API and the admin panel, SMTPSink accepts
+mail like Gmail would (minus STARTTLS) and keeps every message it
+receives, and FakeDiscordWebhook enforces Discord's webhook rate limits,
+so the monitors can be exercised and measured offline.
+"""
+
+import gzip
+import json
+import socketserver
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+class _SMTPHandler(socketserver.StreamRequestHandler):
+    """Speaks just enough SMTP for smtplib: EHLO, AUTH, MAIL, RCPT, DATA, NOOP, RSET, QUIT"""
+
+    # Multi-line replies are written line by line
+    disable_nagle_algorithm = True
+
+    def reply(self, line):
+        self.wfile.write(line.encode('ascii') + b'\r\n')
+
+    def handle(self):
+        sink = self.server.sink
+        with sink.lock:
+            sink.connections += 1
+        self.reply('220 localhost SMTP sink ready')
+
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode('utf-8', 'replace').strip()
+            verb = command.split(' ', 1)[0].upper()
+
+            if verb == 'EHLO':
+                self.reply('250-localhost')
+                self.reply('250-AUTH PLAIN LOGIN')
+                self.reply('250 8BITMIME')
+            elif verb == 'HELO':
+                self.reply('250 localhost')
+            elif verb == 'AUTH':
+                with sink.lock:
+                    sink.logins += 1
+                self.reply('235 2.7.0 Authentication successful')
+            elif verb == 'NOOP':
+                with sink.lock:
+                    sink.noops += 1
+                self.reply('250 OK')
+            elif verb in ('MAIL', 'RCPT', 'RSET'):
+                self.reply('250 OK')
+            elif verb == 'DATA':
+                self.reply('354 End data with <CR><LF>.<CR><LF>')
+                data = []
+                while True:
+                    chunk = self.rfile.readline()
+                    if not chunk or chunk == b'.\r\n':
+                        break
+                    data.append(chunk)
+                with sink.lock:
+                    sink.messages.append(b''.join(data))
+                self.reply('250 OK queued')
+            elif verb == 'QUIT':
+                self.reply('221 Bye')
+                return
+            else:
+                self.reply('502 Command not implemented')
+
+class _ThreadingTCPServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+class SMTPSink:
+    """A local SMTP server that records what it receives
+
+    Use as a context manager; `port` holds the bound port. Connect with
+    use_tls=False since the sink does not offer STARTTLS.
+    """
+
+    def __init__(self, host='127.0.0.1', port=0):
+        self.server = _ThreadingTCPServer((host, port), _SMTPHandler)
+        self.server.sink = self
+        self.host, self.port = self.server.server_address
+        self.lock = threading.Lock()
+        self.messages = []
+        self.connections = 0
+        self.logins = 0
+        self.noops = 0
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+class _WebhookHandler(BaseHTTPRequestHandler):
+    """Discord-style webhook: 5 requests per 2 second window, 429 beyond that"""
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        hook = self.server.hook
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        with hook.lock:
+            now = time.monotonic()
+            if now - hook.window_start >= hook.window:
+                hook.window_start = now
+                hook.window_used = 0
+            hook.window_used += 1
+            hook.requests += 1
+            remaining = hook.limit - hook.window_used
+            reset_after = hook.window - (now - hook.window_start)
+            if remaining < 0:
+                hook.rate_limited += 1
+            else:
+                hook.payloads.append(json.loads(body or b'{}'))
+
+        if remaining < 0:
+            payload = json.dumps({'message': 'You are being rate limited.',
+                                  'retry_after': round(reset_after, 3), 'global': False}).encode()
+            self.send_response(429)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Retry-After', str(max(1, int(reset_after + 0.999))))
+            self.send_header('Content-Length', str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+            return
+
+        self.send_response(204)
+        self.send_header('X-RateLimit-Limit', str(hook.limit))
+        self.send_header('X-RateLimit-Remaining', str(remaining))
+        self.send_header('X-RateLimit-Reset-After', f"{reset_after:.3f}")
+        self.end_headers()
+
+class FakeDiscordWebhook:
+    """A local webhook endpoint that enforces Discord-like rate limits
+
+    `url` is the address to post to; `payloads` holds every accepted body.
+    """
+
+    def __init__(self, host='127.0.0.1', port=0, limit=5, window=2.0):
+        self.server = ThreadingHTTPServer((host, port), _WebhookHandler)
+        self.server.hook = self
+        self.url = f"http://{self.server.server_address[0]}:{self.server.server_address[1]}/api/webhooks/1/token"
+        self.limit = limit
+        self.window = window
+        self.lock = threading.Lock()
+        self.window_start = time.monotonic()
+        self.window_used = 0
+        self.requests = 0
+        self.rate_limited = 0
+        self.payloads = []
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+class _SiteHandler(BaseHTTPRequestHandler):
+    """Routes: GET /api, GET+POST /admin, POST /_control/add?n=N"""
+
+    protocol_version = 'HTTP/1.1'
+    # Headers and body go out in separate writes; don't let Nagle hold the body back
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def handle(self):
+        try:
+            super().handle()
+        except (BrokenPipeError, ConnectionResetError):
+            # Streaming clients hang up once they reach known messages
+            pass
+
+    def _send(self, status, body, content_type, headers=None):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        site = self.server.site
+        url = urlsplit(self.path)
+        site.count(url.path)
+
+        if url.path == '/api':
+            if parse_qs(url.query).get('api_key') != [site.api_key]:
+                self._send(401, b'{"success":false,"error":"Unauthorized"}', 'application/json')
+                return
+            query = parse_qs(url.query)
+            body, etag = site.api_body()
+            if self.headers.get('If-None-Match') == etag:
+                self._send(304, b'', 'application/json', {'ETag': etag})
+                return
+            headers = {'ETag': etag}
+            after = (query.get('cursor') or query.get('since_id') or [None])[0]
+            if site.cursor_support and after is not None:
+                body = site.api_page(int(after), int(query.get('limit', ['0'])[0]) or None)
+                if 'gzip' in (self.headers.get('Accept-Encoding') or ''):
+                    body = gzip.compress(body, compresslevel=1)
+                    headers['Content-Encoding'] = 'gzip'
+            elif 'gzip' in (self.headers.get('Accept-Encoding') or ''):
+                body = site.api_body_gzip()
+                headers['Content-Encoding'] = 'gzip'
+            self._send(200, body, 'application/json', headers)
+        elif url.path == '/admin':
+            if f"sid={site.session_id}" in (self.headers.get('Cookie') or ''):
+                self._send(200, site.admin_body(), 'text/html; charset=utf-8')
+            else:
+                self._send(200, site.LOGIN_PAGE, 'text/html; charset=utf-8')
+        else:
+            self._send(404, b'Not found', 'text/plain')
+
+    def do_POST(self):
+        site = self.server.site
+        url = urlsplit(self.path)
+        length = int(self.headers.get('Content-Length', 0))
+        form = parse_qs(self.rfile.read(length).decode('utf-8', 'replace'))
+
+        if url.path == '/_control/add':
+            site.add_messages(int(parse_qs(url.query).get('n', ['1'])[0]))
+            self._send(204, b'', 'text/plain')
+            return
+
+        site.count(url.path)
+        if url.path == '/admin' and form.get('password') == [site.admin_password]:
+            self._send(200, site.admin_body(), 'text/html; charset=utf-8',
+                       {'Set-Cookie': f"sid={site.session_id}; Path=/; HttpOnly"})
+        elif url.path == '/admin':
+            self._send(200, site.LOGIN_PAGE, 'text/html; charset=utf-8')
+        else:
+            self._send(404, b'Not found', 'text/plain')
+
+class FakeSite:
+    """The contact API and admin panel of a site holding `messages` messages
+
+    The API answers {"success": true, "messages": [...]} with an ETag and
+    gzip, and with cursor_support only the messages after since_id (or a
+    page cursor), `limit` at a time with a next_cursor; the admin panel needs a password login and lists messages
+    newest first. `requests` counts hits per path.
+    """
+
+    LOGIN_PAGE = b'<html><body><form method="post">Admin login <input type="password" name="password"></form></body></html>'
+
+    def __init__(self, messages=0, host='127.0.0.1', port=0, api_key='bench-key', admin_password='bench-password',
+                 cursor_support=True):
+        self.server = ThreadingHTTPServer((host, port), _SiteHandler)
+        self.server.daemon_threads = True
+        self.server.site = self
+        self.base_url = f"http://{self.server.server_address[0]}:{self.server.server_address[1]}"
+        self.api_url = self.base_url + '/api'
+        self.admin_url = self.base_url + '/admin'
+        self.control_url = self.base_url + '/_control/add'
+        self.api_key = api_key
+        self.admin_password = admin_password
+        self.session_id = 'bench-session'
+        self.cursor_support = cursor_support
+        self.lock = threading.RLock()
+        self.requests = Counter()
+        self.messages = []
+        self._cache = {}
+        self.add_messages(messages)
+
+    @staticmethod
+    def make_message(i):
+        return {
+            'id': i,
+            'name': f'Visitor {i}',
+            'email': f'visitor{i}@example.com',
+            'timestamp': time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(1700000000 + i * 60)),
+            'message': f'Hello, this is message number {i}. I would like to know more about your services.',
+        }
+
+    def add_messages(self, n):
+        with self.lock:
+            start = len(self.messages) + 1
+            self.messages.extend(self.make_message(i) for i in range(start, start + n))
+            self._cache = {}
+            # Render now, so serving the next check costs the monitor no extra time
+            self.api_body_gzip()
+            self.admin_body()
+
+    def count(self, path):
+        with self.lock:
+            self.requests[path] += 1
+
+    def _cached(self, key, build):
+        with self.lock:
+            if key not in self._cache:
+                self._cache[key] = build()
+            return self._cache[key]
+
+    def api_body(self):
+        body = self._cached('api', lambda: json.dumps({'success': True, 'messages': self.messages}).encode())
+        return body, f'"v{len(self.messages)}"'
+
+    def api_page(self, after_id, limit=None):
+        """Messages after id after_id (ids are 1..n in order), at most limit of them"""
+        with self.lock:
+            end = len(self.messages) if limit is None else min(len(self.messages), max(after_id, 0) + limit)
+            page = {'success': True, 'messages': self.messages[max(after_id, 0):end]}
+            if end < len(self.messages):
+                page['next_cursor'] = str(end)
+        return json.dumps(page).encode()
+
+    def api_body_gzip(self):
+        return self._cached('api.gz', lambda: gzip.compress(self.api_body()[0], compresslevel=1))
+
+    def admin_body(self):
+        def build():
+            parts = [f'<html><body><h1>Contact Form Messages</h1><p>Total Messages: {len(self.messages)}</p>']
+            for msg in reversed(self.messages):
+                parts.append(
+                    f'<div class="message" data-id="{msg["id"]}">'
+                    f'<div class="header"><span class="name">{msg["name"]}</span> '
+                    f'<span class="email">{msg["email"]}</span> '
+                    f'<span class="time">{msg["timestamp"]}</span></div>'
+                    f'<div class="message-body">{msg["message"]}</div></div>\n')
+            parts.append('</body></html>')
+            return ''.join(parts).encode('utf-8')
+        return self._cached('admin', build)
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
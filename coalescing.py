@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+Digests for notification bursts
+
+While a channel is quiet every message gets its own notification. Once
+more than THRESHOLD messages have arrived for a channel within WINDOW
+seconds, ordinary messages are held and sent together as one digest
+(one summary email, one Discord post) when the oldest of them has waited
+DIGEST_WINDOW seconds or DIGEST_MAX of them are waiting. High-priority
+messages always go out on their own straight away.
+
+Whether a message is part of a burst is decided when it is queued and
+journaled with it (see outbox.py), so a check in a later process, such
+as the next cron run, still sends the burst as a digest.
+"""
+
+import re
+
+# Configuration
+CONFIG = {
+    'ENABLED': True,
+    'WINDOW': 600,          # seconds over which arrivals per channel are counted
+    'THRESHOLD': 10,        # arrivals within WINDOW that start digest mode
+    'DIGEST_WINDOW': 300,   # seconds a held message waits for others to join its digest
+    'DIGEST_MAX': 200,      # held messages that trigger a digest straight away
+    # A message is high priority if its 'priority' field is one of these,
+    # its body matches PRIORITY_PATTERN, or it comes from a PRIORITY_SENDERS address or domain
+    'PRIORITY_VALUES': ('high', 'urgent'),
+    'PRIORITY_PATTERN': r'\b(urgent|asap|emergency)\b',
+    'PRIORITY_SENDERS': (),
+    'DIGEST_PREVIEW': 120,  # characters of each message shown in a digest
+}
+
+def is_priority(msg):
+    """Check whether a message must be notified on its own right away"""
+    if str(msg.get('priority', '')).lower() in CONFIG['PRIORITY_VALUES']:
+        return True
+    if CONFIG['PRIORITY_PATTERN'] and re.search(CONFIG['PRIORITY_PATTERN'], str(msg.get('message', '')),
+                                                re.IGNORECASE):
+        return True
+    email = str(msg.get('email', '')).lower()
+    return any(email == sender or email.endswith('@' + sender) for sender in CONFIG['PRIORITY_SENDERS'])
+
+def is_burst(arrivals):
+    """Check whether this many messages queued for a channel within WINDOW make a burst"""
+    return CONFIG['ENABLED'] and arrivals >= CONFIG['THRESHOLD']
+
+def plan(entries, now):
+    """Split one channel's due outbox entries into (individual, digest, held_until)
+
+    The channel is in digest mode while any due entry was queued as part
+    of a burst. Held entries are left out of both lists and held_until is
+    when they are released as a digest (None if nothing is held).
+    """
+    if not CONFIG['ENABLED'] or not any(entry.get('burst') for entry in entries):
+        return entries, [], None
+
+    individual = [entry for entry in entries if is_priority(entry['message'])]
+    ordinary = [entry for entry in entries if not is_priority(entry['message'])]
+    if not ordinary:
+        return individual, [], None
+    release_at = min(entry['at'] for entry in ordinary) + CONFIG['DIGEST_WINDOW']
+    if now < release_at and len(ordinary) < CONFIG['DIGEST_MAX']:
+        return individual, [], release_at
+    return individual, ordinary, None
+
+def preview(msg):
+    """One line per message for digests"""
+    text = ' '.join(str(msg.get('message', '')).split())
+    if len(text) > CONFIG['DIGEST_PREVIEW']:
+        text = text[:CONFIG['DIGEST_PREVIEW']] + '...'
+    return f"[{msg.get('timestamp', 'Unknown')}] {msg.get('name', 'Unknown')} <{msg.get('email', 'Unknown')}>: {text}"
+
+def digest_subject(messages):
+    """Subject line of a digest email"""
+    return f"{len(messages)} new contact messages"
+
+def digest_body(messages):
+    """Plain-text body of a digest email"""
+    lines = [f"{len(messages)} contact form messages arrived during a burst and were collected into this digest:", '']
+    lines += [preview(msg) for msg in messages]
+    lines += ['', '---', 'Automated digest from your contact form monitor.']
+    return '\n'.join(lines)
@@ -3,17 +3,24 @@
 Contact Form Monitor - With proper browser headers
 """
 
-import requests
 import json
 import time
-import os
 from datetime import datetime
 from items import EMAIL, PASSWORD, API_KEY, API_URL
+from state_store import get_store
+from notifier import summarize
+from outbox import get_outbox
+from fetchers import NOT_MODIFIED
+from message_cursor import collect_new, load_cursor, page_params, request_params, save_cursor, track
+from message_diff import find_new, save_index
+from coalescing import digest_body, digest_subject
+from archive import archive_messages
+from metrics import instrument_check, stage
 
 # Configuration
 CONFIG = {
     'API_URL': API_URL,
-    'LAST_COUNT_FILE': 'last_message_count.txt',
+    'STATE_KEY': API_URL,  # endpoint name in the state store
     'CHECK_INTERVAL': 900,  # 15 minutes
     
     # Email notification settings
@@ -27,12 +34,18 @@ CONFIG = {
     'API_KEY': API_KEY
 }
 
+# Channels every new message is queued for in the outbox (desktop only
+# where win10toast is installed, see notify_channels)
+NOTIFY_CHANNELS = ('email', 'desktop')
+
+_session = None
+_fetched_validators = {}
+
 # Browser-like headers to avoid blocking
 HEADERS = {
     'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
     'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8',
     'Accept-Language': 'en-US,en;q=0.9',
-    'Accept-Encoding': 'gzip, deflate, br',
     'DNT': '1',
     'Connection': 'keep-alive',
     'Upgrade-Insecure-Requests': '1',
@@ -45,95 +58,147 @@ HEADERS = {
 
 
 def get_last_message_count():
-    """Get the last known message count from file"""
+    """Get the last known message count from the state store"""
     try:
-        if os.path.exists(CONFIG['LAST_COUNT_FILE']):
-            with open(CONFIG['LAST_COUNT_FILE'], 'r') as f:
-                return int(f.read().strip())
-        return 0
-    except:
+        with stage('state_read', op='last_count'):
+            return get_store().get_last_count(CONFIG['STATE_KEY'])
+    except Exception as e:
+        print(f"Error reading count: {e}")
         return 0
 
 def save_message_count(count):
-    """Save the current message count to file"""
+    """Save the current message count to the state store"""
     try:
-        with open(CONFIG['LAST_COUNT_FILE'], 'w') as f:
-            f.write(str(count))
+        with stage('state_write', op='count'):
+            get_store().save_count(CONFIG['STATE_KEY'], count)
     except Exception as e:
         print(f"Error saving count: {e}")
 
+def record_check(success, latency_ms, message_count=None, new_messages=(), notification_status=None):
+    """Record a check and the messages it notified about in the state store"""
+    try:
+        store = get_store()
+        with stage('state_write', op='record_check'):
+            store.record_check(CONFIG['STATE_KEY'], success, latency_ms, message_count,
+                               len(new_messages), notification_status)
+            if new_messages:
+                store.mark_seen(CONFIG['STATE_KEY'], new_messages, notified=success)
+    except Exception as e:
+        print(f"Error recording check: {e}")
+
+def get_session():
+    """Return the persistent session, created on first use"""
+    global _session
+    if _session is None:
+        # Imported here so a run that fetches nothing (help, outbox replay) starts faster
+        import requests
+        from urllib3.util.request import ACCEPT_ENCODING
+        _session = requests.Session()
+        _session.headers.update(HEADERS)
+        _session.headers['Accept-Encoding'] = ACCEPT_ENCODING  # gzip, deflate and br/zstd when decodable
+    return _session
+
 def get_current_messages():
-    """Fetch current messages from the API endpoint with proper headers"""
+    """Fetch current messages from the API endpoint with proper headers
+    
+    Sends the ETag / Last-Modified validators of the last processed
+    response, and returns NOT_MODIFIED without downloading the body when
+    the server answers 304. Once a message has been processed only newer
+    ones are asked for (see message_cursor.py) and returned as Incremental.
+    """
+    import requests
+    
     try:
         print("Fetching messages from API...")
         
-        # Create a session for better connection handling
-        session = requests.Session()
-        session.headers.update(HEADERS)
+        # Reuse one session (and its pooled connection) across checks
+        session = get_session()
         
-        params = {'api_key': CONFIG['API_KEY']}
-        print(f"Using API key: {CONFIG['API_KEY'][:20]}...")  # Only show first 20 chars for security
+        cursor = load_cursor(CONFIG['STATE_KEY'])
+        params = {'api_key': CONFIG['API_KEY'], **request_params(cursor)}
+        # Never print any part of the key, the Actions logs are public
+        print(f"API key configured: {'yes' if CONFIG['API_KEY'] else 'no'}")
+        
+        # Ask only for the body if it changed since the last processed response
+        conditional_headers = {}
+        try:
+            with stage('state_read', op='validators'):
+                etag, last_modified = get_store().get_validators(CONFIG['STATE_KEY'])
+        except Exception as e:
+            print(f"Error reading cached validators: {e}")
+            etag, last_modified = None, None
+        if etag:
+            conditional_headers['If-None-Match'] = etag
+        if last_modified:
+            conditional_headers['If-Modified-Since'] = last_modified
         
-        # Make the request with headers and session
-        response = session.get(
-            CONFIG['API_URL'], 
-            params=params, 
-            timeout=30,
-            stream=False,
-            allow_redirects=True
-            # verify=True  # Verify SSL certificates
-        )
+        with stage('http_fetch') as span:
+            try:
+                # Make the request with headers and session
+                response = session.get(
+                    CONFIG['API_URL'], 
+                    params=params, 
+                    headers=conditional_headers,
+                    timeout=30,
+                    stream=False,
+                    allow_redirects=True
+                    # verify=True  # Verify SSL certificates
+                )
+            except requests.exceptions.SSLError as e:
+                print(f"SSL error: {e}")
+                print("Trying again without SSL verification...")
+                
+                # Retry without SSL verification as fallback
+                response = session.get(
+                    CONFIG['API_URL'], 
+                    params=params, 
+                    headers=conditional_headers,
+                    timeout=30,
+                    verify=False  # Disable SSL verification
+                )
+            
+            span.add_bytes(len(response.content))
+            if response.status_code != 200:
+                span.outcome = str(response.status_code)
         
         print(f"API Response Status: {response.status_code}")
-        print(f"Response headers: {dict(response.headers)}")
+        
+        if response.status_code == 304:
+            print("Messages not modified since last check")
+            return NOT_MODIFIED
         
         if response.status_code == 200:
-            print(f"Raw response (first 200 chars): {response.text[:200]}")
+            print(f"Response: {len(response.content)} bytes, "
+                  f"encoding: {response.headers.get('Content-Encoding', 'identity')}")
             
             try:
-                data = response.json()
-                print(f"JSON parsed successfully: {data}")
+                with stage('json_decode') as span:
+                    span.add_bytes(len(response.content))
+                    data = response.json()
                 
                 if data.get('success'):
-                    messages = data.get('messages', [])
-                    print(f"Found {len(messages)} messages")
+                    if cursor is None:
+                        messages = data.get('messages', [])
+                        track(CONFIG['STATE_KEY'], messages)
+                        print(f"Found {len(messages)} messages")
+                    else:
+                        messages = collect_new(CONFIG['STATE_KEY'], cursor, data,
+                                               lambda token: fetch_page(session, params, token))
+                        print(f"Found {len(messages)} message(s) after the cursor")
+                    # Cached once the messages have been processed
+                    _fetched_validators['etag'] = response.headers.get('ETag')
+                    _fetched_validators['last_modified'] = response.headers.get('Last-Modified')
                     return messages
                 else:
                     print(f"API error: {data.get('error', 'Unknown error')}")
                     return None
             except json.JSONDecodeError as e:
                 print(f"JSON decode error: {e}")
-                print(f"Raw response: {response.text}")
+                print(f"Raw response (first 200 chars): {response.text[:200]}")
                 return None
         else:
             print(f"HTTP error: {response.status_code}")
-            print(f"Response text: {response.text}")
-            return None
-            
-    except requests.exceptions.SSLError as e:
-        print(f"SSL error: {e}")
-        print("Trying again without SSL verification...")
-        
-        try:
-            # Retry without SSL verification as fallback
-            session = requests.Session()
-            session.headers.update(HEADERS)
-            
-            response = session.get(
-                CONFIG['API_URL'], 
-                params={'api_key': CONFIG['API_KEY']}, 
-                timeout=30,
-                verify=False  # Disable SSL verification
-            )
-            
-            if response.status_code == 200:
-                data = response.json()
-                if data.get('success'):
-                    return data.get('messages', [])
-            return None
-            
-        except Exception as retry_e:
-            print(f"Retry also failed: {retry_e}")
+            print(f"Response text: {response.text[:500]}")
             return None
             
     except requests.exceptions.ConnectionError as e:
@@ -146,18 +211,46 @@ def get_current_messages():
         print(f"Unexpected error: {e}")
         return None
 
+def fetch_page(session, params, token):
+    """Fetch and decode the page of a paginated response named by token"""
+    with stage('http_fetch', page='next') as span:
+        response = session.get(CONFIG['API_URL'], params=page_params(params, token), timeout=30)
+        span.add_bytes(len(response.content))
+        if response.status_code != 200:
+            span.outcome = str(response.status_code)
+    response.raise_for_status()
+    with stage('json_decode'):
+        data = response.json()
+    if not data.get('success'):
+        raise ValueError(f"API error on a later page: {data.get('error', 'Unknown error')}")
+    return data
+
+def save_validators():
+    """Cache the validators and cursor of the response whose messages were just processed"""
+    save_cursor(CONFIG['STATE_KEY'])
+    if not _fetched_validators:
+        return
+    try:
+        with stage('state_write', op='validators'):
+            get_store().save_validators(CONFIG['STATE_KEY'], _fetched_validators.get('etag'),
+                                        _fetched_validators.get('last_modified'))
+        _fetched_validators.clear()
+    except Exception as e:
+        print(f"Error saving validators: {e}")
+
 def send_email_notification(new_messages):
-    """Send notification via email"""
+    """Send notification via email
+    
+    Returns True, or the messages whose email went out if sending failed
+    partway, so the outbox retries only the others.
+    """
+    sent = []
     try:
-        import smtplib
         from email.mime.text import MIMEText
         from email.mime.multipart import MIMEMultipart
+        from smtp_pool import get_manager
         
-        print("Connecting to email server...")
-        server = smtplib.SMTP(CONFIG['SMTP_SERVER'], CONFIG['SMTP_PORT'])
-        server.starttls()
-        server.login(CONFIG['EMAIL_USER'], CONFIG['EMAIL_PASS'])
-        
+        emails = []
         for msg in new_messages:
             email_msg = MIMEMultipart()
             email_msg['From'] = CONFIG['EMAIL_USER']
@@ -181,17 +274,43 @@ This is an automated notification from your contact form monitor.
             """
             
             email_msg.attach(MIMEText(body, 'plain'))
-            server.send_message(email_msg)
-            print(f"Email sent for message from {msg.get('name', 'Unknown')}")
+            emails.append(email_msg)
         
-        server.quit()
+        # Reuses an authenticated session when one is already open
+        server = get_manager(CONFIG['SMTP_SERVER'], CONFIG['SMTP_PORT'],
+                             CONFIG['EMAIL_USER'], CONFIG['EMAIL_PASS'])
+        server.send_many(emails, on_sent=lambda i: sent.append(new_messages[i]))
+        print(f"Sent {len(emails)} email(s)")
         return True
     except Exception as e:
         print(f"Email notification failed: {e}")
+        return sent
+
+def send_email_digest(new_messages):
+    """Send one summary email for a burst of messages"""
+    try:
+        from email.mime.text import MIMEText
+        from email.mime.multipart import MIMEMultipart
+        from smtp_pool import get_manager
+        
+        email_msg = MIMEMultipart()
+        email_msg['From'] = CONFIG['EMAIL_USER']
+        email_msg['To'] = CONFIG['NOTIFY_EMAIL']
+        email_msg['Subject'] = digest_subject(new_messages)
+        email_msg.attach(MIMEText(digest_body(new_messages), 'plain'))
+        
+        server = get_manager(CONFIG['SMTP_SERVER'], CONFIG['SMTP_PORT'],
+                             CONFIG['EMAIL_USER'], CONFIG['EMAIL_PASS'])
+        server.send_many([email_msg])
+        print(f"Sent a digest of {len(new_messages)} message(s)")
+        return True
+    except Exception as e:
+        print(f"Email digest failed: {e}")
         return False
 
 def send_desktop_notification(new_messages):
     """Send desktop notification (Windows)"""
+    sent = []
     try:
         # Try Windows toast notifications
         import win10toast
@@ -204,50 +323,113 @@ def send_desktop_notification(new_messages):
                 duration=10,
                 icon_path=None
             )
+            sent.append(msg)
         return True
     except ImportError:
         print("win10toast not installed. Install with: pip install win10toast")
         return False
     except Exception as e:
         print(f"Desktop notification failed: {e}")
+        return sent
+
+def send_desktop_digest(new_messages):
+    """Show one desktop notification for a burst of messages"""
+    try:
+        import win10toast
+        toaster = win10toast.ToastNotifier()
+        senders = ', '.join(dict.fromkeys(msg.get('name', 'Unknown') for msg in new_messages[:5]))
+        toaster.show_toast(digest_subject(new_messages), f"From: {senders}", duration=10, icon_path=None)
+        return True
+    except ImportError:
+        print("win10toast not installed. Install with: pip install win10toast")
         return False
+    except Exception as e:
+        print(f"Desktop notification failed: {e}")
+        return False
+
+def desktop_available():
+    """Check whether win10toast can be imported, without importing it"""
+    from importlib.util import find_spec
+    return find_spec('win10toast') is not None
+
+def notify_channels():
+    """NOTIFY_CHANNELS without desktop where there is no toast backend to show it"""
+    if desktop_available():
+        return NOTIFY_CHANNELS
+    return tuple(channel for channel in NOTIFY_CHANNELS if channel != 'desktop')
 
+def drain_outbox():
+    """Deliver queued notifications on every channel at once"""
+    senders = {'email': send_email_notification}
+    # Bursts are summarized instead of sent one by one
+    digest_senders = {'email': send_email_digest}
+    if desktop_available():
+        senders['desktop'] = send_desktop_notification
+        digest_senders['desktop'] = send_desktop_digest
+    return get_outbox().drain(senders, digest_senders=digest_senders)
+
+@instrument_check('api')
 def check_for_new_messages():
     """Main function to check for new messages and notify"""
     print(f"\n[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] Checking for new messages...")
     
     # Get current messages
+    fetch_started = time.monotonic()
     current_messages = get_current_messages()
+    latency_ms = (time.monotonic() - fetch_started) * 1000
     if current_messages is None:
         print("Could not fetch messages - API might be down")
+        record_check(False, latency_ms, notification_status='fetch_failed')
         return False
     
-    current_count = len(current_messages)
+    if current_messages is NOT_MODIFIED:
+        print("No new messages")
+        # Still retry notifications left in the outbox by earlier checks
+        results = drain_outbox()
+        record_check(True, latency_ms, notification_status=summarize(results) or 'not_modified')
+        return True
+    
     last_count = get_last_message_count()
+    # Diff by message fingerprint, so deleted or reordered messages do not hide new ones
+    new_messages, current_count = find_new(CONFIG['STATE_KEY'], current_messages, last_count)
     
-    print(f"Current messages: {current_count}, Last known: {last_count}")
+    if current_count is not None:
+        print(f"Current messages: {current_count}, Last known: {last_count}")
     
-    if current_count > last_count:
-        new_message_count = current_count - last_count
-        print(f"Found {new_message_count} new message(s)!")
+    if new_messages:
+        print(f"Found {len(new_messages)} new message(s)!")
         
-        # Get the new messages (last N messages)
-        new_messages = current_messages[-new_message_count:]
-        
-        # Send notifications
-        email_success = send_email_notification(new_messages)
-        desktop_success = send_desktop_notification(new_messages)
-        
-        if email_success or desktop_success:
-            print("Notifications sent!")
-            save_message_count(current_count)
-        else:
-            print("All notifications failed")
-            return False
+        # Journal before delivering so a failed channel is retried later
+        # from the outbox instead of by fetching the messages again
+        get_outbox().enqueue(CONFIG['STATE_KEY'], notify_channels(), new_messages)
     else:
         print("No new messages")
     
-    save_message_count(current_count)
+    # Kept locally so old messages can be looked up without fetching them again
+    archive_messages(CONFIG['STATE_KEY'], new_messages, current_messages)
+    if current_count is not None:
+        # A cursor fetch does not see deletions, so it leaves the count alone
+        save_message_count(current_count)
+    save_index(CONFIG['STATE_KEY'])
+    save_validators()
+    
+    # Send new and previously failed notifications on all channels at once
+    results = drain_outbox()
+    for result in results:
+        print(f"Notification {result}")
+    
+    # Retries of notifications that were already failing do not fail a
+    # check that found nothing new
+    if new_messages and results and not any(result.success for result in results):
+        print("All notifications failed, they stay queued in the outbox")
+        record_check(False, latency_ms, current_count, new_messages, summarize(results))
+        return False
+    
+    if any(result.success for result in results):
+        print("Notifications sent!")
+    elif results:
+        print("Earlier notifications are still failing, they stay queued in the outbox")
+    record_check(True, latency_ms, current_count, new_messages, summarize(results) or None)
     return True
 
 if __name__ == "__main__":
@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+"""
+Batched, rate-limit-aware Discord webhook dispatcher
+
+Packs up to 10 embeds into each webhook call, reuses one keep-alive
+connection pool and paces requests with a token bucket that follows the
+webhook's rate-limit headers, waiting out 429s instead of giving up.
+"""
+
+import logging
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from metrics import stage
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+CONFIG = {
+    'MAX_EMBEDS': 10,       # Discord's per-message embed limit
+    'RATE': 2.5,            # requests per second (webhooks allow 5 per 2s)
+    'BURST': 5,             # token bucket capacity
+    'MAX_RETRIES': 5,       # 429 retries per batch before giving up
+    'TIMEOUT': 10,
+    'DIGEST_FIELDS': 25,    # Discord's per-embed field limit
+}
+
+class TokenBucket:
+    """Thread-safe token bucket that can also be paused until a reset time"""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """Block until a token is available, then take it"""
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if now >= self.paused_until and self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = max(self.paused_until - now, (1 - self.tokens) / self.rate)
+            time.sleep(wait)
+
+    def pause(self, seconds):
+        """Hand out no tokens for the next `seconds`"""
+        with self.lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+            self.tokens = 0
+
+def preview_text(msg, length=200):
+    """Message body shortened for an embed field"""
+    text = msg.get('message', '')
+    return text[:length] + ("..." if len(text) > length else "")
+
+def build_embed(msg):
+    """Build the Discord embed for one contact message"""
+    return {
+        "title": "New Contact Message",
+        "color": 0x00ff00,
+        "fields": [
+            {"name": "Name", "value": msg.get('name', 'Unknown'), "inline": True},
+            {"name": "Email", "value": msg.get('email', 'Unknown'), "inline": True},
+            {"name": "Message", "value": preview_text(msg), "inline": False},
+            {"name": "Time", "value": msg.get('timestamp', 'Unknown'), "inline": True}
+        ]
+    }
+
+def build_digest_embed(messages):
+    """Build one embed summarizing a burst of contact messages"""
+    # Shorter previews keep 25 fields under Discord's 6000-character embed limit
+    fields = [{"name": f"{msg.get('name', 'Unknown')} <{msg.get('email', 'Unknown')}>"[:256],
+               "value": preview_text(msg, 150) or "(empty)", "inline": False}
+              for msg in messages[:CONFIG['DIGEST_FIELDS']]]
+    if len(messages) > CONFIG['DIGEST_FIELDS']:
+        fields[-1] = {"name": "More", "value": f"+{len(messages) - CONFIG['DIGEST_FIELDS'] + 1} more messages",
+                      "inline": False}
+    return {
+        "title": f"{len(messages)} New Contact Messages",
+        "color": 0x00ff00,
+        "fields": fields,
+    }
+
+class DiscordDispatcher:
+    """Sends embeds to one webhook in batches, respecting its rate limits"""
+
+    def __init__(self, webhook_url, session=None):
+        self.webhook_url = webhook_url
+        self.session = session or requests.Session()
+        self.session.mount('https://', HTTPAdapter(pool_connections=1, pool_maxsize=4))
+        self.bucket = TokenBucket(CONFIG['RATE'], CONFIG['BURST'])
+        self.requests_sent = 0
+
+    def _update_limits(self, response):
+        """Follow X-RateLimit-* headers so the next request is not rejected"""
+        remaining = response.headers.get('X-RateLimit-Remaining')
+        reset_after = response.headers.get('X-RateLimit-Reset-After')
+        if remaining is not None and reset_after is not None:
+            try:
+                if int(remaining) == 0:
+                    self.bucket.pause(float(reset_after))
+            except ValueError:
+                pass
+
+    def _retry_after(self, response):
+        """Return the seconds a 429 asks us to wait"""
+        try:
+            return float(response.json().get('retry_after'))
+        except (ValueError, TypeError, AttributeError):
+            pass
+        try:
+            return float(response.headers.get('Retry-After', 1))
+        except ValueError:
+            return 1.0
+
+    def post(self, payload):
+        """Post one webhook payload, waiting out rate limits. Returns True on success"""
+        for attempt in range(CONFIG['MAX_RETRIES'] + 1):
+            with stage('discord_wait'):
+                self.bucket.acquire()
+            with stage('discord_post') as span:
+                response = self.session.post(self.webhook_url, json=payload, timeout=CONFIG['TIMEOUT'])
+                span.add_bytes(len(response.request.body or b''))
+                if response.status_code not in (200, 204):
+                    span.outcome = str(response.status_code)
+            self.requests_sent += 1
+            self._update_limits(response)
+
+            if response.status_code in (200, 204):
+                return True
+            if response.status_code == 429:
+                retry_after = self._retry_after(response)
+                logger.warning(f"Discord rate limited, retrying in {retry_after:.2f}s")
+                self.bucket.pause(retry_after)
+                continue
+
+            logger.error(f"Discord notification failed with status: {response.status_code}")
+            return False
+
+        logger.error("Discord notification gave up after repeated rate limiting")
+        return False
+
+    def send_embeds(self, embeds, content=None):
+        """Send embeds in batches of CONFIG['MAX_EMBEDS'], returning the indexes of those posted
+
+        A failed batch is logged and the remaining batches are still sent,
+        so the caller can retry only the embeds that are missing.
+        """
+        posted = []
+        for start in range(0, len(embeds), CONFIG['MAX_EMBEDS']):
+            batch = range(start, min(start + CONFIG['MAX_EMBEDS'], len(embeds)))
+            payload = {"embeds": [embeds[i] for i in batch]}
+            if content:
+                payload["content"] = content
+            try:
+                if self.post(payload):
+                    posted.extend(batch)
+            except requests.exceptions.RequestException as e:
+                logger.error(f"Discord notification failed: {e}")
+        return posted
+
+    def send_messages(self, messages, content="🔔 New contact form message!"):
+        """Send one embed per contact message, returning the messages that were posted"""
+        return [messages[i] for i in self.send_embeds([build_embed(msg) for msg in messages], content)]
+
+    def send_digest(self, messages, content="🔔 New contact form messages!"):
+        """Send a burst of contact messages as a single post, returning True on success"""
+        return bool(self.send_embeds([build_digest_embed(messages)], content))
+
+_dispatchers = {}
+_dispatchers_lock = threading.Lock()
+
+def get_dispatcher(webhook_url):
+    """Return the shared dispatcher for a webhook, creating it on first use"""
+    with _dispatchers_lock:
+        dispatcher = _dispatchers.get(webhook_url)
+        if dispatcher is None:
+            dispatcher = DiscordDispatcher(webhook_url)
+            _dispatchers[webhook_url] = dispatcher
+        return dispatcher
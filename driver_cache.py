@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+"""
+Cached ChromeDriver / Chrome discovery and reusable browser profiles
+
+Probing every candidate path and asking each binary for its version costs
+time on every cold start, so the resolved paths and versions are kept in a
+small JSON file and only re-probed when a binary changes or the cache gets
+old. Chrome also starts faster with a profile directory it has already
+initialized, so profiles are kept between runs instead of thrown away.
+"""
+
+import json
+import logging
+import os
+import platform
+import shutil
+import subprocess
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+CONFIG = {
+    'CACHE_FILE': os.getenv('MONITOR_DRIVER_CACHE', '.chromedriver_cache.json'),
+    'CACHE_MAX_AGE': 7 * 86400,   # seconds before paths are probed again regardless
+    # Reused Chrome user-data-dirs; concurrent browsers get -1, -2, ... suffixes
+    'PROFILE_DIR': os.getenv('MONITOR_CHROME_PROFILE', '.chrome_profile'),
+    'VERSION_TIMEOUT': 10,
+}
+
+CANDIDATE_DRIVERS = {
+    'windows': [
+        'chromedriver.exe',
+        r'C:\chromedriver\chromedriver.exe',
+        r'C:\Program Files\chromedriver\chromedriver.exe',
+    ],
+    'other': [
+        '/usr/bin/chromedriver',
+        '/usr/bin/chromium-chromedriver',
+        '/usr/local/bin/chromedriver',
+        '/snap/bin/chromium.chromedriver',
+        'chromedriver',
+    ],
+}
+
+CANDIDATE_BROWSERS = {
+    'windows': [],
+    'other': [
+        '/usr/bin/chromium-browser',
+        '/usr/bin/chromium',
+        '/usr/bin/google-chrome',
+        '/snap/bin/chromium',
+    ],
+}
+
+def _resolve(path):
+    """Return an absolute path for a candidate, looking bare names up on PATH"""
+    if os.path.dirname(path):
+        return path if os.path.exists(path) else None
+    return shutil.which(path)
+
+def _version(path):
+    """Return the output of `path --version`, or None"""
+    if path is None:
+        return None
+    try:
+        result = subprocess.run([path, '--version'], capture_output=True, text=True,
+                                timeout=CONFIG['VERSION_TIMEOUT'])
+        return result.stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+def _mtime(path):
+    try:
+        return os.stat(path).st_mtime if path else None
+    except OSError:
+        return None
+
+def _probe():
+    """Find the first existing driver and browser and ask them for their versions"""
+    system = platform.system().lower()
+    key = 'windows' if system == 'windows' else 'other'
+    driver_path = next(filter(None, map(_resolve, CANDIDATE_DRIVERS[key])), None)
+    chrome_binary = next(filter(None, map(_resolve, CANDIDATE_BROWSERS[key])), None)
+    return {
+        'system': system,
+        'driver_path': driver_path,
+        'chrome_binary': chrome_binary,
+        'driver_version': _version(driver_path),
+        'chrome_version': _version(chrome_binary),
+        'driver_mtime': _mtime(driver_path),
+        'chrome_mtime': _mtime(chrome_binary),
+        'probed_at': time.time(),
+    }
+
+def _is_current(entry):
+    """Check a cached entry still describes the binaries on disk"""
+    return (entry.get('system') == platform.system().lower()
+            and time.time() - entry.get('probed_at', 0) < CONFIG['CACHE_MAX_AGE']
+            and _mtime(entry.get('driver_path')) == entry.get('driver_mtime')
+            and _mtime(entry.get('chrome_binary')) == entry.get('chrome_mtime'))
+
+def find_binaries():
+    """Return the ChromeDriver and Chrome paths and versions, probing only when needed
+
+    The dict has driver_path, chrome_binary, driver_version and
+    chrome_version; a path is None when nothing was found, in which case
+    Selenium Manager is left to locate or download one.
+    """
+    try:
+        with open(CONFIG['CACHE_FILE'], 'r') as f:
+            entry = json.load(f)
+        if _is_current(entry):
+            return entry
+    except (OSError, ValueError):
+        pass
+
+    entry = _probe()
+    logger.info(f"Found ChromeDriver {entry['driver_path']} ({entry['driver_version'] or 'unknown version'}), "
+                f"Chrome {entry['chrome_binary']} ({entry['chrome_version'] or 'unknown version'})")
+    tmp_path = CONFIG['CACHE_FILE'] + '.tmp'
+    try:
+        with open(tmp_path, 'w') as f:
+            json.dump(entry, f)
+        os.replace(tmp_path, CONFIG['CACHE_FILE'])
+    except OSError as e:
+        logger.warning(f"Could not cache driver discovery: {e}")
+    return entry
+
+_profiles_in_use = set()
+_profiles_lock = threading.Lock()
+
+def _locked_by_live_chrome(path):
+    """Check for another process's Chrome holding the profile (Linux/macOS lock symlink)"""
+    try:
+        target = os.readlink(os.path.join(path, 'SingletonLock'))
+        pid = int(target.rsplit('-', 1)[1])
+    except (OSError, ValueError, IndexError):
+        return False
+    try:
+        os.kill(pid, 0)
+        return True
+    except OSError:
+        return False
+
+def acquire_profile():
+    """Reserve a reusable user-data-dir for one browser, or None to use a throwaway one"""
+    if not CONFIG['PROFILE_DIR']:
+        return None
+    with _profiles_lock:
+        for index in range(16):
+            path = os.path.abspath(CONFIG['PROFILE_DIR'] + (f'-{index}' if index else ''))
+            if path in _profiles_in_use or _locked_by_live_chrome(path):
+                continue
+            _profiles_in_use.add(path)
+            return path
+    return None
+
+def release_profile(path):
+    """Hand a profile back once its browser has quit"""
+    with _profiles_lock:
+        _profiles_in_use.discard(path)
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+Cost-aware fetcher selection across the monitor backends
+
+Tries the cheapest backend that has been working for an endpoint first
+and escalates to heavier ones (Chrome) only when the lighter ones fail.
+Rolling success rates and latencies are kept in the state store, so a
+backend known to be failing is skipped on later runs too.
+"""
+
+import logging
+import time
+
+from metrics import stage
+from state_store import get_store
+
+logger = logging.getLogger(__name__)
+
+# Returned by a backend when the server says nothing changed since the last fetch
+NOT_MODIFIED = object()
+
+# Configuration
+CONFIG = {
+    # Expected latency (ms) of each backend before any has been measured
+    'DEFAULT_COST_MS': {
+        'api': 1000,
+        'selenium': 10000,
+    },
+    'FAILURE_THRESHOLD': 2,    # consecutive failures before a backend is skipped
+    'RETRY_AFTER': 6 * 3600,   # seconds before a skipped backend is probed again
+}
+
+def _fetch_api(resident=None):
+    from contact_monitor import get_current_messages
+    return get_current_messages()
+
+def _fetch_selenium(resident=None):
+    from selenium_contact_monitor import get_current_messages
+    return get_current_messages(resident)
+
+def _processed_api():
+    from contact_monitor import save_validators
+    save_validators()
+
+# Backend name -> (fetch function, hook run once its messages are processed)
+BACKENDS = {
+    'api': (_fetch_api, _processed_api),
+    'selenium': (_fetch_selenium, None),
+}
+
+def is_known_failing(stats, now=None):
+    """Check whether stats say a backend has been failing recently"""
+    if stats is None:
+        return False
+    success_rate, _, failures, last_attempt_at = stats
+    now = now or time.time()
+    return (failures >= CONFIG['FAILURE_THRESHOLD'] and success_rate < 0.5
+            and now - last_attempt_at < CONFIG['RETRY_AFTER'])
+
+def rank_backends(endpoint, backends):
+    """Order backends cheapest first, moving known-failing ones to the end"""
+    try:
+        stats = get_store().get_backend_stats(endpoint)
+    except Exception as e:
+        logger.warning(f"Could not read backend stats: {e}")
+        stats = {}
+
+    def cost(name):
+        latency = stats.get(name, (None, None))[1]
+        return latency if latency is not None else CONFIG['DEFAULT_COST_MS'].get(name, 5000)
+
+    working = [name for name in backends if not is_known_failing(stats.get(name))]
+    failing = [name for name in backends if name not in working]
+    if failing:
+        logger.info(f"Trying recently failing backend(s) last: {', '.join(failing)}")
+    return sorted(working, key=cost) + sorted(failing, key=cost)
+
+def fetch_messages(endpoint, backends=('api', 'selenium'), resident=None):
+    """Fetch messages from the cheapest working backend
+
+    Returns (messages, backend). messages is a list, NOT_MODIFIED, or None
+    when every backend failed.
+    """
+    for name in rank_backends(endpoint, backends):
+        fetch, _ = BACKENDS[name]
+        started = time.monotonic()
+        with stage('fetch', backend=name) as span:
+            try:
+                messages = fetch(resident)
+            except Exception as e:
+                logger.error(f"Backend {name} raised: {e}")
+                messages = None
+            if messages is None:
+                span.outcome = 'failed'
+            elif messages is NOT_MODIFIED:
+                span.outcome = 'not_modified'
+        latency_ms = (time.monotonic() - started) * 1000
+
+        try:
+            get_store().record_backend_result(endpoint, name, messages is not None, latency_ms)
+        except Exception as e:
+            logger.warning(f"Could not record backend stats: {e}")
+
+        if messages is not None:
+            logger.info(f"Fetched with backend {name} in {latency_ms:.0f} ms")
+            return messages, name
+        logger.warning(f"Backend {name} failed after {latency_ms:.0f} ms, trying the next one")
+
+    return None, None
+
+def mark_processed(backend):
+    """Run the backend's hook once its messages are safely processed"""
+    hook = BACKENDS.get(backend, (None, None))[1]
+    if hook:
+        hook()
@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+"""
+JSON extraction for API responses rendered inside a browser page
+"""
+
+import html
+import json
+import re
+
+_decoder = json.JSONDecoder()
+
+# Chrome renders a JSON response as <html>...<pre>{...}</pre>...</html>
+_PRE_RE = re.compile(r'<pre[^>]*>(.*?)</pre>', re.DOTALL)
+
+def find_json_start(page_text):
+    """Return the offset of the API's JSON object in the page, or -1"""
+    start_idx = page_text.find('{"success"')
+    if start_idx == -1:
+        start_idx = page_text.find('{"')
+    return start_idx
+
+def extract_json(page_text):
+    """Decode the first JSON object in page_text
+
+    Decoding starts in place at the object's offset, so the page is never
+    sliced or copied and braces inside strings are handled by the real JSON
+    parser. When the object sits in a browser-rendered <pre> block that
+    holds HTML entities (Chrome escapes '&', '<' and '>'), the block is
+    unescaped and decoded again.
+
+    Raises json.JSONDecodeError if no valid JSON object is found.
+    """
+    start_idx = find_json_start(page_text)
+    if start_idx == -1:
+        raise json.JSONDecodeError("No JSON object found", page_text, 0)
+
+    data = None
+    try:
+        data, end_idx = _decoder.raw_decode(page_text, start_idx)
+        if page_text.find('&', start_idx, end_idx) == -1:
+            return data
+    except json.JSONDecodeError:
+        if '&' not in page_text:
+            raise
+
+    match = _PRE_RE.search(page_text)
+    if not match:
+        # Not browser-wrapped, so any '&' is genuine response content
+        if data is None:
+            raise json.JSONDecodeError("Unparseable JSON object", page_text, start_idx)
+        return data
+    body = html.unescape(match.group(1))
+    data, _ = _decoder.raw_decode(body, max(find_json_start(body), 0))
+    return data
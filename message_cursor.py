@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+"""
+Cursor-based incremental fetching of contact messages
+
+Instead of downloading the whole history on every check, the fetch sends
+the id (or timestamp) of the newest message already processed, follows
+paginated responses lazily and stops at the first page that reaches known
+messages. A quiet poll then transfers an empty page instead of the inbox.
+
+Request parameters: since_id=<last id> (or since=<last timestamp>) and
+limit=<page size>. A paginated response carries "next_cursor", sent back as
+cursor=<token> for the next page. Servers that ignore the parameters and
+return the full history still work: known messages are filtered out here.
+"""
+
+import logging
+
+from metrics import stage
+from state_store import get_store
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+CONFIG = {
+    'ENABLED': True,
+    'SINCE_ID_PARAM': 'since_id',
+    'SINCE_PARAM': 'since',
+    'LIMIT_PARAM': 'limit',
+    'PAGE_PARAM': 'cursor',
+    'PAGE_SIZE': 200,
+    'MAX_PAGES': 50,   # per check; the rest is picked up by the next one
+}
+
+# Cursor of the messages fetched but not processed yet, per endpoint
+_pending = {}
+
+class Incremental(list):
+    """Messages newer than the stored cursor, from a fetch that sent one
+
+    Unlike a plain message list this is not the whole history, so message
+    counts do not apply to it.
+    """
+
+def numeric_id(msg):
+    """Return a message's id as an int, or None if it has no numeric id"""
+    value = msg.get('id')
+    if isinstance(value, int) and not isinstance(value, bool):
+        return value
+    if isinstance(value, str) and value.isdigit():
+        return int(value)
+    return None
+
+def load_cursor(endpoint):
+    """Return the endpoint's stored (last_id, last_timestamp), or None for a full fetch"""
+    if not CONFIG['ENABLED']:
+        return None
+    try:
+        with stage('state_read', op='cursor'):
+            cursor = get_store().get_cursor(endpoint)
+    except Exception as e:
+        logger.warning(f"Could not read the fetch cursor, fetching everything: {e}")
+        return None
+    if cursor is None or cursor == (None, None):
+        return None
+    return tuple(cursor)
+
+def request_params(cursor):
+    """Query parameters asking the server for messages after cursor only"""
+    if cursor is None:
+        return {}
+    last_id, last_timestamp = cursor
+    params = {CONFIG['LIMIT_PARAM']: CONFIG['PAGE_SIZE']}
+    if last_id is not None:
+        params[CONFIG['SINCE_ID_PARAM']] = last_id
+    else:
+        params[CONFIG['SINCE_PARAM']] = last_timestamp
+    return params
+
+def page_params(params, token):
+    """Return the first request's params plus the next_cursor token of a later page"""
+    return {**params, CONFIG['PAGE_PARAM']: token}
+
+def is_known(msg, cursor, seen):
+    """Check whether a message is at or before the cursor
+
+    Ids are compared when both sides have one, otherwise timestamps; a
+    message with the cursor's own timestamp is looked up with seen(msg).
+    """
+    last_id, last_timestamp = cursor
+    msg_id = numeric_id(msg)
+    if msg_id is not None and last_id is not None:
+        return msg_id <= last_id
+    timestamp = msg.get('timestamp')
+    if timestamp is not None and last_timestamp is not None:
+        timestamp = str(timestamp)
+        if timestamp != last_timestamp:
+            return timestamp < last_timestamp
+    return seen(msg)
+
+def is_before(msg, cursor):
+    """Check whether a message is strictly older than the cursor's newest message"""
+    last_id, last_timestamp = cursor
+    msg_id = numeric_id(msg)
+    if msg_id is not None and last_id is not None:
+        return msg_id < last_id
+    timestamp = msg.get('timestamp')
+    if timestamp is not None and last_timestamp is not None:
+        return str(timestamp) < last_timestamp
+    return False
+
+def _newest_first(messages):
+    if len(messages) < 2:
+        return False
+    first, last = messages[0], messages[-1]
+    if numeric_id(first) is not None and numeric_id(last) is not None:
+        return numeric_id(first) > numeric_id(last)
+    return str(first.get('timestamp', '')) > str(last.get('timestamp', ''))
+
+def iter_new_messages(page, fetch_page, cursor, seen):
+    """Yield the messages newer than cursor from page and the pages after it
+
+    fetch_page(token) returns the decoded page for a next_cursor token and
+    is only called while the server offers one, and never after a
+    newest-first page that already reached a known message. Pages holding
+    only messages an earlier, cut-off check already processed do not count
+    against MAX_PAGES, so a newest-first walk gets further on every check.
+    Returns True if MAX_PAGES cut off a newest-first walk, which leaves the
+    oldest new messages unfetched.
+    """
+    pages = 0
+    while True:
+        messages = page.get('messages') or []
+        reached_known = fresh = False
+        for msg in messages:
+            if is_known(msg, cursor, seen):
+                reached_known = True
+            else:
+                fresh = fresh or not seen(msg)
+                yield msg
+        token = page.get('next_cursor')
+        newest_first = _newest_first(messages)
+        if not token or (reached_known and newest_first):
+            return False
+        pages += fresh
+        if pages >= CONFIG['MAX_PAGES']:
+            logger.warning(f"Stopped after {CONFIG['MAX_PAGES']} pages, the next check continues")
+            return newest_first
+        page = fetch_page(token)
+
+def advance(cursor, messages):
+    """Return cursor moved past messages"""
+    last_id, last_timestamp = cursor or (None, None)
+    for msg in messages:
+        msg_id = numeric_id(msg)
+        if msg_id is not None and (last_id is None or msg_id > last_id):
+            last_id = msg_id
+        timestamp = msg.get('timestamp')
+        if timestamp is not None and (last_timestamp is None or str(timestamp) > last_timestamp):
+            last_timestamp = str(timestamp)
+    return last_id, last_timestamp
+
+def collect_new(endpoint, cursor, page, fetch_page):
+    """Fetch every message newer than cursor, oldest first, and remember the advanced cursor
+
+    Returns an Incremental, or the plain message list when the server
+    ignored the cursor and answered with the whole history. Servers that
+    treat since/since_id as inclusive send the cursor's own message back;
+    it is filtered out like any other known message, and only a message
+    strictly older than the cursor shows the parameters were ignored.
+    """
+    store = get_store()
+    seen = lambda msg: store.is_seen(endpoint, msg)
+    first = page.get('messages') or []
+    if not page.get('next_cursor') and any(is_before(msg, cursor) for msg in first):
+        # The server ignored the cursor and sent the whole history, which
+        # is diffed in full like a fetch without a cursor
+        _pending[endpoint] = advance(cursor, first)
+        return list(first)
+    walked = []
+    walk = iter_new_messages(page, fetch_page, cursor, seen)
+    while True:
+        try:
+            walked.append(next(walk))
+        except StopIteration as stop:
+            cut_off = stop.value
+            break
+    # Messages processed by an earlier check that was cut off are skipped
+    messages = Incremental(msg for msg in walked if not seen(msg))
+    if all(numeric_id(msg) is not None for msg in messages):
+        messages.sort(key=numeric_id)
+    if cut_off:
+        # The messages between the cursor and the last page fetched are
+        # still missing, so the next check starts from the same cursor
+        _pending.pop(endpoint, None)
+    else:
+        _pending[endpoint] = advance(cursor, walked)
+    return messages
+
+def track(endpoint, messages):
+    """Remember the cursor after a full fetch, so the next fetch can be incremental"""
+    _pending[endpoint] = advance(None, messages)
+
+def save_cursor(endpoint):
+    """Store the cursor of the messages that were just processed"""
+    cursor = _pending.pop(endpoint, None)
+    if cursor is None or cursor == (None, None):
+        return
+    try:
+        with stage('state_write', op='cursor'):
+            get_store().save_cursor(endpoint, *cursor)
+    except Exception as e:
+        logger.warning(f"Could not save the fetch cursor: {e}")
@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+"""
+New, removed and changed messages from a fingerprint index
+
+Every message is reduced to two 8-byte digests: its key (a hash of the
+id when it has one, otherwise of name, email, timestamp and body) and a
+hash of its content. The digests of every message seen for an endpoint are
+kept as a packed array in the state store (16 bytes per message), and a
+fetch is diffed against them with set operations in O(n). Deleted or
+reordered messages no longer hide new ones, unlike comparing counts.
+"""
+
+import logging
+from collections import namedtuple
+from itertools import chain
+
+from message_cursor import Incremental
+from metrics import stage
+from state_store import content_digest, get_store, key_digest
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+CONFIG = {
+    # Incremental updates are appended as chunks and folded back into one
+    # chunk once there are this many
+    'MAX_CHUNKS': 64,
+}
+
+# new and changed are message lists in fetch order, removed the key digests of messages now gone
+Diff = namedtuple('Diff', 'new removed changed')
+
+# Pending index update per endpoint: ('replace' | 'append', packed digests)
+_pending = {}
+
+def pack(entries):
+    """Pack {key: content} digests into bytes, 16 per message"""
+    return b''.join(chain.from_iterable(entries.items()))
+
+class MessageIndex:
+    """Key digest -> content digest of every message of an endpoint"""
+
+    def __init__(self, entries=None, chunks=1):
+        self.entries = entries if entries is not None else {}
+        self.chunks = chunks
+
+    @classmethod
+    def unpack(cls, chunks):
+        """Build the index from packed chunks; later chunks win for the same key"""
+        packed = b''.join(chunks)
+        keys = [packed[i:i + 8] for i in range(0, len(packed), 16)]
+        contents = [packed[i:i + 8] for i in range(8, len(packed), 16)]
+        return cls(dict(zip(keys, contents)), len(chunks))
+
+    def __len__(self):
+        return len(self.entries)
+
+    def diff(self, messages):
+        """Compare a full fetch with the index, returning (Diff, {key: content} of messages)"""
+        entries = self.entries
+        current = {}
+        new = []
+        changed = []
+        for msg in messages:
+            content = content_digest(msg)
+            key = key_digest(msg, content)
+            if key in current:
+                continue
+            current[key] = content
+            known = entries.get(key)
+            if known is None:
+                new.append(msg)
+            elif known != content:
+                changed.append(msg)
+        removed = list(entries.keys() - current.keys())
+        return Diff(new, removed, changed), current
+
+def load_index(endpoint):
+    """Return the endpoint's MessageIndex, or None if it has none yet"""
+    with stage('state_read', op='index') as span:
+        chunks = get_store().get_message_index(endpoint)
+        span.add_bytes(sum(len(chunk) for chunk in chunks))
+    return MessageIndex.unpack(chunks) if chunks else None
+
+def digests(messages):
+    """Return {key: content} digests of messages, keeping the first of duplicate keys"""
+    current = {}
+    for msg in messages:
+        content = content_digest(msg)
+        current.setdefault(key_digest(msg, content), content)
+    return current
+
+def find_new(endpoint, messages, last_count):
+    """Return (new messages, message count) for a fetch and prepare the index update
+
+    A full fetch is diffed against the index. The first check without an
+    index falls back on the stored count once (as earlier versions did) and
+    indexes every message. A cursor fetch (Incremental) holds only messages
+    after the newest processed one, so they are all new and their digests
+    are appended without reading the index. It cannot tell what was
+    deleted, so its count is None once the endpoint has an index. Call
+    save_index() once the new messages are safely queued.
+    """
+    if isinstance(messages, Incremental):
+        try:
+            indexed = bool(messages) and get_store().has_message_index(endpoint)
+        except Exception as e:
+            logger.warning(f"Could not read the message index: {e}")
+            indexed = False
+        if indexed:
+            _pending[endpoint] = ('append', pack(digests(messages)))
+            return list(messages), None
+        # Without an index the count is still the baseline for the first full fetch
+        return list(messages), last_count + len(messages)
+
+    try:
+        index = load_index(endpoint)
+    except Exception as e:
+        logger.warning(f"Could not read the message index: {e}")
+        index = None
+
+    if index is None:
+        new = messages[last_count - len(messages):] if len(messages) > last_count else []
+        with stage('diff', mode='baseline'):
+            _pending[endpoint] = ('replace', pack(digests(messages)))
+        return list(new), len(messages)
+
+    with stage('diff', mode='full'):
+        diff, current = index.diff(messages)
+    if diff.removed or diff.changed:
+        logger.info(f"{len(diff.removed)} message(s) removed and {len(diff.changed)} changed since the last check")
+    if diff.new or diff.removed or diff.changed or index.chunks > 1:
+        _pending[endpoint] = ('replace', pack(current))
+    return diff.new, len(current)
+
+def save_index(endpoint):
+    """Store the index update prepared by the last find_new() for the endpoint"""
+    update = _pending.pop(endpoint, None)
+    if update is None:
+        return
+    mode, packed = update
+    try:
+        store = get_store()
+        with stage('state_write', op='index') as span:
+            span.add_bytes(len(packed))
+            if mode == 'replace':
+                store.replace_message_index(endpoint, packed)
+            elif store.append_message_index(endpoint, packed) >= CONFIG['MAX_CHUNKS']:
+                # Fold the appended chunks back into one
+                store.replace_message_index(endpoint, pack(load_index(endpoint).entries))
+    except Exception as e:
+        logger.warning(f"Could not save the message index: {e}")
@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+"""
+Per-stage timing of monitor checks
+
+Stages of a check (driver setup, page load, JSON extraction, state reads
+and writes, each notification channel) are wrapped in stage() and their
+durations, byte counts and outcomes recorded. Process totals are exported
+in the Prometheus text format and every check gets a JSON summary of its
+own stages.
+"""
+
+import contextvars
+import functools
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+CONFIG = {
+    # Rewritten after every check, e.g. for node_exporter's textfile collector
+    'PROM_FILE': os.getenv('MONITOR_METRICS_PROM'),
+    # One JSON summary per check is appended here
+    'SUMMARY_FILE': os.getenv('MONITOR_METRICS_JSON'),
+    'BUCKETS': (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60),
+    # Added to every exported series, e.g. {'worker': '0'} in a multi-site pool
+    'EXTRA_LABELS': {},
+}
+
+# The check the current thread (or notification worker) is part of
+_current_run = contextvars.ContextVar('monitor_check', default=None)
+
+class Span:
+    """One timed stage; the body may set outcome and add bytes"""
+
+    def __init__(self, name, labels):
+        self.name = name
+        self.labels = labels
+        self.outcome = 'ok'
+        self.bytes = 0
+        self.elapsed = 0.0
+
+    def add_bytes(self, count):
+        self.bytes += count
+
+    def to_dict(self):
+        record = {'stage': self.name, **self.labels, 'elapsed_ms': round(self.elapsed * 1000, 2),
+                  'outcome': self.outcome}
+        if self.bytes:
+            record['bytes'] = self.bytes
+        return record
+
+class Metrics:
+    """Process-wide stage totals: a duration histogram, outcomes and bytes per stage"""
+
+    def __init__(self, buckets=None):
+        self.buckets = tuple(buckets or CONFIG['BUCKETS'])
+        self.lock = threading.Lock()
+        self.durations = {}   # (stage, labels) -> [per-bucket counts..., sum, count]
+        self.outcomes = {}    # (stage, labels, outcome) -> count
+        self.bytes = {}       # (stage, labels) -> total
+
+    def observe(self, span, monitor=None):
+        labels = dict(span.labels)
+        if monitor:
+            # Keeps monitors sharing one process (the scheduler) apart
+            labels.setdefault('monitor', monitor)
+        key = (span.name, tuple(sorted(labels.items())))
+        with self.lock:
+            series = self.durations.setdefault(key, [0] * len(self.buckets) + [0.0, 0])
+            for i, bound in enumerate(self.buckets):
+                if span.elapsed <= bound:
+                    series[i] += 1
+            series[-2] += span.elapsed
+            series[-1] += 1
+            outcome_key = key + (span.outcome,)
+            self.outcomes[outcome_key] = self.outcomes.get(outcome_key, 0) + 1
+            if span.bytes:
+                self.bytes[key] = self.bytes.get(key, 0) + span.bytes
+
+    def to_prometheus(self):
+        """Render every series in the Prometheus text exposition format"""
+        lines = [
+            '# HELP monitor_stage_duration_seconds Time spent in each stage of a check',
+            '# TYPE monitor_stage_duration_seconds histogram',
+        ]
+        with self.lock:
+            for (stage, labels), series in sorted(self.durations.items()):
+                for bound, count in zip(self.buckets, series):
+                    lines.append(f"monitor_stage_duration_seconds_bucket{_labels(stage, labels, le=bound)} {count}")
+                lines.append(f"monitor_stage_duration_seconds_bucket{_labels(stage, labels, le='+Inf')} {series[-1]}")
+                lines.append(f"monitor_stage_duration_seconds_sum{_labels(stage, labels)} {series[-2]:.6f}")
+                lines.append(f"monitor_stage_duration_seconds_count{_labels(stage, labels)} {series[-1]}")
+
+            lines += [
+                '# HELP monitor_stage_outcomes_total Completed stages by outcome',
+                '# TYPE monitor_stage_outcomes_total counter',
+            ]
+            for (stage, labels, outcome), count in sorted(self.outcomes.items()):
+                lines.append(f"monitor_stage_outcomes_total{_labels(stage, labels, outcome=outcome)} {count}")
+
+            lines += [
+                '# HELP monitor_stage_bytes_total Bytes read or written by each stage',
+                '# TYPE monitor_stage_bytes_total counter',
+            ]
+            for (stage, labels), count in sorted(self.bytes.items()):
+                lines.append(f"monitor_stage_bytes_total{_labels(stage, labels)} {count}")
+        return '\n'.join(lines) + '\n'
+
+    def write_prometheus(self, path):
+        """Atomically replace path with the current metrics"""
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(self.to_prometheus())
+        os.replace(tmp_path, path)
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _labels(stage, labels, **extra):
+    pairs = [('stage', stage)] + list(CONFIG['EXTRA_LABELS'].items()) + list(labels) + list(extra.items())
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+class CheckRun:
+    """The stages recorded during one check of one monitor"""
+
+    def __init__(self, monitor):
+        self.monitor = monitor
+        self.started_at = time.time()
+        self.spans = []
+
+    def summary(self):
+        totals = {}
+        for span in self.spans:
+            totals[span.name] = round(totals.get(span.name, 0) + span.elapsed * 1000, 2)
+        check = next((span for span in reversed(self.spans) if span.name == 'check'), None)
+        return {
+            'monitor': self.monitor,
+            'started_at': self.started_at,
+            'elapsed_ms': round(check.elapsed * 1000, 2) if check else None,
+            'outcome': check.outcome if check else None,
+            'totals_ms': totals,
+            'stages': [span.to_dict() for span in self.spans],
+        }
+
+    def brief(self):
+        """e.g. 'driver_setup=2310ms page_load=840ms notify[email]=410ms'"""
+        parts = []
+        for span in self.spans:
+            if span.name == 'check':
+                continue
+            label = ','.join(str(value) for value in span.labels.values())
+            parts.append(f"{span.name}{f'[{label}]' if label else ''}={span.elapsed * 1000:.0f}ms")
+        return ' '.join(parts)
+
+_metrics = Metrics()
+
+def get_metrics():
+    """Return the process-wide Metrics"""
+    return _metrics
+
+@contextmanager
+def stage(name, **labels):
+    """Time the body as one stage of the current check
+
+    The yielded Span takes byte counts and an outcome other than 'ok'; an
+    exception escaping the body is recorded as outcome 'error'.
+    """
+    span = Span(name, labels)
+    started = time.perf_counter()
+    try:
+        yield span
+    except BaseException:
+        span.outcome = 'error'
+        raise
+    finally:
+        span.elapsed = time.perf_counter() - started
+        run = _current_run.get()
+        _metrics.observe(span, run.monitor if run else None)
+        if run is not None:
+            run.spans.append(span)
+
+def instrument_check(monitor):
+    """Decorate a monitor's check function so each call is summarized and exported
+
+    A return value of False marks the check failed.
+    """
+    def decorator(check):
+        @functools.wraps(check)
+        def wrapper(*args, **kwargs):
+            run = CheckRun(monitor)
+            token = _current_run.set(run)
+            try:
+                with stage('check', monitor=monitor) as span:
+                    result = check(*args, **kwargs)
+                    if result is False:
+                        span.outcome = 'failed'
+                return result
+            finally:
+                _current_run.reset(token)
+                export(run)
+        return wrapper
+    return decorator
+
+def export(run):
+    """Log a one-line stage breakdown and write the configured metric files"""
+    logger.info(f"Stage timings ({run.monitor}): {run.brief()}")
+    try:
+        if CONFIG['SUMMARY_FILE']:
+            with open(CONFIG['SUMMARY_FILE'], 'a', encoding='utf-8') as f:
+                f.write(json.dumps(run.summary(), separators=(',', ':')) + '\n')
+        if CONFIG['PROM_FILE']:
+            _metrics.write_prometheus(CONFIG['PROM_FILE'])
+    except OSError as e:
+        logger.warning(f"Could not export metrics: {e}")
@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+Contact Form Monitor command line
+
+One entry point for every way of running the monitors:
+  python -m monitor check selenium [--if-due]   one check, exit status 1 if it failed
+  python -m monitor daemon api:auto selenium    run checks on intervals (see scheduler.py)
+  python -m monitor daemon --sites sites.json   many sites with a worker pool (see multi_site.py)
+  python -m monitor replay selenium [--list]    deliver what is queued in the outbox, no fetching
+  python -m monitor bench imports               run a benchmark from benchmarks/
+
+Only the modules the chosen subcommand needs are imported, and the
+monitors import selenium, requests and the email modules only once a
+check or a notification needs them, so a cold start stays cheap.
+"""
+
+import argparse
+import importlib
+import logging
+import os
+import sys
+
+logger = logging.getLogger(__name__)
+
+# Backend -> monitor module and its check function
+MONITORS = {
+    'api': ('contact_monitor', 'check_for_new_messages'),
+    'selenium': ('selenium_contact_monitor', 'check_for_new_messages'),
+    'admin': ('admin_scraper_contact_monitor', 'check_messages'),
+}
+
+BENCH_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmarks')
+
+def load_monitor(backend):
+    return importlib.import_module(MONITORS[backend][0])
+
+def run_check(args):
+    monitor = load_monitor(args.backend)
+    if args.if_due:
+        from adaptive_interval import is_due
+        if not is_due(monitor.CONFIG['STATE_KEY']):
+            logger.info("Not due yet according to the adaptive interval, skipping this run")
+            return 0
+    try:
+        success = getattr(monitor, MONITORS[args.backend][1])()
+    except Exception as e:
+        logger.error(f"Unexpected error: {e}")
+        return 1
+    if success:
+        logger.info("Monitor completed successfully")
+        return 0
+    logger.error("Monitor completed with errors")
+    return 1
+
+def run_daemon(args):
+    try:
+        if args.sites:
+            import multi_site
+            multi_site.main([args.sites] + ([f"--workers={args.workers}"] if args.workers else []))
+        else:
+            import scheduler
+            scheduler.main(args.jobs or ['selenium:auto'])
+    except KeyboardInterrupt:
+        logger.info("Monitor stopped by user")
+    return 0
+
+def run_replay(args):
+    if args.backend == 'admin':
+        logger.error("The admin scraper sends email directly and has no outbox to replay")
+        return 1
+    from outbox import get_outbox
+    outbox = get_outbox()
+    if args.list:
+        for channel, entries in sorted(outbox.due().items()):
+            print(f"{channel}: {len(entries)} due")
+        print(f"{len(outbox.pending)} pending in {outbox.path}")
+        return 0
+    monitor = load_monitor(args.backend)
+    results = monitor.drain_outbox()
+    if not results:
+        print("Nothing due in the outbox")
+    for result in results:
+        print(f"Notification {result}")
+    return 0 if not results or any(result.success for result in results) else 1
+
+def run_bench(args):
+    sys.path.insert(0, BENCH_DIR)
+    bench = importlib.import_module(f"bench_{args.name}")
+    return bench.main(args.args) or 0
+
+def available_benchmarks():
+    try:
+        names = os.listdir(BENCH_DIR)
+    except OSError:
+        return []
+    return sorted(name[len('bench_'):-len('.py')] for name in names
+                  if name.startswith('bench_') and name.endswith('.py'))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m monitor', description="Contact form monitor")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    check = commands.add_parser('check', help="check once for new messages and notify")
+    check.add_argument('backend', nargs='?', choices=sorted(MONITORS), default='selenium')
+    check.add_argument('--if-due', action='store_true',
+                       help="skip the check until the adaptive interval since the last one has passed")
+    check.set_defaults(run=run_check)
+
+    daemon = commands.add_parser('daemon', help="check continuously")
+    daemon.add_argument('jobs', nargs='*', metavar='BACKEND[:INTERVAL[:NAME]]',
+                        help="scheduler jobs (default: selenium:auto)")
+    daemon.add_argument('--sites', help="monitor every site in this sites file instead")
+    daemon.add_argument('--workers', type=int, help="worker processes for --sites")
+    daemon.set_defaults(run=run_daemon)
+
+    replay = commands.add_parser('replay', help="deliver queued notifications without fetching")
+    replay.add_argument('backend', nargs='?', choices=sorted(MONITORS), default='selenium',
+                        help="monitor whose notification channels are used")
+    replay.add_argument('--list', action='store_true', help="only show what is queued")
+    replay.set_defaults(run=run_replay)
+
+    bench = commands.add_parser('bench', help="run a benchmark from benchmarks/")
+    bench.add_argument('name', choices=available_benchmarks())
+    bench.add_argument('args', nargs=argparse.REMAINDER, help="arguments for the benchmark")
+    bench.set_defaults(run=run_bench)
+
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    return args.run(args)
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,362 @@
+#!/usr/bin/env python3
+"""
+Monitor many sites from one config file, sharded across worker processes
+
+sites.json lists every site with its own backend, credentials, interval
+and notification channels. The sites are spread over a pool of worker
+processes sized to the CPU cores and, when any site needs Chrome, to the
+memory available for browsers. Each worker checks its sites one at a time
+with at most one warm browser, pointing the monitor modules' CONFIG at
+the site being checked.
+
+Credentials are referenced as "${VARIABLE}" and read from the environment
+so the file itself holds no secrets. See sites.example.json.
+"""
+
+import argparse
+import heapq
+import importlib
+import json
+import logging
+import multiprocessing
+import os
+import random
+import re
+import sys
+import time
+import types
+from urllib.parse import urlsplit
+
+# Set up logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(processName)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+# Configuration
+CONFIG = {
+    'SITES_FILE': os.getenv('MONITOR_SITES', 'sites.json'),
+    'OUTBOX_DIR': 'outbox',    # one outbox journal per site
+    'DEFAULT_INTERVAL': 900,   # 15 minutes
+    'DEFAULT_JITTER': 30,      # seconds added at random to every wait
+    # Memory set aside per worker browser when sizing the pool
+    'CHROME_MEMORY_MB': 1024,
+    # Relative cost of one check of each backend, used to balance the shards
+    'CHECK_COST': {'api': 1, 'admin': 2, 'selenium': 10},
+}
+
+# Backend -> monitor modules a site's settings are applied to; the last one
+# runs the check (the Selenium monitor's API backend lives in contact_monitor)
+BACKENDS = {
+    'api': ('contact_monitor',),
+    'admin': ('admin_scraper_contact_monitor',),
+    'selenium': ('contact_monitor', 'selenium_contact_monitor'),
+}
+
+# Channels each backend can notify on
+CHANNELS = {
+    'api': ('email', 'desktop'),
+    'admin': ('email',),
+    'selenium': ('email', 'discord'),
+}
+
+# Site setting -> monitor CONFIG key
+SETTINGS = {
+    'api_url': 'API_URL',
+    'api_key': 'API_KEY',
+    'admin_url': 'ADMIN_URL',
+    'admin_password': 'ADMIN_PASSWORD',
+    'email': 'EMAIL_USER',
+    'email_password': 'EMAIL_PASS',
+    'notify_email': 'NOTIFY_EMAIL',
+    'smtp_server': 'SMTP_SERVER',
+    'smtp_port': 'SMTP_PORT',
+    'discord_webhook': 'DISCORD_WEBHOOK',
+    'fetch_backends': 'FETCH_BACKENDS',
+}
+
+# The names the monitors import from items.py
+ITEMS_NAMES = ('EMAIL', 'PASSWORD', 'API_KEY', 'API_URL', 'ADMIN_URL', 'ADMIN_PASSWORD', 'DISCORD_WEBHOOK')
+
+_REFERENCE = re.compile(r'\$\{(\w+)\}')
+_SITE_NAME = re.compile(r'^[A-Za-z0-9_.-]+$')
+
+def _expand(value, site_name):
+    """Replace ${VARIABLE} references in a setting with environment values"""
+    if isinstance(value, list):
+        return [_expand(item, site_name) for item in value]
+    if not isinstance(value, str):
+        return value
+
+    def lookup(match):
+        variable = match.group(1)
+        if variable not in os.environ:
+            raise ValueError(f"Site '{site_name}' references ${{{variable}}}, which is not set")
+        return os.environ[variable]
+    return _REFERENCE.sub(lookup, value)
+
+def load_sites(path=None):
+    """Read the sites file and return one settings dict per site
+
+    Each site starts from the file's "defaults", then gets its backend's
+    channels if it names none, an "endpoint" (its state store key) and a
+    numeric interval or 'auto'. Raises ValueError for an invalid file.
+    """
+    with open(path or CONFIG['SITES_FILE'], 'r', encoding='utf-8') as f:
+        data = json.load(f)
+
+    defaults = data.get('defaults', {})
+    sites = []
+    names = set()
+    for entry in data.get('sites', []):
+        name = entry.get('name')
+        if not isinstance(name, str) or not _SITE_NAME.match(name):
+            raise ValueError(f"Invalid site name {name!r}, use letters, digits, '.', '_' and '-'")
+        if name in names:
+            raise ValueError(f"Site '{name}' is listed twice")
+        names.add(name)
+
+        site = {key: _expand(value, name) for key, value in {**defaults, **entry}.items()}
+        backend = site.setdefault('backend', 'api')
+        if backend not in BACKENDS:
+            raise ValueError(f"Site '{name}' has unknown backend '{backend}', expected one of {sorted(BACKENDS)}")
+
+        url = site.get('admin_url' if backend == 'admin' else 'api_url')
+        if not url:
+            raise ValueError(f"Site '{name}' needs {'admin_url' if backend == 'admin' else 'api_url'}")
+        site.setdefault('endpoint', url)
+
+        site['channels'] = tuple(site.get('channels') or CHANNELS[backend])
+        unsupported = set(site['channels']) - set(CHANNELS[backend])
+        if unsupported:
+            raise ValueError(f"Site '{name}' ({backend}) cannot notify on {', '.join(sorted(unsupported))}")
+
+        interval = site.setdefault('interval', CONFIG['DEFAULT_INTERVAL'])
+        if interval != 'auto':
+            try:
+                site['interval'] = float(interval)
+            except (TypeError, ValueError):
+                raise ValueError(f"Site '{name}' has invalid interval {interval!r}, use seconds or 'auto'")
+        sites.append(site)
+
+    if not sites:
+        raise ValueError("The sites file lists no sites")
+    return sites
+
+def available_memory_mb():
+    """Memory available without swapping in MB, or None if unknown"""
+    try:
+        with open('/proc/meminfo') as f:
+            for line in f:
+                if line.startswith('MemAvailable:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    try:
+        return os.sysconf('SC_AVPHYS_PAGES') * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+    except (AttributeError, ValueError, OSError):
+        return None
+
+def pool_size(sites, workers=None):
+    """Number of worker processes: one per core, no more browsers than memory allows"""
+    size = workers or os.cpu_count() or 1
+    if not workers and any(site['backend'] == 'selenium' for site in sites):
+        memory = available_memory_mb()
+        if memory:
+            size = min(size, max(1, int(memory // CONFIG['CHROME_MEMORY_MB'])))
+    return max(1, min(size, len(sites)))
+
+def site_load(site):
+    """Expected check cost per second of a site"""
+    interval = CONFIG['DEFAULT_INTERVAL'] if site['interval'] == 'auto' else site['interval']
+    return CONFIG['CHECK_COST'][site['backend']] / max(interval, 1)
+
+def shard(sites, count):
+    """Split sites into count shards of similar load, placing the heaviest first"""
+    shards = [[] for _ in range(count)]
+    loads = [0.0] * count
+    for site in sorted(sites, key=site_load, reverse=True):
+        index = loads.index(min(loads))
+        shards[index].append(site)
+        loads[index] += site_load(site)
+    return shards
+
+def _import_items():
+    """Import items.py, or stand in an empty one since every site brings its own settings"""
+    try:
+        import items  # noqa: F401
+    except ImportError:
+        placeholder = types.ModuleType('items')
+        for name in ITEMS_NAMES:
+            setattr(placeholder, name, None)
+        sys.modules['items'] = placeholder
+
+class SiteWorker:
+    """Checks one shard of sites in turn, keeping at most one browser warm"""
+
+    def __init__(self, index, sites):
+        self.index = index
+        self.sites = sites
+        self.resident = None
+        self.outboxes = {}
+        self.baselines = {}  # module -> its CONFIG before any site was applied
+
+        _import_items()
+        for site in sites:
+            for module_name in BACKENDS[site['backend']]:
+                module = importlib.import_module(module_name)
+                self.baselines.setdefault(module, dict(module.CONFIG))
+
+        selenium_sites = [site for site in sites if site['backend'] == 'selenium']
+        if selenium_sites:
+            # The one browser has to reach every site it checks
+            baseline = self.baselines[sys.modules['selenium_contact_monitor']]
+            baseline['ALLOWED_HOSTS'] = tuple({urlsplit(site['api_url']).hostname for site in selenium_sites})
+
+    def outbox(self, site):
+        """The site's own outbox, so its entries only go to its own channels"""
+        if site['name'] not in self.outboxes:
+            from outbox import Outbox
+            os.makedirs(CONFIG['OUTBOX_DIR'], exist_ok=True)
+            self.outboxes[site['name']] = Outbox(os.path.join(CONFIG['OUTBOX_DIR'], f"{site['name']}.jsonl"))
+        return self.outboxes[site['name']]
+
+    def apply(self, site):
+        """Point the monitor modules at one site"""
+        from outbox import set_outbox
+        module_names = BACKENDS[site['backend']]
+        for module_name in module_names:
+            module = sys.modules[module_name]
+            module.CONFIG.clear()
+            module.CONFIG.update(self.baselines[module])
+            for key, config_key in SETTINGS.items():
+                if key in site and config_key in module.CONFIG:
+                    module.CONFIG[config_key] = site[key]
+            module.CONFIG['STATE_KEY'] = site['endpoint']
+            if 'SESSION_FILE' in module.CONFIG:
+                module.CONFIG['SESSION_FILE'] = f".admin_session.{site['name']}.json"
+        monitor = sys.modules[module_names[-1]]
+        if hasattr(monitor, 'NOTIFY_CHANNELS'):
+            monitor.NOTIFY_CHANNELS = site['channels']
+        set_outbox(self.outbox(site))
+        return monitor
+
+    def check(self, site):
+        """Run one check of a site, returning True on success"""
+        monitor = self.apply(site)
+        if site['backend'] == 'selenium':
+            if self.resident is None:
+                self.resident = monitor.ResidentDriver()
+            return monitor.check_for_new_messages(self.resident)
+        if site['backend'] == 'admin':
+            return monitor.check_messages()
+        return monitor.check_for_new_messages()
+
+    def next_delay(self, site):
+        """Seconds until a site's next check, before jitter"""
+        if site['interval'] != 'auto':
+            return site['interval']
+        from adaptive_interval import next_interval
+        try:
+            return next_interval(site['endpoint'])
+        except Exception as e:
+            logger.warning(f"[{site['name']}] Adaptive interval failed, using {CONFIG['DEFAULT_INTERVAL']}s: {e}")
+            return CONFIG['DEFAULT_INTERVAL']
+
+    def run_once(self, site):
+        started = time.monotonic()
+        try:
+            success = bool(self.check(site))
+        except Exception as e:
+            logger.error(f"[{site['name']}] Check raised: {e}")
+            success = False
+        elapsed = time.monotonic() - started
+        if success:
+            logger.info(f"[{site['name']}] Check completed in {elapsed:.2f}s")
+        else:
+            logger.warning(f"[{site['name']}] Check failed after {elapsed:.2f}s")
+        return success
+
+    def run(self, stop, once=False):
+        """Check every site on its interval until stop is set; returns the failure count with once"""
+        try:
+            if once:
+                return sum(not self.run_once(site) for site in self.sites)
+
+            jitter = CONFIG['DEFAULT_JITTER']
+            # Spread the first checks out so every site does not start at once
+            queue = [(time.time() + random.uniform(0, jitter), i) for i in range(len(self.sites))]
+            heapq.heapify(queue)
+            while not stop.is_set():
+                due, i = heapq.heappop(queue)
+                if stop.wait(max(0.0, due - time.time())):
+                    break
+                site = self.sites[i]
+                self.run_once(site)
+                delay = self.next_delay(site) + random.uniform(0, jitter)
+                logger.info(f"[{site['name']}] Next check in {delay:.0f}s")
+                heapq.heappush(queue, (time.time() + delay, i))
+            return 0
+        finally:
+            if self.resident is not None:
+                self.resident.quit()
+
+def run_shard(index, sites, stop, once=False):
+    """Worker process entry point"""
+    import driver_cache
+    import metrics
+
+    # Workers must not share a Chrome profile or overwrite each other's metrics file
+    if driver_cache.CONFIG['PROFILE_DIR']:
+        driver_cache.CONFIG['PROFILE_DIR'] += f'-w{index}'
+    if metrics.CONFIG['PROM_FILE']:
+        root, ext = os.path.splitext(metrics.CONFIG['PROM_FILE'])
+        metrics.CONFIG['PROM_FILE'] = f"{root}.w{index}{ext}"
+    metrics.CONFIG['EXTRA_LABELS'] = {'worker': str(index)}
+
+    logger.info(f"Worker {index} checking {len(sites)} site(s): {', '.join(site['name'] for site in sites)}")
+    try:
+        failures = SiteWorker(index, sites).run(stop, once)
+    except KeyboardInterrupt:
+        return
+    sys.exit(1 if failures else 0)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Monitor every site in a sites file with a pool of workers")
+    parser.add_argument('sites_file', nargs='?', default=CONFIG['SITES_FILE'],
+                        help="JSON file listing the sites (default: %(default)s)")
+    parser.add_argument('--workers', type=int,
+                        help="worker processes (default: CPU cores, limited by CHROME_MEMORY_MB per browser)")
+    parser.add_argument('--once', action='store_true', help="check every site once and exit")
+    args = parser.parse_args(argv)
+
+    try:
+        sites = load_sites(args.sites_file)
+    except (OSError, ValueError) as e:
+        logger.error(f"Could not load sites: {e}")
+        sys.exit(2)
+
+    shards = shard(sites, pool_size(sites, args.workers))
+    logger.info(f"Monitoring {len(sites)} site(s) with {len(shards)} worker(s)")
+
+    # Spawned workers import the monitors fresh instead of inheriting this process's state
+    context = multiprocessing.get_context('spawn')
+    stop = context.Event()
+    workers = [context.Process(target=run_shard, args=(index, sites_in_shard, stop, args.once),
+                               name=f'sites-{index}')
+               for index, sites_in_shard in enumerate(shards)]
+    for worker in workers:
+        worker.start()
+    try:
+        for worker in workers:
+            worker.join()
+    except KeyboardInterrupt:
+        logger.info("Stopping workers...")
+        stop.set()
+        for worker in workers:
+            worker.join()
+    sys.exit(1 if any(worker.exitcode for worker in workers) else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+Concurrent notification fan-out
+
+Sends new messages to every configured channel at once, so total
+notification latency is the slowest channel rather than the sum of all.
+"""
+
+import contextvars
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from dataclasses import dataclass
+
+from metrics import stage
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+CONFIG = {
+    'WORKERS': 8,
+    'CHANNEL_TIMEOUT': 30,  # seconds before a channel is reported as timed out
+}
+
+_executor = ThreadPoolExecutor(max_workers=CONFIG['WORKERS'], thread_name_prefix='notify')
+
+@dataclass
+class ChannelResult:
+    """Outcome of sending one batch of messages to one channel"""
+    channel: str
+    success: bool
+    elapsed: float
+    error: str = None
+
+    def __str__(self):
+        status = 'ok' if self.success else (self.error or 'failed')
+        return f"{self.channel}:{status}({self.elapsed:.2f}s)"
+
+def notify_all(channels, new_messages, timeouts=None):
+    """Send new_messages to every channel concurrently
+
+    channels maps a channel name to a send function taking the message
+    list and returning True on success. timeouts optionally maps channel
+    names to their own timeout in seconds. Returns a ChannelResult per
+    channel, in the order given.
+    """
+    return notify_each({name: (send, new_messages) for name, send in channels.items()}, timeouts)
+
+def notify_each(batches, timeouts=None):
+    """Like notify_all, but every channel gets its own message list
+
+    batches maps a channel name to a (send function, messages) pair.
+    """
+    timeouts = timeouts or {}
+    started = time.monotonic()
+    # Each send runs in the caller's context so its stages count towards the same check
+    futures = {name: _executor.submit(contextvars.copy_context().run, _timed, name, send, messages)
+               for name, (send, messages) in batches.items()}
+
+    results = []
+    for name, future in futures.items():
+        deadline = started + timeouts.get(name, CONFIG['CHANNEL_TIMEOUT'])
+        try:
+            success, elapsed, error = future.result(timeout=max(0, deadline - time.monotonic()))
+        except FutureTimeoutError:
+            # The send keeps running in its worker, it is just no longer waited on
+            success, elapsed, error = False, time.monotonic() - started, 'timeout'
+        result = ChannelResult(name, success, elapsed, error)
+        logger.info(f"Notification channel {result}")
+        results.append(result)
+    return results
+
+def summarize(results):
+    """One-line status for the state store, e.g. 'email:ok(0.41s) discord:timeout(30.00s)'"""
+    return ' '.join(str(result) for result in results)
+
+def _timed(name, send, new_messages):
+    started = time.monotonic()
+    with stage('notify', channel=name) as span:
+        try:
+            success, error = bool(send(new_messages)), None
+        except Exception as e:
+            success, error = False, str(e)
+        if not success:
+            span.outcome = 'error' if error else 'failed'
+    return success, time.monotonic() - started, error
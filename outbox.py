@@ -0,0 +1,302 @@
+#!/usr/bin/env python3
+"""
+Durable on-disk outbox for notifications
+
+New messages are journaled per channel before any delivery is attempted,
+so a failed channel is retried with exponential backoff on later runs
+without fetching the source again. Every entry has a deterministic id and
+delivered ids are journaled too, so a message is never sent twice on the
+same channel.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+
+import coalescing
+from notifier import notify_each
+from state_store import key_digest
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+CONFIG = {
+    'JOURNAL_FILE': os.getenv('MONITOR_OUTBOX', 'notification_outbox.jsonl'),
+    'BACKOFF_BASE': 60,          # seconds before the first retry
+    'BACKOFF_MAX': 6 * 3600,     # longest wait between retries
+    'MAX_ATTEMPTS': 12,          # attempts before an entry is given up on
+    'COMPACT_BYTES': 1024 * 1024,
+    'DELIVERED_TTL': 30 * 86400,  # how long delivered ids are kept for deduplication
+}
+
+# Fields of an enqueue record, 'burst' only present when it is set
+ENQUEUE_FIELDS = ('op', 'id', 'endpoint', 'channel', 'message', 'at', 'burst')
+
+def entry_id(endpoint, channel, msg):
+    """Deterministic id of one message on one channel"""
+    key = f"{endpoint}\x1f{channel}\x1f{key_digest(msg).hex()}"
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+class Outbox:
+    """Append-only journal of pending notifications
+
+    Journal records are one JSON object per line:
+      {"op": "enqueue", "id", "endpoint", "channel", "message", "at", ["burst"]}
+      {"op": "failed", "id", "attempts", "next_at"}
+      {"op": "delivered", "id", "at"}
+      {"op": "expired", "id", "at"}
+    The in-memory view is rebuilt by replaying the journal on start.
+    """
+
+    def __init__(self, path=None):
+        self.path = path or CONFIG['JOURNAL_FILE']
+        self.lock = threading.RLock()
+        self.pending = {}
+        self.delivered = {}
+        self.in_flight = set()
+        self.arrivals = {}  # channel -> enqueue times within the coalescing window
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        self._apply(json.loads(line))
+                    except (ValueError, KeyError):
+                        # A torn last line from a crash mid-write is skipped
+                        continue
+        except FileNotFoundError:
+            pass
+
+    def _apply(self, record):
+        op = record['op']
+        if op == 'enqueue':
+            self.arrivals.setdefault(record['channel'], deque()).append(record['at'])
+            if record['id'] not in self.delivered:
+                record.setdefault('attempts', 0)
+                record.setdefault('next_at', 0)
+                self.pending[record['id']] = record
+        elif op == 'failed':
+            entry = self.pending.get(record['id'])
+            if entry:
+                entry['attempts'] = record['attempts']
+                entry['next_at'] = record['next_at']
+        elif op in ('delivered', 'expired'):
+            # Expired entries are remembered too, so they are not queued again
+            self.pending.pop(record['id'], None)
+            self.delivered[record['id']] = record['at']
+
+    def _append(self, records):
+        """Write records to the journal and flush them to disk"""
+        data = ''.join(json.dumps(record, separators=(',', ':')) + '\n' for record in records)
+        with self.lock:
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            for record in records:
+                self._apply(record)
+
+    def enqueue(self, endpoint, channels, messages):
+        """Journal every message for every channel, skipping ones already known
+
+        Messages that arrive as part of a burst are journaled with a burst
+        flag, so whichever process drains them sends them as a digest.
+        """
+        now = time.time()
+        records = []
+        with self.lock:
+            for channel in channels:
+                fresh = []
+                for msg in messages:
+                    key = entry_id(endpoint, channel, msg)
+                    if key in self.pending or key in self.delivered:
+                        continue
+                    fresh.append({'op': 'enqueue', 'id': key, 'endpoint': endpoint,
+                                  'channel': channel, 'message': msg, 'at': now})
+                if fresh and coalescing.is_burst(self.recent_arrivals(channel, now) + len(fresh)):
+                    for record in fresh:
+                        record['burst'] = True
+                records += fresh
+            if records:
+                self._append(records)
+        return len(records)
+
+    def due(self, now=None):
+        """Return pending entries grouped by channel whose retry time has come"""
+        now = now or time.time()
+        by_channel = {}
+        with self.lock:
+            for entry in self.pending.values():
+                if entry['next_at'] <= now and entry['id'] not in self.in_flight:
+                    by_channel.setdefault(entry['channel'], []).append(entry)
+        return by_channel
+
+    def recent_arrivals(self, channel, now=None):
+        """Number of messages queued for a channel within the coalescing window"""
+        cutoff = (now or time.time()) - coalescing.CONFIG['WINDOW']
+        with self.lock:
+            times = self.arrivals.get(channel)
+            if not times:
+                return 0
+            while times and times[0] < cutoff:
+                times.popleft()
+            return len(times)
+
+    def next_due(self):
+        """Time the earliest pending entry becomes due, or None if nothing is pending"""
+        with self.lock:
+            return min((entry['next_at'] for entry in self.pending.values()), default=None)
+
+    def mark_delivered(self, ids):
+        """Journal entries as delivered so they are never sent again"""
+        now = time.time()
+        with self.lock:
+            self._append([{'op': 'delivered', 'id': key, 'at': now} for key in ids if key in self.pending])
+
+    def mark_failed(self, ids):
+        """Journal a failed attempt and schedule the next one with exponential backoff"""
+        now = time.time()
+        records = []
+        with self.lock:
+            for key in ids:
+                entry = self.pending.get(key)
+                if entry is None:
+                    # Delivered late by a send that outlived its timeout
+                    continue
+                attempts = entry['attempts'] + 1
+                if attempts >= CONFIG['MAX_ATTEMPTS']:
+                    logger.error(f"Giving up on {entry['channel']} notification after {attempts} attempts")
+                    records.append({'op': 'expired', 'id': key, 'at': now})
+                    continue
+                delay = min(CONFIG['BACKOFF_BASE'] * 2 ** (attempts - 1), CONFIG['BACKOFF_MAX'])
+                records.append({'op': 'failed', 'id': key, 'attempts': attempts, 'next_at': now + delay})
+            if records:
+                self._append(records)
+
+    def drain(self, senders, timeouts=None, digest_senders=None, now=None):
+        """Deliver every due entry, one concurrent batch per channel
+
+        senders maps a channel name to a send function taking a message
+        list and returning True if all of them went out, False if none
+        did, or the list of those that did when it failed partway. Only
+        messages that went out are journaled as delivered, the rest are
+        retried. Entries for channels without a sender stay queued. Channels
+        with a digest sender coalesce bursts (see coalescing.py): ordinary
+        messages are held and then sent as one '<channel>-digest' batch.
+        Returns the ChannelResult list from the notifier (empty if nothing
+        was due).
+        """
+        digest_senders = digest_senders or {}
+        now = now or time.time()
+        batches = {}
+        batch_ids = {}
+
+        def add_batch(name, send, entries):
+            batch_ids[name] = [entry['id'] for entry in entries]
+            with self.lock:
+                self.in_flight.update(batch_ids[name])
+            batches[name] = (self._deliverer(send, batch_ids[name]), [entry['message'] for entry in entries])
+
+        for channel, entries in self.due(now).items():
+            send = senders.get(channel)
+            if send is None:
+                continue
+            digest, held_until = [], None
+            if channel in digest_senders:
+                due, (entries, digest, held_until) = entries, coalescing.plan(entries, now)
+            if held_until is not None:
+                held = [entry for entry in due if entry not in entries]
+                logger.info(f"Holding {len(held)} {channel} notification(s) for a digest")
+                with self.lock:
+                    for entry in held:
+                        # In memory only: a new process holds them again from
+                        # their journaled burst flag and enqueue time
+                        entry['next_at'] = max(entry['next_at'], held_until)
+            if entries:
+                add_batch(channel, send, entries)
+            if digest:
+                add_batch(f"{channel}-digest", digest_senders[channel], digest)
+
+        if not batches:
+            return []
+
+        logger.info(f"Draining outbox: {', '.join(f'{name}={len(ids)}' for name, ids in batch_ids.items())}")
+        results = notify_each(batches, timeouts)
+        for result in results:
+            if not result.success:
+                # Entries already journaled as delivered are skipped
+                self.mark_failed(batch_ids[result.channel])
+        self.compact()
+        return results
+
+    def _deliverer(self, send, ids):
+        """Wrap send so a success is journaled as soon as it happens
+
+        The record is written from the worker thread, so a send that
+        finishes after its channel timed out is still never repeated.
+        """
+        def deliver(messages):
+            try:
+                result = send(messages)
+                if isinstance(result, (list, tuple)):
+                    # Partial delivery: the sender returned the messages that went out
+                    sent = {id(msg) for msg in result}
+                    self.mark_delivered([key for key, msg in zip(ids, messages) if id(msg) in sent])
+                    return len(sent) == len(messages)
+                if result:
+                    self.mark_delivered(ids)
+                return bool(result)
+            finally:
+                with self.lock:
+                    self.in_flight.difference_update(ids)
+        return deliver
+
+    def compact(self):
+        """Rewrite the journal as its current state once it grows past COMPACT_BYTES"""
+        with self.lock:
+            try:
+                if os.path.getsize(self.path) < CONFIG['COMPACT_BYTES']:
+                    return
+            except OSError:
+                return
+
+            cutoff = time.time() - CONFIG['DELIVERED_TTL']
+            self.delivered = {key: at for key, at in self.delivered.items() if at >= cutoff}
+            records = [{'op': 'delivered', 'id': key, 'at': at} for key, at in self.delivered.items()]
+            for entry in self.pending.values():
+                records.append({key: entry[key] for key in ENQUEUE_FIELDS if key in entry})
+                if entry['attempts']:
+                    records.append({'op': 'failed', 'id': entry['id'],
+                                    'attempts': entry['attempts'], 'next_at': entry['next_at']})
+
+            tmp_path = self.path + '.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                for record in records:
+                    f.write(json.dumps(record, separators=(',', ':')) + '\n')
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+            logger.info(f"Compacted outbox journal to {len(records)} records")
+
+_default_outbox = None
+_default_lock = threading.Lock()
+
+def get_outbox():
+    """Return the process-wide Outbox at CONFIG['JOURNAL_FILE']"""
+    global _default_outbox
+    with _default_lock:
+        if _default_outbox is None:
+            _default_outbox = Outbox()
+        return _default_outbox
+
+def set_outbox(outbox):
+    """Make outbox the process-wide Outbox (multi_site.py switches it per site)"""
+    global _default_outbox
+    with _default_lock:
+        _default_outbox = outbox
@@ -0,0 +1,242 @@
+#!/usr/bin/env python3
+"""
+Push receiver for new contact form submissions
+
+The website POSTs each new submission here as soon as it is stored, signed
+with a shared secret, and the notification goes out straight away instead
+of waiting for the next poll. Submissions go through the same outbox as
+polled messages, so the slow reconciliation poll that keeps running next
+to the receiver never notifies a pushed message twice.
+
+Signing (the website's side):
+    timestamp = str(int(time.time()))
+    signature = hmac.new(secret, f"{timestamp}.".encode() + body, hashlib.sha256).hexdigest()
+    POST body with headers X-Timestamp: timestamp and X-Signature: sha256=<signature>
+
+The body is one message object ({"id", "name", "email", "timestamp",
+"message"}), a list of them, or {"messages": [...]}.
+"""
+
+import argparse
+import asyncio
+import hashlib
+import hmac
+import importlib
+import json
+import logging
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from metrics import stage
+from notifier import summarize
+from outbox import get_outbox
+
+# Set up logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+# Configuration
+CONFIG = {
+    'HOST': '127.0.0.1',
+    'PORT': 8787,
+    'PATH': '/contact',
+    'SECRET': os.getenv('MONITOR_PUSH_SECRET'),
+    'MAX_SKEW': 300,          # seconds a signed timestamp stays valid
+    'MAX_BODY': 1024 * 1024,  # bytes
+    'SWEEP_INTERVAL': 6 * 3600,  # reconciliation poll while pushes carry the load
+}
+
+# Monitor whose endpoint, channels and senders pushed messages use
+MONITORS = {
+    'api': 'contact_monitor',
+    'selenium': 'selenium_contact_monitor',
+}
+
+def sign(secret, timestamp, body):
+    """Return the hex HMAC-SHA256 of 'timestamp.' + body"""
+    return hmac.new(secret.encode('utf-8'), f"{timestamp}.".encode('ascii') + body,
+                    hashlib.sha256).hexdigest()
+
+class SignatureError(Exception):
+    """A push whose signature or timestamp does not check out"""
+
+class PushVerifier:
+    """Checks push signatures and rejects replays inside the timestamp window"""
+
+    def __init__(self, secret, max_skew=None):
+        self.secret = secret
+        self.max_skew = max_skew or CONFIG['MAX_SKEW']
+        self.lock = threading.Lock()
+        self.recent = {}  # signature -> timestamp, for the replay window
+
+    def verify(self, timestamp, signature, body, now=None):
+        now = now or time.time()
+        try:
+            sent_at = int(timestamp)
+        except (TypeError, ValueError):
+            raise SignatureError("missing or malformed X-Timestamp")
+        if abs(now - sent_at) > self.max_skew:
+            raise SignatureError("timestamp outside the allowed window")
+
+        expected = 'sha256=' + sign(self.secret, sent_at, body)
+        if not signature or not hmac.compare_digest(expected, signature):
+            raise SignatureError("signature mismatch")
+
+        with self.lock:
+            self.recent = {sig: at for sig, at in self.recent.items() if now - at <= self.max_skew}
+            if signature in self.recent:
+                raise SignatureError("replayed request")
+            self.recent[signature] = sent_at
+
+def parse_messages(body):
+    """Return the message dicts in a push body, raising ValueError if there are none"""
+    data = json.loads(body)
+    if isinstance(data, dict):
+        data = data.get('messages', [data])
+    if not isinstance(data, list) or not data or not all(isinstance(msg, dict) for msg in data):
+        raise ValueError("expected a message object or a list of them")
+    return data
+
+class _PushHandler(BaseHTTPRequestHandler):
+
+    def log_message(self, format, *args):
+        logger.debug(format % args)
+
+    def _reply(self, status, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        # Lets uptime checks see the receiver is alive
+        self._reply(200, {'ok': True}) if self.path == '/health' else self._reply(404, {'error': 'not found'})
+
+    def do_POST(self):
+        receiver = self.server.receiver
+        if self.path != CONFIG['PATH']:
+            self._reply(404, {'error': 'not found'})
+            return
+
+        length = int(self.headers.get('Content-Length') or 0)
+        if length > CONFIG['MAX_BODY']:
+            self._reply(413, {'error': 'body too large'})
+            return
+        body = self.rfile.read(length)
+
+        with stage('push_receive') as span:
+            span.add_bytes(len(body))
+            try:
+                receiver.verifier.verify(self.headers.get('X-Timestamp'), self.headers.get('X-Signature'), body)
+            except SignatureError as e:
+                span.outcome = 'rejected'
+                logger.warning(f"Rejected push from {self.client_address[0]}: {e}")
+                self._reply(401, {'error': 'invalid signature'})
+                return
+            try:
+                messages = parse_messages(body)
+            except ValueError as e:
+                span.outcome = 'invalid'
+                self._reply(400, {'error': str(e)})
+                return
+
+            queued = receiver.accept(messages)
+        self._reply(202, {'accepted': len(messages), 'queued': queued})
+
+class PushReceiver:
+    """HTTP server turning signed pushes into outbox entries and notifications"""
+
+    def __init__(self, monitor='api', secret=None, host=None, port=None):
+        secret = secret or CONFIG['SECRET']
+        if not secret:
+            raise ValueError("A shared secret is required (set MONITOR_PUSH_SECRET)")
+        self.monitor = importlib.import_module(MONITORS[monitor])
+        self.verifier = PushVerifier(secret)
+        self.server = ThreadingHTTPServer((host or CONFIG['HOST'], port or CONFIG['PORT']), _PushHandler)
+        self.server.daemon_threads = True
+        self.server.receiver = self
+        self._drain_lock = threading.Lock()
+        self._timer = None
+
+    def accept(self, messages):
+        """Journal pushed messages for every channel and deliver them in the background
+
+        The entries are on disk before the website gets its 202, so a
+        crash after that only delays the notification.
+        """
+        endpoint = self.monitor.CONFIG['STATE_KEY']
+        queued = get_outbox().enqueue(endpoint, self.monitor.NOTIFY_CHANNELS, messages)
+        logger.info(f"Push with {len(messages)} message(s), {queued} new outbox entries")
+        if queued:
+            threading.Thread(target=self._deliver, args=(messages,), name='push-deliver', daemon=True).start()
+        return queued
+
+    def _deliver(self, messages):
+        # One drain at a time; a later push's entries are picked up by the next drain
+        with self._drain_lock:
+            started = time.monotonic()
+            results = self.monitor.drain_outbox()
+            success = not results or any(result.success for result in results)
+            self.monitor.record_check(success, (time.monotonic() - started) * 1000, None, messages,
+                                      'push ' + (summarize(results) or 'already delivered'))
+            self._schedule_drain()
+
+    def _schedule_drain(self):
+        """Drain again when entries held for a digest (or a retry) become due"""
+        next_due = get_outbox().next_due()
+        timer = self._timer
+        if next_due is None or (timer is not None and timer.is_alive() and timer is not threading.current_thread()):
+            return
+        self._timer = threading.Timer(max(next_due - time.time(), 0) + 1, self._deliver, args=([],))
+        self._timer.daemon = True
+        self._timer.start()
+
+    def serve_forever(self):
+        host, port = self.server.server_address[:2]
+        logger.info(f"Receiving pushes on http://{host}:{port}{CONFIG['PATH']}")
+        self.server.serve_forever()
+
+    def shutdown(self):
+        if self._timer is not None:
+            self._timer.cancel()
+        self.server.shutdown()
+        self.server.server_close()
+
+def start_sweep(backend, interval):
+    """Keep polling on a long interval in the background to catch missed pushes"""
+    from scheduler import Job, Scheduler
+    job = Job.for_backend(backend, name=f"{backend}-sweep", interval=interval)
+    thread = threading.Thread(target=asyncio.run, args=(Scheduler([job]).run(),), name='sweep', daemon=True)
+    thread.start()
+    return thread
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Receive signed contact form pushes")
+    parser.add_argument('--host', default=CONFIG['HOST'])
+    parser.add_argument('--port', type=int, default=CONFIG['PORT'])
+    parser.add_argument('--monitor', choices=sorted(MONITORS), default='api',
+                        help="monitor whose endpoint and notification channels are used")
+    parser.add_argument('--sweep', type=float, default=CONFIG['SWEEP_INTERVAL'],
+                        help="seconds between reconciliation polls, 0 to disable")
+    args = parser.parse_args(argv)
+
+    receiver = PushReceiver(args.monitor, host=args.host, port=args.port)
+    if args.sweep:
+        logger.info(f"Reconciliation poll every {args.sweep:.0f}s")
+        start_sweep(args.monitor, args.sweep)
+    try:
+        receiver.serve_forever()
+    except KeyboardInterrupt:
+        logger.info("Push receiver stopped by user")
+    finally:
+        receiver.shutdown()
+
+if __name__ == "__main__":
+    main()
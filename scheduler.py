@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+"""
+Contact Form Monitor scheduler - runs many monitor checks concurrently
+in one process with asyncio
+"""
+
+import argparse
+import asyncio
+import logging
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+
+# Set up logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+# Configuration
+CONFIG = {
+    # Each Selenium check holds a whole Chrome instance, so keep this small
+    'SELENIUM_WORKERS': 2,
+    # API, admin-scraper and SMTP work is network bound and cheap to run wide
+    'IO_WORKERS': 16,
+
+    'DEFAULT_INTERVAL': 900,  # 15 minutes
+    'DEFAULT_JITTER': 30,     # seconds added at random to every wait
+    'DEFAULT_TIMEOUT': 120,   # seconds before a check is abandoned
+}
+
+_selenium_local = threading.local()
+# Every warm browser the selenium workers started, quit on shutdown
+_residents = []
+_residents_lock = threading.Lock()
+
+def _api_check():
+    from contact_monitor import check_for_new_messages
+    return check_for_new_messages()
+
+def _admin_check():
+    from admin_scraper_contact_monitor import check_messages
+    return check_messages()
+
+def _api_endpoint():
+    from contact_monitor import CONFIG as monitor_config
+    return monitor_config['STATE_KEY']
+
+def _admin_endpoint():
+    from admin_scraper_contact_monitor import CONFIG as monitor_config
+    return monitor_config['STATE_KEY']
+
+def _selenium_endpoint():
+    from selenium_contact_monitor import CONFIG as monitor_config
+    return monitor_config['STATE_KEY']
+
+def _selenium_check():
+    from selenium_contact_monitor import ResidentDriver, check_for_new_messages
+    # Every selenium worker thread keeps its own warm browser between checks
+    if not hasattr(_selenium_local, 'resident'):
+        _selenium_local.resident = ResidentDriver()
+        with _residents_lock:
+            _residents.append(_selenium_local.resident)
+    return check_for_new_messages(_selenium_local.resident)
+
+# Backend name -> (check function, executor pool it runs on, state store endpoint)
+BACKENDS = {
+    'api': (_api_check, 'io', _api_endpoint),
+    'admin': (_admin_check, 'io', _admin_endpoint),
+    'selenium': (_selenium_check, 'selenium', _selenium_endpoint),
+}
+
+@dataclass
+class Job:
+    """A check run on its own interval by the scheduler"""
+    name: str
+    check: object
+    interval: float = CONFIG['DEFAULT_INTERVAL']
+    jitter: float = CONFIG['DEFAULT_JITTER']
+    timeout: float = CONFIG['DEFAULT_TIMEOUT']
+    pool: str = 'io'
+    # When set, the interval adapts to the endpoint's traffic (see adaptive_interval.py)
+    endpoint: object = None
+    runs: int = field(default=0, init=False)
+    failures: int = field(default=0, init=False)
+
+    @classmethod
+    def for_backend(cls, backend, name=None, **kwargs):
+        """Build a job for one of the built-in monitor backends"""
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown backend '{backend}', expected one of {sorted(BACKENDS)}")
+        check, pool, endpoint = BACKENDS[backend]
+        if kwargs.pop('adaptive', False):
+            kwargs['endpoint'] = endpoint
+        return cls(name=name or backend, check=check, pool=pool, **kwargs)
+
+    def next_delay(self):
+        """Seconds until the next check, before jitter"""
+        if self.endpoint is None:
+            return self.interval
+        from adaptive_interval import next_interval
+        try:
+            return next_interval(self.endpoint())
+        except Exception as e:
+            logger.warning(f"[{self.name}] Adaptive interval failed, using {self.interval}s: {e}")
+            return self.interval
+
+class Scheduler:
+    """Runs jobs concurrently, each on its own interval, jitter and timeout
+
+    Blocking checks are handed to bounded thread pools so one slow site
+    (or one slow SMTP server) never delays the other jobs.
+    """
+
+    def __init__(self, jobs, selenium_workers=None, io_workers=None):
+        self.jobs = list(jobs)
+        self.executors = {
+            'selenium': ThreadPoolExecutor(
+                max_workers=selenium_workers or CONFIG['SELENIUM_WORKERS'],
+                thread_name_prefix='selenium'),
+            'io': ThreadPoolExecutor(
+                max_workers=io_workers or CONFIG['IO_WORKERS'],
+                thread_name_prefix='io'),
+        }
+
+    async def run_once(self, job):
+        """Run one check of a job, returning True on success"""
+        loop = asyncio.get_running_loop()
+        executor = self.executors[job.pool]
+        started = time.monotonic()
+        job.runs += 1
+
+        try:
+            success = await asyncio.wait_for(
+                loop.run_in_executor(executor, job.check), timeout=job.timeout)
+        except asyncio.TimeoutError:
+            # The worker thread cannot be interrupted, it finishes in the background
+            logger.error(f"[{job.name}] Check timed out after {job.timeout}s")
+            success = False
+        except Exception as e:
+            logger.error(f"[{job.name}] Check raised: {e}")
+            success = False
+
+        elapsed = time.monotonic() - started
+        if success:
+            logger.info(f"[{job.name}] Check completed in {elapsed:.2f}s")
+        else:
+            job.failures += 1
+            logger.warning(f"[{job.name}] Check failed after {elapsed:.2f}s")
+        return bool(success)
+
+    async def run_job(self, job):
+        """Run a job forever on its interval"""
+        # Spread the first checks out so every job does not start at once
+        await asyncio.sleep(random.uniform(0, job.jitter))
+        while True:
+            await self.run_once(job)
+            delay = job.next_delay() + random.uniform(0, job.jitter)
+            logger.info(f"[{job.name}] Next check in {delay:.0f}s")
+            await asyncio.sleep(delay)
+
+    async def run(self):
+        """Run every job until cancelled"""
+        try:
+            await asyncio.gather(*(self.run_job(job) for job in self.jobs))
+        finally:
+            self.shutdown()
+
+    def shutdown(self):
+        """Stop the executor pools without waiting for stuck checks and quit the warm browsers"""
+        for executor in self.executors.values():
+            executor.shutdown(wait=False, cancel_futures=True)
+        quit_residents()
+
+def quit_residents():
+    """Quit the browsers kept warm by selenium workers, so no Chrome outlives the scheduler"""
+    with _residents_lock:
+        residents = list(_residents)
+        _residents.clear()
+    for resident in residents:
+        try:
+            resident.quit()
+        except Exception as e:
+            logger.warning(f"Could not quit browser: {e}")
+
+def parse_job(spec, jitter, timeout):
+    """Parse a 'backend[:interval[:name]]' job spec; an interval of 'auto' adapts to traffic"""
+    parts = spec.split(':')
+    backend = parts[0]
+    adaptive = len(parts) > 1 and parts[1] == 'auto'
+    if len(parts) > 1 and parts[1] and not adaptive:
+        interval = float(parts[1])
+    else:
+        interval = CONFIG['DEFAULT_INTERVAL']
+    name = parts[2] if len(parts) > 2 else None
+    return Job.for_backend(backend, name=name, interval=interval, jitter=jitter, timeout=timeout,
+                           adaptive=adaptive)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run monitor checks concurrently")
+    parser.add_argument('jobs', nargs='+', metavar='BACKEND[:INTERVAL[:NAME]]',
+                        help=f"job to run, backend is one of {', '.join(BACKENDS)}; "
+                             "INTERVAL is seconds or 'auto' to follow the site's traffic")
+    parser.add_argument('--jitter', type=float, default=CONFIG['DEFAULT_JITTER'],
+                        help="random seconds added to every wait")
+    parser.add_argument('--timeout', type=float, default=CONFIG['DEFAULT_TIMEOUT'],
+                        help="seconds before a check is abandoned")
+    args = parser.parse_args(argv)
+
+    jobs = [parse_job(spec, args.jitter, args.timeout) for spec in args.jobs]
+    logger.info(f"Scheduler starting with {len(jobs)} job(s)")
+    try:
+        asyncio.run(Scheduler(jobs).run())
+    except KeyboardInterrupt:
+        logger.info("Scheduler stopped by user")
+
+if __name__ == "__main__":
+    main()
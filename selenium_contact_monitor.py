@@ -4,20 +4,27 @@ Contact Form Monitor using Selenium to bypass WAF protection
 Cross-platform version (Windows + Linux CI)
 """
 
-from selenium import webdriver
-from selenium.webdriver.chrome.options import Options
-from selenium.webdriver.chrome.service import Service
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
+import base64
 import json
 import time
 import os
-import requests
 import sys
 import logging
 import platform
 from datetime import datetime
+from urllib.parse import urlencode, urlsplit
+from driver_cache import acquire_profile, find_binaries, release_profile
+from json_extract import extract_json, find_json_start
+from state_store import get_store
+from notifier import summarize
+from outbox import get_outbox
+from fetchers import NOT_MODIFIED, fetch_messages, mark_processed
+from message_cursor import collect_new, load_cursor, page_params, request_params, save_cursor, track
+from message_diff import find_new, save_index
+from coalescing import digest_body, digest_subject
+from archive import archive_messages
+from metrics import instrument_check, stage
+from adaptive_interval import is_due, next_interval
 
 # Set up logging
 logging.basicConfig(
@@ -26,6 +33,9 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Channels every new message is queued for in the outbox
+NOTIFY_CHANNELS = ('email', 'discord')
+
 # Import configuration
 try:
     from items import EMAIL, PASSWORD, API_KEY, API_URL, DISCORD_WEBHOOK
@@ -38,7 +48,7 @@ except ImportError as e:
 # Configuration
 CONFIG = {
     'API_URL': API_URL,
-    'LAST_COUNT_FILE': 'last_message_count.txt',
+    'STATE_KEY': API_URL,  # endpoint name in the state store
     'CHECK_INTERVAL': 900,  # 15 minutes
     
     # Email notification
@@ -52,7 +62,43 @@ CONFIG = {
     'API_KEY': API_KEY,
     
     # Discord Webhook
-    'DISCORD_WEBHOOK': DISCORD_WEBHOOK
+    'DISCORD_WEBHOOK': DISCORD_WEBHOOK,
+    
+    # Daemon mode: recycle the resident browser after this many checks
+    # or once Chrome's resident memory grows past this many megabytes
+    'DRIVER_MAX_CHECKS': 50,
+    'DRIVER_MAX_MEMORY_MB': 1024,
+    'RETRY_INTERVAL': 300,  # 5 minutes
+    # Follow the site's traffic instead of the fixed intervals above
+    # (bounds in adaptive_interval.CONFIG)
+    'ADAPTIVE_INTERVAL': True,
+    
+    # 'devtools' reads the API response bytes from Chrome's Network domain,
+    # 'page_source' polls the rendered page until it holds complete JSON
+    'CAPTURE_MODE': 'devtools',
+    
+    # 'eager' returns from driver.get() once the DOM is parsed and 'none'
+    # right away; readiness is then detected from the page itself
+    'PAGE_LOAD_STRATEGY': 'eager',
+    'READY_POLL': 0.1,        # seconds between page readiness checks
+    # Bounds for the readiness timeout learned from observed load times
+    'READY_TIMEOUT_MIN': 3,
+    'READY_TIMEOUT_MAX': 30,
+    
+    # Requests Chrome never sends (Network.setBlockedURLs wildcard patterns)
+    'BLOCKED_URL_PATTERNS': (
+        '*.png', '*.jpg', '*.jpeg', '*.gif', '*.webp', '*.svg', '*.ico',
+        '*.woff', '*.woff2', '*.ttf', '*.otf', '*.eot', '*.css',
+    ),
+    # Only the API host resolves inside the browser; turn off if the WAF
+    # challenge loads its script from another host
+    'BLOCK_THIRD_PARTY': True,
+    # Further hosts that resolve, e.g. every site a shared browser checks
+    'ALLOWED_HOSTS': (),
+    
+    # Backends tried cheapest first; Chrome is only started when the
+    # plain API request has been failing (see fetchers.py)
+    'FETCH_BACKENDS': ('api', 'selenium')
 }
 
 def is_ci_environment():
@@ -61,6 +107,12 @@ def is_ci_environment():
 
 def setup_driver():
     """Set up Chrome driver with options optimized for both Windows and CI"""
+    # Selenium is imported only once a browser is needed: reading state,
+    # replaying the outbox or the API backend never pay for it
+    from selenium import webdriver
+    from selenium.webdriver.chrome.options import Options
+    from selenium.webdriver.chrome.service import Service
+    
     chrome_options = Options()
     
     # Universal options that work on both platforms
@@ -71,8 +123,24 @@ def setup_driver():
     chrome_options.add_argument('--window-size=1920,1080')
     chrome_options.add_argument('--disable-extensions')
     chrome_options.add_argument('--disable-plugins')
-    chrome_options.add_argument('--disable-images')  # Speed up loading
+    # Skip first-run setup and background services that slow startup
+    chrome_options.add_argument('--no-first-run')
+    chrome_options.add_argument('--no-default-browser-check')
+    chrome_options.add_argument('--disable-background-networking')
+    chrome_options.add_argument('--disable-component-update')
+    chrome_options.add_argument('--disable-default-apps')
+    chrome_options.add_argument('--disable-sync')
+    if CONFIG['BLOCK_THIRD_PARTY']:
+        # Other hosts fail DNS resolution inside the browser
+        hosts = dict.fromkeys([urlsplit(CONFIG['API_URL']).hostname, *CONFIG['ALLOWED_HOSTS']])
+        excludes = ''.join(f' , EXCLUDE {host}' for host in hosts if host)
+        chrome_options.add_argument(f'--host-resolver-rules=MAP * ~NOTFOUND{excludes}')
     chrome_options.add_argument('--user-agent=Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36')
+    chrome_options.page_load_strategy = CONFIG['PAGE_LOAD_STRATEGY']
+    
+    # Network events feed the DevTools capture mode
+    chrome_options.set_capability('goog:loggingPrefs', {'performance': 'ALL'})
+    chrome_options.add_experimental_option('perfLoggingPrefs', {'enableNetwork': True, 'enablePage': False})
     
     # CI-specific options (these can cause issues on Windows)
     if is_ci_environment():
@@ -90,84 +158,43 @@ def setup_driver():
         chrome_options.add_argument('--log-level=3')  # Suppress console logs
         logger.info("Running locally, using local development Chrome options")
     
+    system = platform.system().lower()
+    profile = None
     try:
-        system = platform.system().lower()
-        logger.info(f"Detected operating system: {system}")
+        with stage('driver_discovery'):
+            binaries = find_binaries()
+        if binaries['chrome_binary']:
+            chrome_options.binary_location = binaries['chrome_binary']
         
-        if system == 'windows':
-            # Windows-specific setup
-            possible_drivers = [
-                'chromedriver.exe',  # In PATH or current directory
-                r'C:\chromedriver\chromedriver.exe',
-                r'C:\Program Files\chromedriver\chromedriver.exe',
-            ]
-            
-            driver_path = None
-            for path in possible_drivers:
-                if os.path.exists(path) or path == 'chromedriver.exe':
-                    driver_path = path
-                    logger.info(f"Found ChromeDriver at: {driver_path}")
-                    break
-            
-            if driver_path and driver_path != 'chromedriver.exe':
-                service = Service(driver_path)
-                driver = webdriver.Chrome(service=service, options=chrome_options)
-            else:
-                driver = webdriver.Chrome(options=chrome_options)
+        # A profile Chrome has already initialized starts faster than a fresh one
+        profile = acquire_profile()
+        if profile:
+            chrome_options.add_argument(f'--user-data-dir={profile}')
         
-        else:
-            # Linux/Unix setup (for CI)
-            possible_drivers = [
-                '/usr/bin/chromedriver',
-                '/usr/bin/chromium-chromedriver',
-                '/usr/local/bin/chromedriver',
-                '/snap/bin/chromium.chromedriver',
-                'chromedriver'
-            ]
-            
-            possible_chrome = [
-                '/usr/bin/chromium-browser',
-                '/usr/bin/chromium',
-                '/usr/bin/google-chrome',
-                '/snap/bin/chromium'
-            ]
-            
-            driver_path = None
-            chrome_binary = None
-            
-            # Find ChromeDriver
-            for path in possible_drivers:
-                if os.path.exists(path):
-                    driver_path = path
-                    logger.info(f"Found ChromeDriver at: {driver_path}")
-                    break
-            
-            # Find Chrome binary
-            for path in possible_chrome:
-                if os.path.exists(path):
-                    chrome_binary = path
-                    logger.info(f"Found Chrome binary at: {chrome_binary}")
-                    break
-            
-            # Set Chrome binary location if found
-            if chrome_binary:
-                chrome_options.binary_location = chrome_binary
-            
-            # Create driver
-            if driver_path and driver_path != 'chromedriver':
-                service = Service(driver_path)
+        started = time.monotonic()
+        with stage('driver_launch'):
+            if binaries['driver_path']:
+                service = Service(binaries['driver_path'])
                 driver = webdriver.Chrome(service=service, options=chrome_options)
             else:
+                # Let Selenium Manager find or download a matching driver
                 driver = webdriver.Chrome(options=chrome_options)
+        driver.monitor_profile = profile
+        
+        with stage('resource_blocking'):
+            block_resources(driver)
         
-        # Set timeouts
-        driver.set_page_load_timeout(30)
-        driver.implicitly_wait(10)
+        # Set timeouts. No implicit wait: readiness is polled explicitly and
+        # an implicit wait would only delay lookups of missing elements
+        driver.set_page_load_timeout(CONFIG['READY_TIMEOUT_MAX'])
         
-        logger.info("ChromeDriver started successfully")
+        logger.info(f"ChromeDriver started in {time.monotonic() - started:.2f}s "
+                    f"(driver {binaries['driver_version'] or 'unknown'}, browser {binaries['chrome_version'] or 'unknown'})")
         return driver
         
     except Exception as e:
+        if profile:
+            release_profile(profile)
         logger.error(f"Error setting up Chrome driver: {e}")
         logger.error("Make sure Chrome/Chromium and ChromeDriver are installed")
         
@@ -178,109 +205,428 @@ def setup_driver():
         
         return None
 
-def get_current_messages():
-    """Fetch messages using Selenium to bypass WAF"""
-    driver = setup_driver()
+def block_resources(driver):
+    """Block images, fonts and stylesheets at the network layer and bypass the disk cache
+    
+    Chrome has no --disable-images flag; Network.setBlockedURLs makes such
+    requests fail before they are sent. The profile (and so its HTTP cache)
+    persists between runs, and a quiet poll requests the same URL again,
+    so the cache is disabled: a heuristically fresh cached response would
+    hide new messages.
+    """
+    try:
+        driver.execute_cdp_cmd('Network.enable', {})
+        driver.execute_cdp_cmd('Network.setCacheDisabled', {'cacheDisabled': True})
+        if CONFIG['BLOCKED_URL_PATTERNS']:
+            driver.execute_cdp_cmd('Network.setBlockedURLs', {'urls': list(CONFIG['BLOCKED_URL_PATTERNS'])})
+    except Exception as e:
+        logger.warning(f"Could not block page resources: {e}")
+
+def quit_driver(driver):
+    """Quit a driver and hand its profile back for the next browser"""
+    try:
+        driver.quit()
+        logger.info("ChromeDriver closed")
+    except Exception:
+        pass
+    finally:
+        profile = getattr(driver, 'monitor_profile', None)
+        if profile:
+            release_profile(profile)
+
+def get_driver_memory_mb(driver):
+    """Return the resident memory (MB) of chromedriver and its Chrome children
+    
+    Uses psutil when installed and falls back to /proc on Linux. Returns None
+    when memory cannot be measured on this platform.
+    """
+    try:
+        pid = driver.service.process.pid
+    except Exception:
+        return None
+    
+    try:
+        import psutil
+        root = psutil.Process(pid)
+        procs = [root] + root.children(recursive=True)
+        return sum(p.memory_info().rss for p in procs) / (1024 * 1024)
+    except ImportError:
+        pass
+    except Exception as e:
+        logger.debug(f"psutil memory probe failed: {e}")
+        return None
+    
+    if not os.path.isdir('/proc'):
+        return None
+    
+    # Build a parent -> children map from /proc and walk down from chromedriver
+    children = {}
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entry}/stat', 'r') as f:
+                ppid = int(f.read().rsplit(')', 1)[1].split()[1])
+            children.setdefault(ppid, []).append(int(entry))
+        except (OSError, ValueError, IndexError):
+            continue
+    
+    total_kb = 0
+    stack = [pid]
+    while stack:
+        current = stack.pop()
+        stack.extend(children.get(current, []))
+        try:
+            with open(f'/proc/{current}/status', 'r') as f:
+                for line in f:
+                    if line.startswith('VmRSS:'):
+                        total_kb += int(line.split()[1])
+                        break
+        except (OSError, ValueError):
+            continue
+    return total_kb / 1024
+
+class ResidentDriver:
+    """Keeps one Chrome instance warm across checks in daemon mode
+    
+    The driver is health-checked before every use, recycled after
+    CONFIG['DRIVER_MAX_CHECKS'] checks or when its memory passes
+    CONFIG['DRIVER_MAX_MEMORY_MB'], and restarted if it has crashed.
+    """
+    
+    def __init__(self, max_checks=None, max_memory_mb=None):
+        self.max_checks = max_checks or CONFIG['DRIVER_MAX_CHECKS']
+        self.max_memory_mb = max_memory_mb or CONFIG['DRIVER_MAX_MEMORY_MB']
+        self.driver = None
+        self.checks = 0
+    
+    def is_healthy(self):
+        """Check the browser still answers commands"""
+        if self.driver is None:
+            return False
+        try:
+            self.driver.execute_script('return 1')
+            return True
+        except Exception as e:
+            logger.warning(f"Resident ChromeDriver failed health check: {e}")
+            return False
+    
+    def needs_recycle(self):
+        """Check whether the driver has served enough checks or grown too large"""
+        if self.checks >= self.max_checks:
+            logger.info(f"Recycling ChromeDriver after {self.checks} checks")
+            return True
+        memory_mb = get_driver_memory_mb(self.driver)
+        if memory_mb is not None and memory_mb > self.max_memory_mb:
+            logger.info(f"Recycling ChromeDriver at {memory_mb:.0f} MB")
+            return True
+        return False
+    
+    def acquire(self):
+        """Return a healthy driver, starting or restarting Chrome if needed"""
+        if self.driver is not None and (not self.is_healthy() or self.needs_recycle()):
+            self.quit()
+        
+        if self.driver is None:
+            with stage('driver_setup') as span:
+                self.driver = setup_driver()
+                if self.driver is None:
+                    span.outcome = 'failed'
+            self.checks = 0
+        return self.driver
+    
+    def release(self):
+        """Mark the end of a check, leaving the browser running"""
+        self.checks += 1
+        if self.driver is not None and not self.is_healthy():
+            # Crashed mid-check, start a fresh browser next time
+            self.quit()
+    
+    def quit(self):
+        """Shut the browser down"""
+        if self.driver is None:
+            return
+        quit_driver(self.driver)
+        self.driver = None
+        self.checks = 0
+
+def parse_api_data(data):
+    """Return the message list from a decoded API response, or None on an API error"""
+    if data.get('success'):
+        messages = data.get('messages', [])
+        logger.info(f"Successfully fetched {len(messages)} messages")
+        return messages
+    else:
+        logger.error(f"API error: {data.get('error', 'Unknown')}")
+        return None
+
+# Fetches a later page from inside the API page, reusing its WAF clearance
+PAGE_FETCH_SCRIPT = """
+const done = arguments[arguments.length - 1];
+fetch(arguments[0], {credentials: 'same-origin'})
+    .then(response => response.ok ? response.text() : null)
+    .then(done, () => done(null));
+"""
+
+def fetch_page_in_browser(driver, url):
+    """Fetch and decode a later page of a paginated API response"""
+    with stage('page_fetch') as span:
+        driver.set_script_timeout(CONFIG['READY_TIMEOUT_MAX'])
+        text = driver.execute_async_script(PAGE_FETCH_SCRIPT, url)
+        if text is None:
+            span.outcome = 'failed'
+            raise ValueError("Could not fetch a later page of the API response")
+        span.add_bytes(len(text))
+    with stage('json_decode'):
+        data = json.loads(text)
+    if not data.get('success'):
+        raise ValueError(f"API error on a later page: {data.get('error', 'Unknown')}")
+    return data
+
+def api_messages(driver, data, cursor, params):
+    """Return the messages of a decoded API response, following later pages after a cursor"""
+    messages = parse_api_data(data)
+    if messages is None:
+        return None
+    if cursor is None:
+        track(CONFIG['STATE_KEY'], messages)
+        return messages
+    messages = collect_new(CONFIG['STATE_KEY'], cursor, data,
+                           lambda token: fetch_page_in_browser(
+                               driver, f"{CONFIG['API_URL']}?{urlencode(page_params(params, token))}"))
+    logger.info(f"{len(messages)} message(s) after the cursor")
+    return messages
+
+def capture_api_response(driver, timeout):
+    """Wait for the API response on the DevTools Network domain and decode it
+    
+    Reads the raw response body of the first API_URL request that finishes
+    loading with valid JSON, skipping DOM serialization entirely. WAF
+    challenge pages are skipped while the challenge script redirects back
+    to the API. Returns the decoded JSON or None if it did not arrive in time.
+    """
+    deadline = time.monotonic() + timeout
+    api_requests = {}
+    
+    while time.monotonic() < deadline:
+        for entry in driver.get_log('performance'):
+            try:
+                event = json.loads(entry['message'])['message']
+            except (KeyError, ValueError):
+                continue
+            method = event.get('method')
+            params = event.get('params', {})
+            
+            if method == 'Network.responseReceived':
+                response = params.get('response', {})
+                if response.get('url', '').startswith(CONFIG['API_URL']):
+                    api_requests[params['requestId']] = response.get('status')
+            
+            elif method == 'Network.loadingFinished' and params.get('requestId') in api_requests:
+                request_id = params['requestId']
+                status = api_requests.pop(request_id)
+                try:
+                    result = driver.execute_cdp_cmd('Network.getResponseBody', {'requestId': request_id})
+                except Exception as e:
+                    logger.debug(f"Could not read response body for {request_id}: {e}")
+                    continue
+                
+                body = result.get('body', '')
+                raw = base64.b64decode(body) if result.get('base64Encoded') else body
+                logger.info(f"Captured API response via DevTools, status {status}, {len(raw)} bytes")
+                try:
+                    with stage('json_decode') as span:
+                        span.add_bytes(len(raw))
+                        return json.loads(raw)
+                except ValueError:
+                    # Most likely the WAF challenge page, wait for its redirect
+                    logger.debug(f"API response {request_id} was not JSON, waiting for another")
+        
+        time.sleep(0.1)
+    
+    return None
+
+def readiness_timeout():
+    """Seconds to wait for the API response, learned from earlier loads
+    
+    Smoothed load time plus four times its variation, kept between
+    READY_TIMEOUT_MIN and READY_TIMEOUT_MAX. Without history the maximum
+    is used.
+    """
+    try:
+        stats = get_store().get_load_time(CONFIG['STATE_KEY'], 'api_ready')
+    except Exception as e:
+        logger.warning(f"Could not read load times: {e}")
+        stats = None
+    if not stats:
+        return CONFIG['READY_TIMEOUT_MAX']
+    smoothed_ms, variation_ms, _ = stats
+    timeout = (smoothed_ms + 4 * variation_ms) / 1000
+    return min(max(timeout, CONFIG['READY_TIMEOUT_MIN']), CONFIG['READY_TIMEOUT_MAX'])
+
+def record_ready_time(elapsed):
+    """Feed one observed load time (seconds) into the learned timeout"""
+    try:
+        get_store().record_load_time(CONFIG['STATE_KEY'], 'api_ready', elapsed * 1000)
+    except Exception as e:
+        logger.warning(f"Could not record load time: {e}")
+
+# Cheap probe run on every poll; the page text is only read once parsing is done
+READY_SCRIPT = "return [document.readyState, location.href];"
+TEXT_SCRIPT = "return document.body ? document.body.innerText : '';"
+
+def wait_for_json(driver, timeout):
+    """Poll the loaded page until it holds complete JSON or is clearly an error page
+    
+    Returns (status, data): ('json', decoded) on success, otherwise
+    status is 'unauthorized', 'error' (browser or server error page),
+    'challenge' (WAF challenge never redirected) or 'timeout', with data None.
+    A WAF challenge is waited on, since its script redirects back to the API.
+    """
+    deadline = time.monotonic() + timeout
+    status = 'timeout'
+    
+    while time.monotonic() < deadline:
+        try:
+            ready_state, href = driver.execute_script(READY_SCRIPT)
+        except Exception as e:
+            # Scripts can fail while a redirect swaps the document
+            logger.debug(f"Readiness probe failed: {e}")
+            ready_state, href = 'loading', ''
+        
+        if href.startswith('chrome-error://'):
+            return 'error', None
+        
+        if ready_state != 'loading':
+            text = driver.execute_script(TEXT_SCRIPT) or ''
+            if find_json_start(text) != -1:
+                try:
+                    with stage('json_extract') as span:
+                        span.add_bytes(len(text))
+                        return 'json', extract_json(text)
+                except json.JSONDecodeError:
+                    pass  # Body not complete yet
+            else:
+                page_text = driver.page_source
+                if 'requires Javascript' in page_text or 'aes.js' in page_text:
+                    status = 'challenge'
+                elif 'Unauthorized' in page_text:
+                    return 'unauthorized', None
+                elif ready_state == 'complete':
+                    logger.debug(f"Page content: {page_text[:500]}")
+                    return 'error', None
+        
+        time.sleep(CONFIG['READY_POLL'])
+    
+    return status, None
+
+def get_current_messages(resident=None):
+    """Fetch messages using Selenium to bypass WAF
+    
+    When a ResidentDriver is given its browser is reused and left running,
+    otherwise a fresh driver is started and quit after the check. Returns
+    as soon as the API response is complete rather than after a fixed wait.
+    """
+    if resident:
+        driver = resident.acquire()
+    else:
+        with stage('driver_setup') as span:
+            driver = setup_driver()
+            if not driver:
+                span.outcome = 'failed'
     if not driver:
         return None
     
     try:
-        url = f"{CONFIG['API_URL']}?api_key={CONFIG['API_KEY']}"
+        # Only ask for messages after the newest one already processed
+        cursor = load_cursor(CONFIG['STATE_KEY'])
+        params = {'api_key': CONFIG['API_KEY'], **request_params(cursor)}
+        url = f"{CONFIG['API_URL']}?{urlencode(params)}"
         logger.info(f"Loading URL: {CONFIG['API_URL']}")
+        timeout = readiness_timeout()
         
-        driver.get(url)
+        if CONFIG['CAPTURE_MODE'] == 'devtools':
+            # Drop network events left over from earlier checks
+            driver.get_log('performance')
         
-        # Wait for page to load
-        time.sleep(5)
+        navigation_started = time.monotonic()
+        with stage('page_load', strategy=CONFIG['PAGE_LOAD_STRATEGY']):
+            driver.get(url)
         
-        # Get page source
-        page_text = driver.page_source
-        logger.info(f"Page loaded, content length: {len(page_text)}")
-        logger.debug(f"First 200 chars: {page_text[:200]}")
+        if CONFIG['CAPTURE_MODE'] == 'devtools':
+            with stage('devtools_capture') as span:
+                data = capture_api_response(driver, max(0, navigation_started + timeout - time.monotonic()))
+                if data is None:
+                    span.outcome = 'timeout'
+            if data is not None:
+                record_ready_time(time.monotonic() - navigation_started)
+                return api_messages(driver, data, cursor, params)
+            logger.warning(f"DevTools capture got no API response within {timeout:.1f}s, checking the page itself")
+            # The learned timeout was too short this time; the page gets the full budget
+            timeout = CONFIG['READY_TIMEOUT_MAX']
         
-        # Look for JSON in the page
-        if page_text.startswith('{"') or '{"success"' in page_text:
-            try:
-                # Extract JSON from page source
-                start_idx = page_text.find('{"')
-                if start_idx != -1:
-                    json_text = page_text[start_idx:]
-                    # Find end of JSON
-                    brace_count = 0
-                    end_idx = 0
-                    for i, char in enumerate(json_text):
-                        if char == '{':
-                            brace_count += 1
-                        elif char == '}':
-                            brace_count -= 1
-                            if brace_count == 0:
-                                end_idx = i + 1
-                                break
-                    
-                    if end_idx > 0:
-                        json_text = json_text[:end_idx]
-                        logger.debug(f"Extracted JSON: {json_text}")
-                        data = json.loads(json_text)
-                        
-                        if data.get('success'):
-                            messages = data.get('messages', [])
-                            logger.info(f"Successfully fetched {len(messages)} messages")
-                            return messages
-                        else:
-                            logger.error(f"API error: {data.get('error', 'Unknown')}")
-                            return None
-            except json.JSONDecodeError as e:
-                logger.error(f"JSON parsing failed: {e}")
-                return None
+        with stage('page_ready') as span:
+            status, data = wait_for_json(driver, max(0, navigation_started + timeout - time.monotonic()))
+            if status != 'json':
+                span.outcome = status
+        
+        if status == 'json':
+            record_ready_time(time.monotonic() - navigation_started)
+            return api_messages(driver, data, cursor, params)
         
-        # Check for common error conditions
-        if 'requires Javascript' in page_text:
+        if status == 'timeout':
+            # Back off like a retransmission timer so the next check waits longer
+            record_ready_time(2 * timeout)
+            logger.warning(f"API response not complete after {timeout:.1f}s")
+        elif status == 'challenge':
             logger.warning("Still blocked by JavaScript challenge")
-            return None
-        elif 'Unauthorized' in page_text:
+        elif status == 'unauthorized':
             logger.error("API key authentication failed")
-            return None
-        elif 'aes.js' in page_text:
-            logger.warning("Encountered WAF challenge page")
-            return None
         else:
-            logger.warning("Unexpected page content")
-            logger.debug(f"Page content: {page_text[:500]}")
-            return None
+            logger.warning("Got an error page instead of the API response")
+        return None
     
     except Exception as e:
         logger.error(f"Selenium error: {e}")
         return None
     finally:
-        try:
-            driver.quit()
-            logger.info("ChromeDriver closed")
-        except:
-            pass
+        if resident:
+            resident.release()
+        else:
+            quit_driver(driver)
 
 def get_last_message_count():
     """Get last known count"""
     try:
-        with open(CONFIG['LAST_COUNT_FILE'], 'r') as f:
-            count = int(f.read().strip())
-            logger.info(f"Last known message count: {count}")
-            return count
-    except FileNotFoundError:
-        logger.info("No previous count file found, starting with 0")
-        return 0
+        with stage('state_read', op='last_count'):
+            count = get_store().get_last_count(CONFIG['STATE_KEY'])
+        logger.info(f"Last known message count: {count}")
+        return count
     except Exception as e:
-        logger.warning(f"Error reading count file: {e}, defaulting to 0")
+        logger.warning(f"Error reading state store: {e}, defaulting to 0")
         return 0
 
 def save_message_count(count):
     """Save current count"""
     try:
-        with open(CONFIG['LAST_COUNT_FILE'], 'w') as f:
-            f.write(str(count))
+        with stage('state_write', op='count'):
+            get_store().save_count(CONFIG['STATE_KEY'], count)
         logger.info(f"Saved message count: {count}")
     except Exception as e:
         logger.error(f"Error saving count: {e}")
 
+def record_check(success, latency_ms, message_count=None, new_messages=(), notification_status=None):
+    """Record a check and the messages it notified about in the state store"""
+    try:
+        store = get_store()
+        with stage('state_write', op='record_check'):
+            store.record_check(CONFIG['STATE_KEY'], success, latency_ms, message_count,
+                               len(new_messages), notification_status)
+            if new_messages:
+                store.mark_seen(CONFIG['STATE_KEY'], new_messages, notified=success)
+    except Exception as e:
+        logger.error(f"Error recording check: {e}")
+
 def send_discord_notification(new_messages):
     """Send notification via Discord webhook"""
     if not CONFIG['DISCORD_WEBHOOK']:
@@ -288,56 +634,50 @@ def send_discord_notification(new_messages):
         return True
     
     try:
-        for msg in new_messages:
-            data = {
-                "content": "🔔 New contact form message!",
-                "embeds": [{
-                    "title": "New Contact Message",
-                    "color": 0x00ff00,
-                    "fields": [
-                        {"name": "Name", "value": msg.get('name', 'Unknown'), "inline": True},
-                        {"name": "Email", "value": msg.get('email', 'Unknown'), "inline": True},
-                        {"name": "Message", "value": msg.get('message', '')[:200] + ("..." if len(msg.get('message', '')) > 200 else ""), "inline": False},
-                        {"name": "Time", "value": msg.get('timestamp', 'Unknown'), "inline": True}
-                    ]
-                }]
-            }
-            response = requests.post(CONFIG['DISCORD_WEBHOOK'], json=data, timeout=10)
-            if response.status_code == 204:
-                logger.info("Discord notification sent successfully")
-            else:
-                logger.error(f"Discord notification failed with status: {response.status_code}")
-                return False
+        from discord_dispatcher import get_dispatcher
+        
+        # Batches up to 10 embeds per call and waits out rate limits
+        sent = get_dispatcher(CONFIG['DISCORD_WEBHOOK']).send_messages(new_messages)
+        if len(sent) == len(new_messages):
+            logger.info("Discord notification sent successfully")
+            return True
+        # Only the batches that failed are retried by the outbox
+        return sent
+    except Exception as e:
+        logger.error(f"Discord notification failed: {e}")
+        return False
+
+def send_discord_digest(new_messages):
+    """Send a burst of messages as one Discord post"""
+    if not CONFIG['DISCORD_WEBHOOK']:
+        logger.info("No Discord webhook configured, skipping Discord notification")
         return True
+    
+    try:
+        from discord_dispatcher import get_dispatcher
+        
+        if get_dispatcher(CONFIG['DISCORD_WEBHOOK']).send_digest(new_messages):
+            logger.info(f"Discord digest of {len(new_messages)} message(s) sent")
+            return True
+        return False
     except Exception as e:
         logger.error(f"Discord notification failed: {e}")
         return False
 
 def send_email_notification(new_messages):
-    """Send email notification"""
+    """Send email notification
+    
+    Returns True, or the messages whose email went out if sending failed
+    partway, so the outbox retries only the others.
+    """
+    sent = []
     try:
         import smtplib
         from email.mime.text import MIMEText
         from email.mime.multipart import MIMEMultipart
+        from smtp_pool import get_manager
         
-        logger.info("Connecting to email server...")
-        logger.info(f"Email user: {CONFIG['EMAIL_USER']}")
-        logger.info(f"SMTP server: {CONFIG['SMTP_SERVER']}:{CONFIG['SMTP_PORT']}")
-        
-        server = smtplib.SMTP(CONFIG['SMTP_SERVER'], CONFIG['SMTP_PORT'])
-        server.starttls()
-        
-        # Try to login
-        try:
-            server.login(CONFIG['EMAIL_USER'], CONFIG['EMAIL_PASS'])
-            logger.info("Gmail authentication successful")
-        except smtplib.SMTPAuthenticationError as auth_error:
-            logger.error(f"Gmail authentication failed: {auth_error}")
-            logger.error("Make sure you're using a Gmail App Password, not your regular password")
-            logger.error("App Password should be 16 characters like 'abcd efgh ijkl mnop'")
-            server.quit()
-            return False
-        
+        emails = []
         for msg in new_messages:
             email_msg = MIMEMultipart()
             email_msg['From'] = CONFIG['EMAIL_USER']
@@ -359,59 +699,167 @@ Automated notification from contact monitor
             """
             
             email_msg.attach(MIMEText(body, 'plain'))
-            server.send_message(email_msg)
-            logger.info(f"Email sent for message from {msg.get('name', 'Unknown')}")
+            emails.append(email_msg)
         
-        server.quit()
+        logger.info(f"Email user: {CONFIG['EMAIL_USER']}")
+        logger.info(f"SMTP server: {CONFIG['SMTP_SERVER']}:{CONFIG['SMTP_PORT']}")
+        
+        # Reuses an authenticated session when one is already open
+        server = get_manager(CONFIG['SMTP_SERVER'], CONFIG['SMTP_PORT'],
+                             CONFIG['EMAIL_USER'], CONFIG['EMAIL_PASS'])
+        try:
+            server.send_many(emails, on_sent=lambda i: sent.append(new_messages[i]))
+        except smtplib.SMTPAuthenticationError as auth_error:
+            logger.error(f"Gmail authentication failed: {auth_error}")
+            logger.error("Make sure you're using a Gmail App Password, not your regular password")
+            logger.error("App Password should be 16 characters like 'abcd efgh ijkl mnop'")
+            return sent
+        
+        logger.info(f"Sent {len(emails)} email(s)")
         return True
     except Exception as e:
         logger.error(f"Email notification failed: {e}")
+        return sent
+
+def send_email_digest(new_messages):
+    """Send one summary email for a burst of messages"""
+    try:
+        import smtplib
+        from email.mime.text import MIMEText
+        from email.mime.multipart import MIMEMultipart
+        from smtp_pool import get_manager
+        
+        email_msg = MIMEMultipart()
+        email_msg['From'] = CONFIG['EMAIL_USER']
+        email_msg['To'] = CONFIG['NOTIFY_EMAIL']
+        email_msg['Subject'] = f"WEBSITE: {digest_subject(new_messages)}"
+        email_msg.attach(MIMEText(digest_body(new_messages), 'plain'))
+        
+        server = get_manager(CONFIG['SMTP_SERVER'], CONFIG['SMTP_PORT'],
+                             CONFIG['EMAIL_USER'], CONFIG['EMAIL_PASS'])
+        try:
+            server.send_many([email_msg])
+        except smtplib.SMTPAuthenticationError as auth_error:
+            logger.error(f"Gmail authentication failed: {auth_error}")
+            return False
+        
+        logger.info(f"Sent a digest of {len(new_messages)} message(s)")
+        return True
+    except Exception as e:
+        logger.error(f"Email digest failed: {e}")
         return False
 
-def check_for_new_messages():
+def drain_outbox():
+    """Deliver queued notifications on both channels at once"""
+    return get_outbox().drain({
+        'email': send_email_notification,
+        'discord': send_discord_notification,
+    }, digest_senders={
+        # Bursts are summarized instead of sent one by one
+        'email': send_email_digest,
+        'discord': send_discord_digest,
+    })
+
+@instrument_check('selenium')
+def check_for_new_messages(resident=None):
     """Main check function"""
     logger.info(f"Starting message check at {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
     
-    current_messages = get_current_messages()
+    fetch_started = time.monotonic()
+    current_messages, backend = fetch_messages(CONFIG['STATE_KEY'], CONFIG['FETCH_BACKENDS'], resident)
+    latency_ms = (time.monotonic() - fetch_started) * 1000
     if current_messages is None:
         logger.error("Failed to fetch messages")
+        record_check(False, latency_ms, notification_status='fetch_failed')
         return False
     
-    current_count = len(current_messages)
+    if current_messages is NOT_MODIFIED:
+        logger.info("No new messages found (not modified)")
+        # Still retry notifications left in the outbox by earlier checks
+        results = drain_outbox()
+        record_check(True, latency_ms, notification_status=summarize(results) or 'not_modified')
+        return True
+    
     last_count = get_last_message_count()
+    # Diff by message fingerprint, so deleted or reordered messages do not hide new ones
+    new_messages, current_count = find_new(CONFIG['STATE_KEY'], current_messages, last_count)
     
-    logger.info(f"Current messages: {current_count}, Last known: {last_count}")
+    if current_count is not None:
+        logger.info(f"Current messages: {current_count}, Last known: {last_count}")
     
-    if current_count > last_count:
-        new_count = current_count - last_count
-        new_messages = current_messages[-new_count:]
-        
-        logger.info(f"Found {new_count} new message(s)!")
+    if new_messages:
+        logger.info(f"Found {len(new_messages)} new message(s)!")
         
-        # Send notifications - try both, don't fail if one fails
-        email_success = send_email_notification(new_messages)
-        discord_success = send_discord_notification(new_messages)
-        
-        # Success if at least one notification method worked
-        if email_success or discord_success:
-            if email_success and discord_success:
-                logger.info("Both email and Discord notifications sent successfully")
-            elif email_success:
-                logger.info("Email notification sent successfully (Discord skipped or failed)")
-            elif discord_success:
-                logger.info("Discord notification sent successfully (Email failed)")
-            
-            save_message_count(current_count)
-            return True
-        else:
-            logger.error("All notification methods failed")
-            return False
+        # Journal before delivering so a failed channel is retried later
+        # from the outbox instead of by fetching the messages again
+        get_outbox().enqueue(CONFIG['STATE_KEY'], NOTIFY_CHANNELS, new_messages)
     else:
         logger.info("No new messages found")
+    # Kept locally so old messages can be looked up without fetching them again
+    archive_messages(CONFIG['STATE_KEY'], new_messages, current_messages)
+    if current_count is not None:
+        # A cursor fetch does not see deletions, so it leaves the count alone
         save_message_count(current_count)
-        return True
+    save_index(CONFIG['STATE_KEY'])
+    mark_processed(backend)
+    save_cursor(CONFIG['STATE_KEY'])
+    
+    # Send new and previously failed notifications on both channels at once
+    results = drain_outbox()
+    
+    # Success if at least one notification method worked
+    # Retries of notifications that were already failing do not fail a
+    # check that found nothing new
+    if new_messages and results and not any(result.success for result in results):
+        logger.error("All notification methods failed, notifications stay queued in the outbox")
+        record_check(False, latency_ms, current_count, new_messages, summarize(results))
+        return False
+    
+    if any(result.success for result in results):
+        logger.info(f"Notifications sent: {summarize(results)}")
+    elif results:
+        logger.warning(f"Earlier notifications are still failing, they stay queued: {summarize(results)}")
+    record_check(True, latency_ms, current_count, new_messages, summarize(results) or None)
+    return True
+
+def run_daemon():
+    """Check continuously, keeping one browser warm between checks"""
+    logger.info("Contact Monitor (Selenium) daemon mode starting...")
+    resident = ResidentDriver()
+    
+    try:
+        while True:
+            try:
+                success = check_for_new_messages(resident)
+                if CONFIG['ADAPTIVE_INTERVAL']:
+                    delay = next_interval(CONFIG['STATE_KEY'])
+                else:
+                    delay = CONFIG['CHECK_INTERVAL'] if success else CONFIG['RETRY_INTERVAL']
+            except Exception as e:
+                # One bad check (e.g. a full disk under the outbox) must not end the daemon
+                logger.error(f"Check failed with an unexpected error: {e}", exc_info=True)
+                success, delay = False, CONFIG['RETRY_INTERVAL']
+            if success:
+                logger.info(f"Next check in {delay / 60:.1f} minutes...")
+            else:
+                logger.warning(f"Check failed, retrying in {delay / 60:.1f} minutes...")
+            time.sleep(delay)
+    except KeyboardInterrupt:
+        logger.info("Monitor stopped by user")
+    finally:
+        resident.quit()
 
 if __name__ == "__main__":
+    if '--daemon' in sys.argv[1:]:
+        run_daemon()
+        sys.exit(0)
+    
+    # For frequent cron schedules: skip (before starting Chrome) until the
+    # adaptive interval since the last check has passed
+    if '--if-due' in sys.argv[1:] and not is_due(CONFIG['STATE_KEY']):
+        logger.info("Not due yet according to the adaptive interval, skipping this run")
+        sys.exit(0)
+    
     logger.info("Contact Monitor (Selenium) starting...")
     
     try:
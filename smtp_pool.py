@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+"""
+Persistent, pooled SMTP connections for email notifications
+
+Keeps authenticated sessions open between sends so a daemon pays the
+STARTTLS handshake and AUTH round trips once, not once per notification.
+"""
+
+import atexit
+import logging
+import smtplib
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from metrics import stage
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+CONFIG = {
+    'POOL_SIZE': 1,          # parallel connections used for large bursts
+    'BURST_THRESHOLD': 20,   # messages before a burst is spread over the pool
+    'NOOP_AFTER': 10,        # idle seconds before a session is checked with NOOP
+    'TIMEOUT': 30,
+    'ACQUIRE_TIMEOUT': 60,   # seconds to wait for a free session when the pool is busy
+}
+
+class SMTPConnectionManager:
+    """Hands out live, authenticated SMTP sessions from a small pool
+
+    Idle sessions are checked with NOOP before reuse and reopened
+    transparently if the server has dropped them. Works against any SMTP
+    server, including a plain local stand-in with use_tls=False and no
+    credentials.
+    """
+
+    def __init__(self, host, port, username=None, password=None, use_tls=True,
+                 pool_size=None, timeout=None):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.use_tls = use_tls
+        self.pool_size = max(1, pool_size or CONFIG['POOL_SIZE'])
+        self.timeout = timeout or CONFIG['TIMEOUT']
+        self._idle = []  # (server, last_used), most recently used last
+        # Guards _idle and _opened; notified whenever a session or a slot frees up
+        self._available = threading.Condition()
+        self._opened = 0
+
+    def _open(self):
+        """Open and authenticate a new session"""
+        logger.info(f"Connecting to SMTP server {self.host}:{self.port}")
+        with stage('smtp_connect'):
+            server = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+            try:
+                server.ehlo()
+                if self.use_tls:
+                    server.starttls()
+                    server.ehlo()
+                if self.username:
+                    server.login(self.username, self.password)
+            except Exception:
+                server.close()
+                raise
+        return server
+
+    def _is_alive(self, server):
+        try:
+            return server.noop()[0] == 250
+        except smtplib.SMTPException:
+            return False
+        except OSError:
+            return False
+
+    def _acquire(self):
+        """Return (server, last_used) from the pool, opening one if allowed
+
+        Waits up to CONFIG['ACQUIRE_TIMEOUT'] for a session or a free slot
+        and raises TimeoutError if none comes.
+        """
+        with self._available:
+            if not self._available.wait_for(lambda: self._idle or self._opened < self.pool_size,
+                                            CONFIG['ACQUIRE_TIMEOUT']):
+                raise TimeoutError(f"No SMTP session free after {CONFIG['ACQUIRE_TIMEOUT']}s")
+            if self._idle:
+                return self._idle.pop()
+            self._opened += 1
+        try:
+            return self._open(), time.monotonic()
+        except Exception:
+            self._free_slot()
+            raise
+
+    def _release(self, server):
+        with self._available:
+            self._idle.append((server, time.monotonic()))
+            self._available.notify()
+
+    def _free_slot(self):
+        with self._available:
+            self._opened -= 1
+            self._available.notify()
+
+    def _discard(self, server):
+        try:
+            server.close()
+        except Exception:
+            pass
+        self._free_slot()
+
+    def send(self, message):
+        """Send one email.message.Message, reconnecting once if the session died"""
+        server, last_used = self._acquire()
+        if time.monotonic() - last_used > CONFIG['NOOP_AFTER'] and not self._is_alive(server):
+            logger.info("SMTP session went stale, reconnecting")
+            self._discard(server)
+            server, last_used = self._acquire()
+
+        try:
+            server.send_message(message)
+        except (smtplib.SMTPServerDisconnected, OSError) as e:
+            logger.warning(f"SMTP session dropped ({e}), reconnecting")
+            self._discard(server)
+            server, _ = self._acquire()
+            try:
+                server.send_message(message)
+            except Exception:
+                self._discard(server)
+                raise
+        except Exception:
+            # Message-level refusal, the session itself is still usable
+            self._release(server)
+            raise
+        self._release(server)
+
+    def send_many(self, messages, on_sent=None):
+        """Send messages over the pooled sessions, returning how many were sent
+
+        Small batches go out one after another on one session; bursts
+        larger than CONFIG['BURST_THRESHOLD'] are spread over the pool.
+        on_sent(i) is called for every message that went out, so a caller
+        can tell which ones did when this raises partway through.
+        """
+        messages = list(messages)
+        if self.pool_size == 1 or len(messages) <= CONFIG['BURST_THRESHOLD']:
+            for i, message in enumerate(messages):
+                self.send(message)
+                if on_sent:
+                    on_sent(i)
+            return len(messages)
+
+        with ThreadPoolExecutor(max_workers=self.pool_size, thread_name_prefix='smtp') as executor:
+            futures = [executor.submit(self.send, message) for message in messages]
+        errors = [f.exception() for f in futures if f.exception() is not None]
+        if on_sent:
+            for i, future in enumerate(futures):
+                if future.exception() is None:
+                    on_sent(i)
+        if errors:
+            logger.error(f"{len(errors)} of {len(messages)} emails failed")
+            raise errors[0]
+        return len(messages)
+
+    def close(self):
+        """Quit every idle session"""
+        with self._available:
+            idle, self._idle = self._idle, []
+            self._opened -= len(idle)
+            self._available.notify_all()
+        for server, _ in idle:
+            try:
+                server.quit()
+            except Exception:
+                server.close()
+
+_managers = {}
+_managers_lock = threading.Lock()
+
+def get_manager(host, port, username=None, password=None, use_tls=True):
+    """Return the shared manager for a server and account, creating it on first use"""
+    key = (host, port, username, use_tls)
+    with _managers_lock:
+        manager = _managers.get(key)
+        if manager is None:
+            manager = SMTPConnectionManager(host, port, username, password, use_tls)
+            _managers[key] = manager
+            atexit.register(manager.close)
+        return manager
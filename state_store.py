@@ -0,0 +1,436 @@
+#!/usr/bin/env python3
+"""
+Shared monitor state backed by SQLite (WAL mode)
+
+Replaces the single integer in last_message_count.txt with per-endpoint
+state: the last known message count, the fingerprints of every message
+seen, and a history of checks with their latency and notification status.
+"""
+
+import atexit
+import logging
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from hashlib import blake2b
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+CONFIG = {
+    'DB_FILE': os.getenv('MONITOR_STATE_DB', 'monitor_state.db'),
+    # Imported once per endpoint when it has no state yet
+    'LEGACY_COUNT_FILE': 'last_message_count.txt',
+    'BUSY_TIMEOUT': 30,  # seconds to wait on a locked database
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS endpoints (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE,
+    last_count INTEGER NOT NULL DEFAULT 0,
+    last_check_at REAL,
+    last_latency_ms REAL,
+    last_success INTEGER,
+    notification_status TEXT,
+    seeded_at REAL
+);
+
+CREATE TABLE IF NOT EXISTS seen_messages (
+    endpoint_id INTEGER NOT NULL REFERENCES endpoints(id),
+    fingerprint BLOB NOT NULL,
+    first_seen_at REAL NOT NULL,
+    notified INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (endpoint_id, fingerprint)
+) WITHOUT ROWID;
+
+CREATE INDEX IF NOT EXISTS idx_seen_messages_first_seen
+    ON seen_messages (endpoint_id, first_seen_at);
+
+CREATE TABLE IF NOT EXISTS checks (
+    id INTEGER PRIMARY KEY,
+    endpoint_id INTEGER NOT NULL REFERENCES endpoints(id),
+    checked_at REAL NOT NULL,
+    latency_ms REAL,
+    message_count INTEGER,
+    new_count INTEGER,
+    success INTEGER NOT NULL,
+    notification_status TEXT
+);
+
+CREATE INDEX IF NOT EXISTS idx_checks_endpoint_time
+    ON checks (endpoint_id, checked_at);
+
+CREATE TABLE IF NOT EXISTS backend_stats (
+    endpoint_id INTEGER NOT NULL REFERENCES endpoints(id),
+    backend TEXT NOT NULL,
+    success_rate REAL NOT NULL,
+    latency_ms REAL,
+    consecutive_failures INTEGER NOT NULL DEFAULT 0,
+    last_attempt_at REAL NOT NULL,
+    PRIMARY KEY (endpoint_id, backend)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS http_validators (
+    endpoint_id INTEGER PRIMARY KEY REFERENCES endpoints(id),
+    etag TEXT,
+    last_modified TEXT,
+    updated_at REAL NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS load_times (
+    endpoint_id INTEGER NOT NULL REFERENCES endpoints(id),
+    stage TEXT NOT NULL,
+    smoothed_ms REAL NOT NULL,
+    variation_ms REAL NOT NULL,
+    samples INTEGER NOT NULL,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (endpoint_id, stage)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS message_index (
+    endpoint_id INTEGER NOT NULL REFERENCES endpoints(id),
+    chunk INTEGER NOT NULL,
+    digests BLOB NOT NULL,
+    PRIMARY KEY (endpoint_id, chunk)
+);
+
+CREATE TABLE IF NOT EXISTS cursors (
+    endpoint_id INTEGER PRIMARY KEY REFERENCES endpoints(id),
+    last_id INTEGER,
+    last_timestamp TEXT,
+    updated_at REAL NOT NULL
+);
+"""
+
+def content_digest(msg):
+    """8-byte hash of a message's name, email, timestamp and body"""
+    # Spelled out rather than joined over the field names: this runs once
+    # per message of every full fetch
+    content = (f"{msg.get('name', '')}\x1f{msg.get('email', '')}\x1f"
+               f"{msg.get('timestamp', '')}\x1f{msg.get('message', '')}")
+    return blake2b(content.encode('utf-8'), digest_size=8).digest()
+
+def key_digest(msg, content=None):
+    """8-byte key of a message: a hash of its id, or its content digest when it has none
+
+    This is the one fingerprint of a message, used by the seen messages,
+    the message index, the archive and the outbox.
+    """
+    if msg.get('id') is not None:
+        return blake2b(f"id:{msg['id']}".encode('utf-8'), digest_size=8).digest()
+    return content if content is not None else content_digest(msg)
+
+class StateStore:
+    """Per-endpoint monitor state in one SQLite database
+
+    Each thread gets its own connection, and every write runs in a
+    transaction so concurrent monitors never see half-written state.
+    """
+
+    def __init__(self, path=None):
+        self.path = path or CONFIG['DB_FILE']
+        self._local = threading.local()
+        self._endpoint_ids = {}
+        # executescript manages its own commit, so it runs outside transaction()
+        self._connect().executescript(SCHEMA)
+        self._migrate()
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=CONFIG['BUSY_TIMEOUT'], isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute('PRAGMA foreign_keys=ON')
+            self._local.conn = conn
+        return conn
+
+    @contextmanager
+    def transaction(self):
+        """Run a block of statements atomically
+
+        Nested calls join the outermost transaction, so several store
+        updates can be grouped into one commit.
+        """
+        conn = self._connect()
+        if conn.in_transaction:
+            yield conn
+            return
+
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            yield conn
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        else:
+            conn.execute('COMMIT')
+
+    def _migrate(self):
+        """Bring a database created by an earlier version up to SCHEMA"""
+        with self.transaction() as conn:
+            columns = {row[1] for row in conn.execute('PRAGMA table_info(endpoints)')}
+            if 'seeded_at' not in columns:
+                conn.execute('ALTER TABLE endpoints ADD COLUMN seeded_at REAL')
+                # Endpoints that already stored messages were seeded by then
+                conn.execute('UPDATE endpoints SET seeded_at = ? WHERE id IN'
+                             ' (SELECT DISTINCT endpoint_id FROM seen_messages)', (time.time(),))
+
+    def close(self):
+        """Close this thread's connection, folding the WAL back into the database"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+            conn.close()
+            self._local.conn = None
+
+    def endpoint_id(self, endpoint):
+        """Return the row id of an endpoint, creating it on first use"""
+        if endpoint in self._endpoint_ids:
+            return self._endpoint_ids[endpoint]
+
+        with self.transaction() as conn:
+            row = conn.execute('SELECT id FROM endpoints WHERE name = ?', (endpoint,)).fetchone()
+            if row is None:
+                cursor = conn.execute(
+                    'INSERT INTO endpoints (name, last_count) VALUES (?, ?)',
+                    (endpoint, read_legacy_count()))
+                row = (cursor.lastrowid,)
+        self._endpoint_ids[endpoint] = row[0]
+        return row[0]
+
+    def get_last_count(self, endpoint):
+        """Return the last known message count for an endpoint"""
+        endpoint_id = self.endpoint_id(endpoint)
+        row = self._connect().execute(
+            'SELECT last_count FROM endpoints WHERE id = ?', (endpoint_id,)).fetchone()
+        return row[0] if row else 0
+
+    def save_count(self, endpoint, count):
+        """Store the current message count for an endpoint"""
+        endpoint_id = self.endpoint_id(endpoint)
+        with self.transaction() as conn:
+            conn.execute('UPDATE endpoints SET last_count = ? WHERE id = ?', (count, endpoint_id))
+
+    def record_check(self, endpoint, success, latency_ms=None, message_count=None,
+                     new_count=None, notification_status=None):
+        """Append a check to the history and update the endpoint's latest state"""
+        endpoint_id = self.endpoint_id(endpoint)
+        now = time.time()
+        with self.transaction() as conn:
+            conn.execute(
+                'INSERT INTO checks (endpoint_id, checked_at, latency_ms, message_count,'
+                ' new_count, success, notification_status) VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (endpoint_id, now, latency_ms, message_count, new_count, int(success), notification_status))
+            conn.execute(
+                'UPDATE endpoints SET last_check_at = ?, last_latency_ms = ?, last_success = ?,'
+                ' notification_status = COALESCE(?, notification_status) WHERE id = ?',
+                (now, latency_ms, int(success), notification_status, endpoint_id))
+
+    def unseen(self, endpoint, messages):
+        """Return the messages whose fingerprints have not been stored yet"""
+        endpoint_id = self.endpoint_id(endpoint)
+        conn = self._connect()
+        unseen = []
+        for msg in messages:
+            row = conn.execute(
+                'SELECT 1 FROM seen_messages WHERE endpoint_id = ? AND fingerprint = ?',
+                (endpoint_id, key_digest(msg))).fetchone()
+            if row is None:
+                unseen.append(msg)
+        return unseen
+
+    def is_seen(self, endpoint, msg):
+        """Check whether a message's fingerprint has been stored"""
+        endpoint_id = self.endpoint_id(endpoint)
+        row = self._connect().execute(
+            'SELECT 1 FROM seen_messages WHERE endpoint_id = ? AND fingerprint = ?',
+            (endpoint_id, key_digest(msg))).fetchone()
+        return row is not None
+
+    def is_seeded(self, endpoint):
+        """Check whether an endpoint's existing messages have been recorded as seen"""
+        endpoint_id = self.endpoint_id(endpoint)
+        row = self._connect().execute(
+            'SELECT seeded_at FROM endpoints WHERE id = ?', (endpoint_id,)).fetchone()
+        return row is not None and row[0] is not None
+
+    def mark_seeded(self, endpoint):
+        """Record that an endpoint's existing messages are stored, even if there were none"""
+        endpoint_id = self.endpoint_id(endpoint)
+        with self.transaction() as conn:
+            conn.execute('UPDATE endpoints SET seeded_at = ? WHERE id = ?', (time.time(), endpoint_id))
+
+    def mark_seen(self, endpoint, messages, notified=True):
+        """Store the fingerprints of messages for an endpoint"""
+        endpoint_id = self.endpoint_id(endpoint)
+        now = time.time()
+        with self.transaction() as conn:
+            conn.executemany(
+                'INSERT INTO seen_messages (endpoint_id, fingerprint, first_seen_at, notified)'
+                ' VALUES (?, ?, ?, ?) ON CONFLICT (endpoint_id, fingerprint)'
+                ' DO UPDATE SET notified = MAX(notified, excluded.notified)',
+                [(endpoint_id, key_digest(msg), now, int(notified)) for msg in messages])
+
+    def get_validators(self, endpoint):
+        """Return the cached (etag, last_modified) for an endpoint's last full response"""
+        endpoint_id = self.endpoint_id(endpoint)
+        row = self._connect().execute(
+            'SELECT etag, last_modified FROM http_validators WHERE endpoint_id = ?',
+            (endpoint_id,)).fetchone()
+        return row if row else (None, None)
+
+    def save_validators(self, endpoint, etag, last_modified):
+        """Cache the ETag / Last-Modified validators of an endpoint's response"""
+        endpoint_id = self.endpoint_id(endpoint)
+        with self.transaction() as conn:
+            conn.execute(
+                'INSERT INTO http_validators (endpoint_id, etag, last_modified, updated_at)'
+                ' VALUES (?, ?, ?, ?) ON CONFLICT (endpoint_id) DO UPDATE SET'
+                ' etag = excluded.etag, last_modified = excluded.last_modified,'
+                ' updated_at = excluded.updated_at',
+                (endpoint_id, etag, last_modified, time.time()))
+
+    def get_message_index(self, endpoint):
+        """Return the chunks of an endpoint's packed message index, oldest first"""
+        endpoint_id = self.endpoint_id(endpoint)
+        rows = self._connect().execute(
+            'SELECT digests FROM message_index WHERE endpoint_id = ? ORDER BY chunk',
+            (endpoint_id,)).fetchall()
+        return [row[0] for row in rows]
+
+    def has_message_index(self, endpoint):
+        """Check whether an endpoint has a message index yet"""
+        endpoint_id = self.endpoint_id(endpoint)
+        row = self._connect().execute(
+            'SELECT 1 FROM message_index WHERE endpoint_id = ? LIMIT 1', (endpoint_id,)).fetchone()
+        return row is not None
+
+    def replace_message_index(self, endpoint, digests):
+        """Replace an endpoint's message index with a single chunk"""
+        endpoint_id = self.endpoint_id(endpoint)
+        with self.transaction() as conn:
+            conn.execute('DELETE FROM message_index WHERE endpoint_id = ?', (endpoint_id,))
+            conn.execute('INSERT INTO message_index (endpoint_id, chunk, digests) VALUES (?, 0, ?)',
+                         (endpoint_id, digests))
+
+    def append_message_index(self, endpoint, digests):
+        """Add a chunk to an endpoint's message index, returning the number of chunks"""
+        endpoint_id = self.endpoint_id(endpoint)
+        with self.transaction() as conn:
+            chunks = conn.execute('SELECT COUNT(*) FROM message_index WHERE endpoint_id = ?',
+                                  (endpoint_id,)).fetchone()[0]
+            conn.execute('INSERT INTO message_index (endpoint_id, chunk, digests) VALUES (?, ?, ?)',
+                         (endpoint_id, chunks, digests))
+        return chunks + 1
+
+    def get_cursor(self, endpoint):
+        """Return the (last_id, last_timestamp) of the newest message processed, or None"""
+        endpoint_id = self.endpoint_id(endpoint)
+        row = self._connect().execute(
+            'SELECT last_id, last_timestamp FROM cursors WHERE endpoint_id = ?',
+            (endpoint_id,)).fetchone()
+        return row if row else None
+
+    def save_cursor(self, endpoint, last_id, last_timestamp):
+        """Store the id and timestamp of the newest message processed for an endpoint"""
+        endpoint_id = self.endpoint_id(endpoint)
+        with self.transaction() as conn:
+            conn.execute(
+                'INSERT INTO cursors (endpoint_id, last_id, last_timestamp, updated_at)'
+                ' VALUES (?, ?, ?, ?) ON CONFLICT (endpoint_id) DO UPDATE SET'
+                ' last_id = excluded.last_id, last_timestamp = excluded.last_timestamp,'
+                ' updated_at = excluded.updated_at',
+                (endpoint_id, last_id, last_timestamp, time.time()))
+
+    def get_backend_stats(self, endpoint):
+        """Return {backend: (success_rate, latency_ms, consecutive_failures, last_attempt_at)}"""
+        endpoint_id = self.endpoint_id(endpoint)
+        rows = self._connect().execute(
+            'SELECT backend, success_rate, latency_ms, consecutive_failures, last_attempt_at'
+            ' FROM backend_stats WHERE endpoint_id = ?', (endpoint_id,)).fetchall()
+        return {row[0]: row[1:] for row in rows}
+
+    def record_backend_result(self, endpoint, backend, success, latency_ms, alpha=0.3):
+        """Fold one fetch attempt into a backend's rolling success rate and latency"""
+        endpoint_id = self.endpoint_id(endpoint)
+        with self.transaction() as conn:
+            row = conn.execute(
+                'SELECT success_rate, latency_ms, consecutive_failures FROM backend_stats'
+                ' WHERE endpoint_id = ? AND backend = ?', (endpoint_id, backend)).fetchone()
+            if row is None:
+                rate, latency, failures = float(success), (latency_ms if success else None), 0
+            else:
+                rate = (1 - alpha) * row[0] + alpha * float(success)
+                latency, failures = row[1], row[2]
+                if success:
+                    # Latency only tracks successful fetches, failures are often timeouts
+                    latency = latency_ms if latency is None else (1 - alpha) * latency + alpha * latency_ms
+            failures = 0 if success else failures + 1
+            conn.execute(
+                'INSERT OR REPLACE INTO backend_stats (endpoint_id, backend, success_rate, latency_ms,'
+                ' consecutive_failures, last_attempt_at) VALUES (?, ?, ?, ?, ?, ?)',
+                (endpoint_id, backend, rate, latency, failures, time.time()))
+
+    def get_load_time(self, endpoint, stage):
+        """Return (smoothed_ms, variation_ms, samples) observed for a page stage, or None"""
+        endpoint_id = self.endpoint_id(endpoint)
+        return self._connect().execute(
+            'SELECT smoothed_ms, variation_ms, samples FROM load_times'
+            ' WHERE endpoint_id = ? AND stage = ?', (endpoint_id, stage)).fetchone()
+
+    def record_load_time(self, endpoint, stage, elapsed_ms, alpha=0.125, beta=0.25):
+        """Fold one observed duration into a stage's smoothed time and variation
+
+        Same estimator as TCP's retransmission timer (RFC 6298), so
+        smoothed + 4 * variation makes a timeout that follows the server.
+        """
+        endpoint_id = self.endpoint_id(endpoint)
+        with self.transaction() as conn:
+            row = conn.execute(
+                'SELECT smoothed_ms, variation_ms, samples FROM load_times'
+                ' WHERE endpoint_id = ? AND stage = ?', (endpoint_id, stage)).fetchone()
+            if row is None:
+                smoothed, variation, samples = elapsed_ms, elapsed_ms / 2, 1
+            else:
+                variation = (1 - beta) * row[1] + beta * abs(row[0] - elapsed_ms)
+                smoothed = (1 - alpha) * row[0] + alpha * elapsed_ms
+                samples = row[2] + 1
+            conn.execute(
+                'INSERT OR REPLACE INTO load_times (endpoint_id, stage, smoothed_ms, variation_ms,'
+                ' samples, updated_at) VALUES (?, ?, ?, ?, ?, ?)',
+                (endpoint_id, stage, smoothed, variation, samples, time.time()))
+
+    def recent_checks(self, endpoint, since):
+        """Return (checked_at, success, new_count, latency_ms) rows since a unix time"""
+        endpoint_id = self.endpoint_id(endpoint)
+        return self._connect().execute(
+            'SELECT checked_at, success, new_count, latency_ms FROM checks'
+            ' WHERE endpoint_id = ? AND checked_at >= ? ORDER BY checked_at',
+            (endpoint_id, since)).fetchall()
+
+def read_legacy_count():
+    """Read the count left by the old last_message_count.txt, or 0"""
+    try:
+        with open(CONFIG['LEGACY_COUNT_FILE'], 'r') as f:
+            count = int(f.read().strip())
+        logger.info(f"Imported message count {count} from {CONFIG['LEGACY_COUNT_FILE']}")
+        return count
+    except (OSError, ValueError):
+        return 0
+
+_default_store = None
+_default_lock = threading.Lock()
+
+def get_store():
+    """Return the process-wide StateStore at CONFIG['DB_FILE']"""
+    global _default_store
+    with _default_lock:
+        if _default_store is None:
+            _default_store = StateStore()
+            # Leave a single self-contained database file behind on exit
+            atexit.register(_default_store.close)
+        return _default_store